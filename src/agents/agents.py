@@ -1,6 +1,7 @@
-from dataclasses import dataclass
+from collections.abc import Callable
+from dataclasses import dataclass, field
 from langgraph.graph.state import CompiledStateGraph
-from agents.supervisor import supervisor
+from agents.supervisor import build_supervisor
 from schema import AgentInfo
 
 DEFAULT_AGENT = "supervisor"
@@ -10,19 +11,27 @@ DEFAULT_AGENT = "supervisor"
 class Agent:
     """holds info about an agent like description and its workflow graph."""
     description: str
-    graph: CompiledStateGraph
+    build: Callable[[], CompiledStateGraph]  # compiles the workflow graph
+    _graph: CompiledStateGraph | None = field(default=None, init=False, repr=False)
+
+    @property
+    def graph(self) -> CompiledStateGraph:
+        """the compiled graph, built on first access so importing agents stays cheap."""
+        if self._graph is None:
+            self._graph = self.build()
+        return self._graph
 
 
 # registry of available agents (default is supervisor)
 agents: dict[str, Agent] = {
     "supervisor": Agent(
-        description="A support assistant with web search.", graph=supervisor
+        description="A support assistant with web search.", build=build_supervisor
     ),
 }
 
 
 def get_agent(agent_id: str) -> CompiledStateGraph:
-    """gets an agent's workflow graph by its id."""
+    """gets an agent's workflow graph by its id, compiling it on first use."""
     return agents[agent_id].graph
 
 
@@ -30,4 +39,4 @@ def get_all_agent_info() -> list[AgentInfo]:
     """collects all agent info for UI display in the required format."""
     return [
         AgentInfo(key=agent_id, description=agent.description) for agent_id, agent in agents.items()
-    ]
\ No newline at end of file
+    ]
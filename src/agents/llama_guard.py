@@ -1,6 +1,10 @@
+import hashlib
+import threading
+from collections import OrderedDict
 from enum import Enum
 from langchain_core.messages import AIMessage, AnyMessage, HumanMessage
 from langchain_core.prompts import PromptTemplate
+from langgraph.constants import TAG_NOSTREAM
 from pydantic import BaseModel, Field
 from core import get_model, settings
 from schema.models import GroqModelName
@@ -78,6 +82,37 @@ def parse_llama_guard_output(output: str) -> LlamaGuardOutput:
         return LlamaGuardOutput(safety_assessment=SafetyAssessment.ERROR)
 
 
+# verdicts are keyed by the compiled prompt, so a forked or regenerated thread
+# re-checking an identical conversation prefix skips the model call
+VERDICT_CACHE_SIZE = 4096
+_verdict_cache: OrderedDict[str, LlamaGuardOutput] = OrderedDict()
+_verdict_cache_lock = threading.Lock()
+
+
+def _verdict_key(compiled_prompt: str) -> str:
+    return hashlib.sha256(compiled_prompt.encode()).hexdigest()
+
+
+def _get_cached_verdict(key: str) -> LlamaGuardOutput | None:
+    with _verdict_cache_lock:
+        output = _verdict_cache.get(key)
+        if output is not None:
+            _verdict_cache.move_to_end(key)
+        return output
+
+
+def _cache_verdict(key: str, output: LlamaGuardOutput) -> LlamaGuardOutput:
+    # errors are transient, only definitive verdicts are worth reusing
+    if output.safety_assessment == SafetyAssessment.ERROR:
+        return output
+    with _verdict_cache_lock:
+        _verdict_cache[key] = output
+        _verdict_cache.move_to_end(key)
+        while len(_verdict_cache) > VERDICT_CACHE_SIZE:
+            _verdict_cache.popitem(last=False)
+    return output
+
+
 class LlamaGuard:
     """handles content safety checks using llama guard model."""
     
@@ -87,7 +122,10 @@ class LlamaGuard:
             print("GROQ_API_KEY not set, skipping LlamaGuard")
             self.model = None
             return
-        self.model = get_model(GroqModelName.LLAMA_GUARD_3_8B).with_config(tags=["llama_guard"])
+        # nostream keeps the guard's tokens out of the graph's "messages" stream mode
+        self.model = get_model(GroqModelName.LLAMA_GUARD_3_8B).with_config(
+            tags=["llama_guard", TAG_NOSTREAM]
+        )
         self.prompt = PromptTemplate.from_template(llama_guard_instructions)
 
     def _compile_prompt(self, role: str, messages: list[AnyMessage]) -> str:
@@ -104,16 +142,22 @@ class LlamaGuard:
         if self.model is None:
             return LlamaGuardOutput(safety_assessment=SafetyAssessment.SAFE)
         compiled_prompt = self._compile_prompt(role, messages)
+        key = _verdict_key(compiled_prompt)
+        if cached := _get_cached_verdict(key):
+            return cached
         result = self.model.invoke([HumanMessage(content=compiled_prompt)])
-        return parse_llama_guard_output(result.content)
+        return _cache_verdict(key, parse_llama_guard_output(result.content))
 
     async def ainvoke(self, role: str, messages: list[AnyMessage]) -> LlamaGuardOutput:
         """runs safety check on messages asynchronously."""
         if self.model is None:
             return LlamaGuardOutput(safety_assessment=SafetyAssessment.SAFE)
         compiled_prompt = self._compile_prompt(role, messages)
+        key = _verdict_key(compiled_prompt)
+        if cached := _get_cached_verdict(key):
+            return cached
         result = await self.model.ainvoke([HumanMessage(content=compiled_prompt)])
-        return parse_llama_guard_output(result.content)
+        return _cache_verdict(key, parse_llama_guard_output(result.content))
 
 
 if __name__ == "__main__":
@@ -1,14 +1,16 @@
 from datetime import datetime
+from functools import cache
 from typing import Literal
-from langchain_community.tools import DuckDuckGoSearchResults
 from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.messages import AIMessage, SystemMessage, HumanMessage
 from langchain_core.runnables import RunnableConfig, RunnableLambda, RunnableSerializable
-from langgraph.checkpoint.memory import MemorySaver
+from langchain_core.tools import BaseTool
 from langgraph.graph import END, MessagesState, StateGraph
+from langgraph.graph.state import CompiledStateGraph
 from langgraph.prebuilt import ToolNode
 from agents.llama_guard import LlamaGuard, LlamaGuardOutput, SafetyAssessment
 from core import get_model, settings
+from core.checkpoint import BoundedMemorySaver
 
 
 class AgentState(MessagesState, total=False):
@@ -18,14 +20,17 @@ class AgentState(MessagesState, total=False):
     needs_search: bool = False  # new context flag
 
 
-# setup core components and tools
-general_agent = get_model(settings.DEFAULT_MODEL)
-web_search_recent = DuckDuckGoSearchResults(
-    name="AgentSearch",
-    description="real-time search for fresh info (dates, events, news)"
-)
+# tools are built on first use, langchain_community is slow to import
+@cache
+def search_tools() -> list[BaseTool]:
+    """web search tools bound to the agent model."""
+    from langchain_community.tools import DuckDuckGoSearchResults
 
-tools = [web_search_recent]
+    web_search_recent = DuckDuckGoSearchResults(
+        name="AgentSearch",
+        description="real-time search for fresh info (dates, events, news)"
+    )
+    return [web_search_recent]
 
 current_date = datetime.now().strftime("%B %d, %Y")
 current_datetime = datetime.now().strftime("%B %d, %Y %H:%M UTC")
@@ -53,7 +58,7 @@ instructions = f"""
 
 def general_agent_chain(model: BaseChatModel) -> RunnableSerializable[AgentState, AIMessage]:
     """chains model with tools and system prompts."""
-    model_with_tools = model.bind_tools(tools)
+    model_with_tools = model.bind_tools(search_tools())
     return RunnableLambda(
         lambda state: [SystemMessage(content=instructions)] + state["messages"]
     ) | model_with_tools
@@ -65,6 +70,7 @@ async def acall_general_agent(state: AgentState, config: RunnableConfig) -> Agen
         state["messages"].extend(state["tool_messages"])
         state["tool_messages"] = []
     
+    general_agent = get_model(settings.DEFAULT_MODEL)
     response = await general_agent_chain(general_agent).ainvoke(state, config)
     
     # enhanced safety verification
@@ -127,39 +133,45 @@ def format_safety_message(safety: LlamaGuardOutput) -> AIMessage:
         content = f"blocked content: {', '.join(safety.unsafe_categories)}"
     return AIMessage(content=content)
 
-# workflow setup with state management
-agent = StateGraph(AgentState)
-agent.add_node("security_check", llama_guard_input)
-agent.add_node("general_agent", acall_general_agent)
-agent.add_node("web_search", ToolNode([web_search_recent]))
-agent.add_node("process_results", process_tool_results)
-agent.add_node("block_content", lambda state: {"messages": [format_safety_message(state["safety"])]})
-
-# main conversation flow
-agent.set_entry_point("security_check")
-
-# security check routing
-agent.add_conditional_edges(
-    "security_check",
-    lambda state: "block" if state["safety"].safety_assessment == SafetyAssessment.UNSAFE else "continue",
-    {"block": "block_content", "continue": "general_agent"}
-)
-
 # context-aware search decision
 def should_search(state: AgentState) -> Literal["search", "respond"]:
     return "search" if state["needs_search"] else "respond"
 
-agent.add_conditional_edges(
-    "general_agent",
-    should_search,
-    {"search": "web_search", "respond": END}
-)
+# the graph is compiled by agents.get_agent on first use, normally in the service lifespan
+def build_supervisor() -> CompiledStateGraph:
+    """workflow setup with state management."""
+    agent = StateGraph(AgentState)
+    agent.add_node("security_check", llama_guard_input)
+    agent.add_node("general_agent", acall_general_agent)
+    agent.add_node("web_search", ToolNode(search_tools()))
+    agent.add_node("process_results", process_tool_results)
+    agent.add_node("block_content", lambda state: {"messages": [format_safety_message(state["safety"])]})
+
+    # main conversation flow
+    agent.set_entry_point("security_check")
+
+    # security check routing
+    agent.add_conditional_edges(
+        "security_check",
+        lambda state: "block" if state["safety"].safety_assessment == SafetyAssessment.UNSAFE else "continue",
+        {"block": "block_content", "continue": "general_agent"}
+    )
+
+    # context-aware search decision
+    agent.add_conditional_edges(
+        "general_agent",
+        should_search,
+        {"search": "web_search", "respond": END}
+    )
 
-# data processing flow
-agent.add_edge("web_search", "process_results")
-agent.add_edge("process_results", "general_agent")
-agent.add_edge("block_content", END)
+    # data processing flow
+    agent.add_edge("web_search", "process_results")
+    agent.add_edge("process_results", "general_agent")
+    agent.add_edge("block_content", END)
 
-supervisor = agent.compile(
-    checkpointer=MemorySaver(),
-)
\ No newline at end of file
+    return agent.compile(
+        checkpointer=BoundedMemorySaver(
+            max_bytes=settings.CHECKPOINT_MEMORY_BUDGET_BYTES,
+            spill_dir=settings.CHECKPOINT_SPILL_DIR,
+        ),
+    )
@@ -4,6 +4,7 @@ from langchain_core.callbacks import adispatch_custom_event
 from langchain_core.messages import ChatMessage
 from langchain_core.runnables import RunnableConfig
 from langchain_core.runnables.config import merge_configs
+from langgraph.constants import CONFIG_KEY_STREAM_WRITER
 from pydantic import BaseModel, Field
 
 
@@ -20,6 +21,12 @@ class CustomData(BaseModel):
         return ChatMessage(content=[self.data], role="custom")
 
     async def adispatch(self, config: RunnableConfig | None = None) -> None:
+        # graphs streamed with stream_mode="custom" get a writer, otherwise fall back
+        # to a callback event picked up by astream_events
+        writer = (config or {}).get("configurable", {}).get(CONFIG_KEY_STREAM_WRITER)
+        if writer is not None:
+            writer(self.to_langchain())
+            return
         dispatch_config = RunnableConfig(
             tags=["custom_data_dispatch"],
         )
@@ -1,15 +1,21 @@
 import streamlit as st
 import asyncio
 import os
+import threading
+import time
 import urllib.parse
-from collections.abc import AsyncGenerator
+from collections import OrderedDict
+from collections.abc import AsyncGenerator, Coroutine
+from contextlib import aclosing, asynccontextmanager
+from typing import Any, TypeVar
 
+import httpx
 from dotenv import load_dotenv
 from pydantic import ValidationError
 from streamlit.runtime.scriptrunner import get_script_run_ctx
 
 from client import AgentClient, AgentClientError
-from schema import ChatHistory, ChatMessage
+from schema import ChatMessage
 from schema.task_data import TaskData, TaskDataStatus
 
 st.set_page_config(
@@ -58,6 +64,202 @@ st.markdown(
     unsafe_allow_html=True
 )
 
+# ------------------------------------------------------------
+#  rendering budget
+# ------------------------------------------------------------
+HISTORY_PAGE_TURNS = 10  # turns of a thread drawn per page, older ones load on demand
+STREAM_RENDER_INTERVAL = 0.1  # seconds between redraws of an answer being streamed
+
+
+class StreamingText:
+    """an answer being streamed, redrawn at most every `interval` seconds.
+
+    writing the whole accumulated text on every token is quadratic in the
+    answer's length and floods the streamlit websocket with deltas.
+    """
+
+    def __init__(self, placeholder, interval: float) -> None:
+        self.placeholder = placeholder
+        self.interval = interval
+        self.chunks: list[str] = []
+        self.drawn_at = 0.0
+        self.pending = False
+
+    def append(self, token: str) -> None:
+        self.chunks.append(token)
+        self.pending = True
+        now = time.monotonic()
+        if now - self.drawn_at >= self.interval:
+            self.placeholder.write("".join(self.chunks))
+            self.drawn_at = now
+            self.pending = False
+
+    def flush(self) -> None:
+        if self.pending:
+            self.placeholder.write("".join(self.chunks))
+            self.pending = False
+
+
+def history_start(messages: list[ChatMessage], turns: int) -> int:
+    """index of the first message of the last `turns` turns, a page never splits a turn."""
+    human = [i for i, m in enumerate(messages) if m.type == "human"]
+    if len(human) <= turns:
+        return 0
+    return human[-turns]
+
+
+# ------------------------------------------------------------
+#  agent client and event loop, shared by all sessions of this process
+# ------------------------------------------------------------
+SESSION_CONCURRENCY = 2  # agent calls one browser session may have in flight at once
+CLIENT_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20)
+
+T = TypeVar("T")
+
+
+class BackgroundLoop:
+    """an event loop in a daemon thread that every session submits its agent calls to.
+
+    each script rerun runs in its own asyncio.run, so connections opened there
+    die with the rerun. calls made here all share the pooled connections of
+    one client instead. a session gets at most `per_session` calls at once.
+    """
+
+    def __init__(self, per_session: int) -> None:
+        self.per_session = per_session
+        self.loop = asyncio.new_event_loop()
+        # session id -> [semaphore, calls holding or waiting for it], only touched on self.loop
+        self.slots: dict[str, list[Any]] = {}
+        thread = threading.Thread(target=self.loop.run_forever, name="agent-client-loop")
+        thread.daemon = True
+        thread.start()
+
+    @asynccontextmanager
+    async def _slot(self, session_id: str) -> AsyncGenerator[None, None]:
+        slot = self.slots.setdefault(session_id, [asyncio.Semaphore(self.per_session), 0])
+        slot[1] += 1
+        try:
+            async with slot[0]:
+                yield
+        finally:
+            slot[1] -= 1
+            if not slot[1]:
+                del self.slots[session_id]
+
+    async def _run(self, session_id: str, coro: Coroutine[Any, Any, T]) -> T:
+        async with self._slot(session_id):
+            return await coro
+
+    async def call(self, session_id: str, coro: Coroutine[Any, Any, T]) -> T:
+        """runs `coro` on the background loop and waits for it from the rerun's loop."""
+        future = asyncio.run_coroutine_threadsafe(self._run(session_id, coro), self.loop)
+        return await asyncio.wrap_future(future)
+
+    async def iterate(
+        self, session_id: str, agen: AsyncGenerator[T, None]
+    ) -> AsyncGenerator[T, None]:
+        """iterates `agen` on the background loop, yielding its items on the rerun's loop."""
+        loop = asyncio.get_running_loop()
+        items: asyncio.Queue[tuple[Any, BaseException | None]] = asyncio.Queue()
+        end = object()
+
+        async def pump() -> None:
+            try:
+                async with self._slot(session_id), aclosing(agen):
+                    async for item in agen:
+                        loop.call_soon_threadsafe(items.put_nowait, (item, None))
+            except Exception as e:
+                loop.call_soon_threadsafe(items.put_nowait, (end, e))
+            else:
+                loop.call_soon_threadsafe(items.put_nowait, (end, None))
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self.loop)
+        try:
+            while True:
+                item, error = await items.get()
+                if error is not None:
+                    raise error
+                if item is end:
+                    return
+                yield item
+        finally:
+            # e.g. the rerun was stopped mid-answer, this cancels the request too
+            future.cancel()
+
+
+@st.cache_resource
+def get_background_loop() -> BackgroundLoop:
+    return BackgroundLoop(SESSION_CONCURRENCY)
+
+
+@st.cache_resource
+def get_agent_client() -> AgentClient:
+    load_dotenv()
+    agent_url = os.getenv("AGENT_URL")
+    if not agent_url:
+        host = os.getenv("HOST", "0.0.0.0")
+        port = os.getenv("PORT", 80)
+        agent_url = f"http://{host}:{port}"
+    return AgentClient(base_url=agent_url, limits=CLIENT_LIMITS)
+
+
+def session_id() -> str:
+    return get_script_run_ctx().session_id
+
+
+# ------------------------------------------------------------
+#  resumed thread history, shared by all sessions of this process
+# ------------------------------------------------------------
+HISTORY_CACHE_THREADS = 256
+
+
+class HistoryCache:
+    """lru of thread histories already fetched, so resuming only pulls the delta."""
+
+    def __init__(self, max_threads: int) -> None:
+        self.max_threads = max_threads
+        self.lock = threading.Lock()
+        self.threads: OrderedDict[str, list[ChatMessage]] = OrderedDict()
+
+    def get(self, thread_id: str) -> list[ChatMessage]:
+        with self.lock:
+            if thread_id not in self.threads:
+                return []
+            self.threads.move_to_end(thread_id)
+            return list(self.threads[thread_id])
+
+    def put(self, thread_id: str, messages: list[ChatMessage]) -> None:
+        with self.lock:
+            self.threads[thread_id] = list(messages)
+            self.threads.move_to_end(thread_id)
+            while len(self.threads) > self.max_threads:
+                self.threads.popitem(last=False)
+
+
+@st.cache_resource
+def get_history_cache() -> HistoryCache:
+    return HistoryCache(HISTORY_CACHE_THREADS)
+
+
+async def resume_history(agent_client: AgentClient, thread_id: str) -> list[ChatMessage]:
+    """loads a thread's history, fetching only messages newer than the cached copy."""
+    cache = get_history_cache()
+    messages = cache.get(thread_id)
+    background = get_background_loop()
+    delta = await background.call(
+        session_id(), agent_client.aget_history(thread_id=thread_id, since=len(messages))
+    )
+    if delta.total is not None and delta.total < len(messages):
+        # the server copy is shorter than ours (e.g. a fresh checkpoint store), start over
+        messages = []
+        delta = await background.call(
+            session_id(), agent_client.aget_history(thread_id=thread_id)
+        )
+    messages.extend(delta.messages)
+    cache.put(thread_id, messages)
+    return messages
+
+
 # ------------------------------------------------------------
 #  main function
 # ------------------------------------------------------------
@@ -68,30 +270,28 @@ async def main() -> None:
         await asyncio.sleep(0.1)
         st.rerun()
 
-    if "agent_client" not in st.session_state:
-        load_dotenv()
-        agent_url = os.getenv("AGENT_URL")
-        if not agent_url:
-            host = os.getenv("HOST", "0.0.0.0")
-            port = os.getenv("PORT", 80)
-            agent_url = f"http://{host}:{port}"
+    # one client and loop for every session, so tabs share connections and cached /info
+    agent_client = get_agent_client()
+    background = get_background_loop()
+    if "connected" not in st.session_state:
         try:
             with st.spinner("Connecting to agent service..."):
-                st.session_state.agent_client = AgentClient(base_url=agent_url)
+                # a round trip only for the first session, later ones reuse the cached info
+                await background.call(session_id(), agent_client.aretrieve_info())
+                st.session_state.connected = True
         except AgentClientError as e:
             st.error(f"Error connecting to agent service: {e}")
             st.markdown("The service might be booting up. Try again in a few seconds.")
             st.stop()
-    agent_client: AgentClient = st.session_state.agent_client
 
     if "thread_id" not in st.session_state:
         thread_id = st.query_params.get("thread_id")
         if not thread_id:
-            thread_id = get_script_run_ctx().session_id
+            thread_id = session_id()
             messages = []
         else:
             try:
-                messages: ChatHistory = agent_client.get_history(thread_id=thread_id).messages
+                messages = await resume_history(agent_client, thread_id)
             except AgentClientError:
                 st.error("No message history found for this Thread ID.")
                 messages = []
@@ -111,7 +311,6 @@ async def main() -> None:
             index=model_idx
         )
 
-        agent_client.agent = agent_client.info.default_agent
         st.write(f"Agent to use: `{agent_client.agent}`")
 
 
@@ -124,8 +323,16 @@ async def main() -> None:
         with st.chat_message("ai"):
             st.write(WELCOME)
 
+    # long threads are drawn a page of turns at a time, not replayed whole on every rerun
+    if "history_turns" not in st.session_state:
+        st.session_state.history_turns = HISTORY_PAGE_TURNS
+    start = history_start(messages, st.session_state.history_turns)
+    if start > 0 and st.button(f"Carregar mensagens anteriores ({start})"):
+        st.session_state.history_turns += HISTORY_PAGE_TURNS
+        st.rerun()
+
     async def amessage_iter() -> AsyncGenerator[ChatMessage, None]:
-        for m in messages:
+        for m in messages[start:]:
             yield m
 
     await draw_messages(amessage_iter())
@@ -144,12 +351,15 @@ async def main() -> None:
                     model=model,
                     thread_id=st.session_state.thread_id,
                 )
-                await draw_messages(stream, is_new=True)
+                await draw_messages(background.iterate(session_id(), stream), is_new=True)
             else:
-                response = await agent_client.ainvoke(
-                    message=user_input,
-                    model=model,
-                    thread_id=st.session_state.thread_id,
+                response = await background.call(
+                    session_id(),
+                    agent_client.ainvoke(
+                        message=user_input,
+                        model=model,
+                        thread_id=st.session_state.thread_id,
+                    ),
                 )
                 messages.append(response)
                 st.chat_message("ai").write(response.content)
@@ -173,19 +383,17 @@ async def draw_messages(
     last_message_type = None
     st.session_state.last_message = None
 
-    streaming_content = ""
-    streaming_placeholder = None
+    streaming: StreamingText | None = None
 
     while msg := await anext(messages_agen, None):
         if isinstance(msg, str):
-            if not streaming_placeholder:
+            if not streaming:
                 if last_message_type != "ai":
                     last_message_type = "ai"
                     st.session_state.last_message = st.chat_message("ai")
                 with st.session_state.last_message:
-                    streaming_placeholder = st.empty()
-            streaming_content += msg
-            streaming_placeholder.write(streaming_content)
+                    streaming = StreamingText(st.empty(), STREAM_RENDER_INTERVAL)
+            streaming.append(msg)
             continue
 
         if not isinstance(msg, ChatMessage):
@@ -208,10 +416,10 @@ async def draw_messages(
 
                 with st.session_state.last_message:
                     if msg.content:
-                        if streaming_placeholder:
-                            streaming_placeholder.write(msg.content)
-                            streaming_content = ""
-                            streaming_placeholder = None
+                        if streaming:
+                            # the final message replaces the partial text, drawn once
+                            streaming.placeholder.write(msg.content)
+                            streaming = None
                         else:
                             st.write(msg.content)
 
@@ -265,6 +473,10 @@ async def draw_messages(
                 st.write(msg)
                 st.stop()
 
+    # tokens still waiting for their frame, e.g. a stream that ended without a message
+    if streaming:
+        streaming.flush()
+
 
 # ------------------------------------------------------------
 #   share/resume chat dialog
@@ -288,7 +500,8 @@ def share_chat_dialog() -> None:
 async def handle_feedback() -> None:
     """buttons deslike or like for agent response, iteration w/ feeedback from langsmith."""
     latest_run_id = st.session_state.messages[-1].run_id
-    agent_client: AgentClient = st.session_state.agent_client
+    agent_client = get_agent_client()
+    background = get_background_loop()
 
     ### dict to prevent duplicate submissions
     if "feedback_sent" not in st.session_state:
@@ -303,11 +516,14 @@ async def handle_feedback() -> None:
             if st.session_state.feedback_sent[latest_run_id] != "like":
                 st.session_state.feedback_sent[latest_run_id] = "like"
                 try:
-                    await agent_client.acreate_feedback(
-                        run_id=latest_run_id,
-                        key="human-feedback-like-dislike",
-                        score=1.0,  
-                        kwargs={"comment": "User pressed like"},
+                    await background.call(
+                        session_id(),
+                        agent_client.acreate_feedback(
+                            run_id=latest_run_id,
+                            key="human-feedback-like-dislike",
+                            score=1.0,
+                            kwargs={"comment": "User pressed like"},
+                        ),
                     )
                     st.toast("Feedback recorded: Like")  
                 except AgentClientError as e:
@@ -319,11 +535,14 @@ async def handle_feedback() -> None:
             if st.session_state.feedback_sent[latest_run_id] != "dislike":
                 st.session_state.feedback_sent[latest_run_id] = "dislike"
                 try:
-                    await agent_client.acreate_feedback(
-                        run_id=latest_run_id,
-                        key="human-feedback-like-dislike",
-                        score=0.0,  
-                        kwargs={"comment": "User pressed dislike"},
+                    await background.call(
+                        session_id(),
+                        agent_client.acreate_feedback(
+                            run_id=latest_run_id,
+                            key="human-feedback-like-dislike",
+                            score=0.0,
+                            kwargs={"comment": "User pressed dislike"},
+                        ),
                     )
                     st.toast("Feedback recorded: Dislike") 
                 except AgentClientError as e:
@@ -0,0 +1,116 @@
+"""measures service cold start against a budget, like `python -X importtime` but summarized.
+
+run from src/: python -m benchmarks.startup --runs 5 --budget-ms 2000
+exits non-zero when the median startup is over budget or a provider package is
+imported eagerly, so it can gate a pipeline without any test framework.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from collections import Counter
+from pathlib import Path
+
+# packages importing the service must not load, they come with the first model or graph using them
+LAZY_PACKAGES = ("langchain_openai", "langchain_groq", "langchain_community", "pyarrow")
+
+# runs in a fresh interpreter: import the service, then start its lifespan
+PROBE = """
+import asyncio, json, sys, time
+start = time.perf_counter()
+from service import app
+imported = time.perf_counter()
+eager = [name for name in %r if name in sys.modules]
+
+async def startup():
+    async with app.router.lifespan_context(app):
+        return time.perf_counter()
+
+started = asyncio.run(startup())
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "lifespan_ms": (started - imported) * 1000,
+    "eager": eager,
+}))
+"""
+
+
+def _environment(workdir: str) -> dict[str, str]:
+    env = dict(os.environ)
+    env.setdefault("USE_FAKE_MODEL", "true")
+    env.setdefault("DEFAULT_MODEL", "fake")
+    # keep the probe's sqlite files and spills out of the working tree
+    for name, filename in (
+        ("CHECKPOINT_DB", "checkpoints.db"),
+        ("JOBS_DB", "jobs.db"),
+        ("FEEDBACK_SPILL_PATH", "feedback_spill.jsonl"),
+        ("FEEDBACK_LOCAL_PATH", "feedback.jsonl"),
+        ("CHECKPOINT_SPILL_DIR", ".checkpoints"),
+    ):
+        env[name] = str(Path(workdir) / filename)
+    return env
+
+
+def probe(env: dict[str, str], cwd: Path, importtime: bool = False) -> tuple[dict, str]:
+    """one cold start in a new process, returns its timings and the -X importtime log."""
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    command += ["-c", PROBE % (LAZY_PACKAGES,)]
+    result = subprocess.run(command, env=env, cwd=cwd, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def heaviest_packages(importtime_log: str, top: int) -> list[tuple[str, float]]:
+    """self import time summed per top level package, in milliseconds."""
+    totals: Counter[str] = Counter()
+    for line in importtime_log.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:") :].split("|")
+        totals[name.strip().split(".")[0]] += int(self_us) / 1000
+    return totals.most_common(top)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=2000.0, help="median import + lifespan")
+    parser.add_argument("--top", type=int, default=15, help="packages listed in the report")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        env = _environment(workdir)
+        src = Path(__file__).resolve().parent.parent
+        # the first start also writes bytecode caches, it isn't a cold start worth measuring
+        probe(env, src)
+        runs = [probe(env, src)[0] for _ in range(args.runs)]
+        _, importtime_log = probe(env, src, importtime=True)
+
+    imports = statistics.median(run["import_ms"] for run in runs)
+    lifespan = statistics.median(run["lifespan_ms"] for run in runs)
+    total = statistics.median(run["import_ms"] + run["lifespan_ms"] for run in runs)
+    eager = sorted({name for run in runs for name in run["eager"]})
+
+    print(f"{'import':<12}{imports:>10.0f} ms")
+    print(f"{'lifespan':<12}{lifespan:>10.0f} ms")
+    print(f"{'total':<12}{total:>10.0f} ms  (budget {args.budget_ms:.0f} ms)")
+    print("\nheaviest packages by self import time:")
+    for package, ms in heaviest_packages(importtime_log, args.top):
+        print(f"  {package:<28}{ms:>8.0f} ms")
+
+    failures = []
+    if total > args.budget_ms:
+        failures.append(f"startup took {total:.0f} ms, over the {args.budget_ms:.0f} ms budget")
+    if eager:
+        failures.append(f"imported at startup but meant to load lazily: {', '.join(eager)}")
+    for failure in failures:
+        print(f"\nFAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
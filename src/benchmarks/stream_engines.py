@@ -0,0 +1,77 @@
+"""compares the streaming engines on the supervisor graph with the fake model.
+
+run from src/: python -m benchmarks.stream_engines --requests 50
+"""
+import argparse
+import asyncio
+import os
+import time
+from typing import Any
+
+# must be set before settings are loaded
+os.environ.setdefault("USE_FAKE_MODEL", "true")
+os.environ.setdefault("DEFAULT_MODEL", "fake")
+
+from agents import DEFAULT_AGENT, get_agent  # noqa: E402
+from schema import StreamInput  # noqa: E402
+from service.service import _parse_input  # noqa: E402
+from service.streaming import STREAM_ENGINES, SSEEncoder  # noqa: E402
+
+
+class CountingAgent:
+    """wraps a compiled graph and counts the raw events the engine has to process."""
+
+    def __init__(self, agent: Any) -> None:
+        self.agent = agent
+        self.events = 0
+
+    async def astream_events(self, *args: Any, **kwargs: Any):
+        async for event in self.agent.astream_events(*args, **kwargs):
+            self.events += 1
+            yield event
+
+    async def astream(self, *args: Any, **kwargs: Any):
+        async for chunk in self.agent.astream(*args, **kwargs):
+            self.events += 1
+            yield chunk
+
+
+async def run_engine(name: str, requests: int) -> dict[str, float]:
+    engine = STREAM_ENGINES[name]
+    agent = CountingAgent(get_agent(DEFAULT_AGENT))
+    encoder = SSEEncoder()
+    frames = 0
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    for i in range(requests):
+        user_input = StreamInput(message=f"question {i}", model="fake", stream_window_ms=0)
+        kwargs, run_id = _parse_input(user_input)
+        async for event in engine(agent, kwargs, run_id, user_input):
+            encoder.encode(event)
+            frames += 1
+    cpu, wall = time.process_time() - cpu_start, time.perf_counter() - wall_start
+    return {
+        "events/req": agent.events / requests,
+        "frames/req": frames / requests,
+        "cpu ms/req": cpu * 1000 / requests,
+        "wall ms/req": wall * 1000 / requests,
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=50)
+    args = parser.parse_args()
+
+    # warm up imports, caches and the checkpointer before measuring
+    for name in STREAM_ENGINES:
+        await run_engine(name, 2)
+    results = {name: await run_engine(name, args.requests) for name in STREAM_ENGINES}
+
+    columns = list(next(iter(results.values())))
+    print(f"{'engine':<8}" + "".join(f"{c:>14}" for c in columns))
+    for name, row in results.items():
+        print(f"{name:<8}" + "".join(f"{row[c]:>14.2f}" for c in columns))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,15 +1,30 @@
+import asyncio
 import json
 import os
-from collections.abc import AsyncGenerator, Generator
+import random
+import re
+import threading
+import time
+from collections.abc import AsyncGenerator, Awaitable, Callable, Generator
+from contextlib import aclosing, asynccontextmanager
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
 from typing import Any
+from uuid import uuid4
 
 import httpx
+import websockets
 
 from schema import (
+    BatchInput,
+    BatchResult,
     ChatHistory,
     ChatHistoryInput,
     ChatMessage,
     Feedback,
+    ForkInput,
+    ForkResponse,
+    JobStatus,
     ServiceMetadata,
     StreamInput,
     UserInput,
@@ -19,9 +34,151 @@ from schema import (
 class AgentClientError(Exception):
     """custom error for agent client operations."""
 
+    # overloaded or failing servers, worth retrying after a pause
+    RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+
+    def __init__(
+        self, message: str, status_code: int | None = None, retry_after: float | None = None
+    ) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @classmethod
+    def from_http_error(cls, e: httpx.HTTPError) -> "AgentClientError":
+        if not isinstance(e, httpx.HTTPStatusError):
+            # connection failures carry no status, they are as retryable as a 503
+            status_code = 503 if isinstance(e, httpx.TransportError) else None
+            return cls(f"Error: {e}", status_code=status_code)
+        return cls(
+            f"Error: {e}",
+            status_code=e.response.status_code,
+            retry_after=_parse_retry_after(e.response.headers.get("Retry-After")),
+        )
+
+    @property
+    def retryable(self) -> bool:
+        return self.status_code in self.RETRYABLE_STATUS
+
+
+def _parse_retry_after(value: str | None) -> float | None:
+    """seconds to wait from a Retry-After header, given either as seconds or an http date."""
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass
+class _CachedInfo:
+    info: ServiceMetadata
+    etag: str | None
+    expires_at: float
+
+
+# /info responses per base url, shared by every client in the process
+_info_cache: dict[str, _CachedInfo] = {}
+_info_lock = threading.Lock()
+
+
+@dataclass
+class FanOutResult:
+    """outcome of one input of ainvoke_many or astream_many."""
+
+    index: int  # position in the inputs
+    output: ChatMessage | None = None  # the final message, None if the input failed
+    error: str | None = None
+    attempts: int = 0
+    latency: float = 0.0  # seconds from the first attempt until the result, backoff included
+    first_token_latency: float | None = None  # astream_many only, for the successful attempt
+
+
+class AgentSession:
+    """multi-turn chat over one websocket bound to a thread, see AgentClient.asession."""
+
+    def __init__(self, websocket: websockets.WebSocketClientProtocol, thread_id: str) -> None:
+        self.websocket = websocket
+        self.thread_id = thread_id
+        self._in_turn = False
+
+    async def _recv(self) -> dict[str, Any]:
+        try:
+            return json.loads(await self.websocket.recv())
+        except websockets.WebSocketException as e:
+            raise AgentClientError(f"Error: {e}")
+
+    async def _send(self, frame: dict[str, Any]) -> None:
+        try:
+            await self.websocket.send(json.dumps(frame))
+        except websockets.WebSocketException as e:
+            raise AgentClientError(f"Error: {e}")
+
+    async def astream(
+        self,
+        message: str,
+        model: str | None = None,
+        agent_config: dict[str, Any] | None = None,
+        stream_tokens: bool = True,
+    ) -> AsyncGenerator[ChatMessage | str, None]:
+        """streams one turn, yielding tokens and messages like AgentClient.astream."""
+        request = StreamInput(message=message, stream_tokens=stream_tokens)
+        if model:
+            request.model = model
+        if agent_config:
+            request.agent_config = agent_config
+        await self._send({"type": "turn", **request.model_dump(exclude={"thread_id"})})
+        self._in_turn = True
+        try:
+            while True:
+                frame = await self._recv()
+                match frame["type"]:
+                    case "token":
+                        yield frame["content"]
+                    case "message":
+                        yield ChatMessage.model_validate(frame["content"])
+                    case "error":
+                        raise AgentClientError(frame["content"])
+                    case "done" | "cancelled":
+                        self._in_turn = False
+                        return
+        finally:
+            if self._in_turn:
+                # abandoned mid-turn: stop the run and drop its remaining frames
+                await self.cancel()
+                while (await self._recv())["type"] not in ("done", "cancelled"):
+                    pass
+                self._in_turn = False
+
+    async def cancel(self) -> None:
+        """cancels the running turn; the astream iterating it ends once the server confirms."""
+        if self._in_turn:
+            await self._send({"type": "cancel"})
+
+    async def ping(self) -> None:
+        """application level ping, for checking the session between turns."""
+        await self._send({"type": "ping"})
+        while (await self._recv())["type"] != "pong":
+            pass
+
+    async def close(self) -> None:
+        await self.websocket.close()
+
 
 class AgentClient:
-    """client for interacting with the agent service api."""
+    """client for interacting with the agent service api.
+
+    requests go through long-lived httpx clients, one sync and one async, so
+    consecutive calls reuse pooled keep-alive connections instead of paying a
+    tcp (and tls) handshake each. close the client when done with it, or use it
+    as a context manager:
+
+        with AgentClient(base_url) as client: ...
+        async with AgentClient(base_url) as client: ...
+    """
 
     def __init__(
         self,
@@ -29,17 +186,80 @@ class AgentClient:
         agent: str = None,
         timeout: float | None = None,
         get_info: bool = True,
+        limits: httpx.Limits | None = None,
+        http2: bool = False,
     ) -> None:
-        """sets up client connection and initial config."""
+        """sets up client connection and initial config.
+
+        `limits` bounds each connection pool (httpx defaults otherwise), `http2`
+        multiplexes requests over one connection and needs the `h2` package.
+        """
         self.base_url = base_url
         self.auth_secret = os.getenv("AUTH_SECRET")
         self.timeout = timeout
-        self.info: ServiceMetadata | None = None
-        self.agent: str | None = None
-        if get_info:
-            self.retrieve_info()
+        self.limits = limits or httpx.Limits()
+        self.http2 = http2
+        self._client: httpx.Client | None = None
+        self._aclient: httpx.AsyncClient | None = None
+        self._aclient_loop: asyncio.AbstractEventLoop | None = None
+        self._info: ServiceMetadata | None = None
+        self._agent: str | None = None
+        # nothing is fetched here: service info is loaded on first use, from the
+        # process-wide cache when another client already has it
+        self._get_info = get_info
         if agent:
-            self.update_agent(agent)
+            self.update_agent(agent, verify=False)
+
+    def _sync_client(self) -> httpx.Client:
+        if self._client is None:
+            self._client = httpx.Client(limits=self.limits, http2=self.http2)
+        return self._client
+
+    def _async_client(self) -> httpx.AsyncClient:
+        # pooled connections belong to the event loop that opened them, a caller that
+        # runs each call in a fresh loop (asyncio.run per streamlit rerun) gets a new pool
+        loop = asyncio.get_running_loop()
+        if self._aclient is None or self._aclient_loop is not loop:
+            if self._aclient is not None:
+                self._close_elsewhere(self._aclient, self._aclient_loop)
+            self._aclient = httpx.AsyncClient(limits=self.limits, http2=self.http2)
+            self._aclient_loop = loop
+        return self._aclient
+
+    @staticmethod
+    def _close_elsewhere(client: httpx.AsyncClient, loop: asyncio.AbstractEventLoop) -> None:
+        # the old loop may be running in another thread, so the close is handed to it thread-safely
+        if not loop.is_closed():
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+
+    def close(self) -> None:
+        """closes the sync client's pooled connections, aclose() closes both clients."""
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    async def aclose(self) -> None:
+        """closes the pooled connections of both clients."""
+        self.close()
+        if self._aclient is not None:
+            if self._aclient_loop is asyncio.get_running_loop():
+                await self._aclient.aclose()
+            else:
+                self._close_elsewhere(self._aclient, self._aclient_loop)
+            self._aclient = None
+            self._aclient_loop = None
+
+    def __enter__(self) -> "AgentClient":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    async def __aenter__(self) -> "AgentClient":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.aclose()
 
     @property
     def _headers(self) -> dict[str, str]:
@@ -49,21 +269,112 @@ class AgentClient:
             headers["Authorization"] = f"Bearer {self.auth_secret}"
         return headers
 
-    def retrieve_info(self) -> None:
-        """fetches service metadata and available agents."""
+    def _idempotent_headers(self, idempotency_key: str | None) -> dict[str, str]:
+        if idempotency_key is None:
+            return self._headers
+        return {**self._headers, "Idempotency-Key": idempotency_key}
+
+    @property
+    def info(self) -> ServiceMetadata | None:
+        """service metadata, fetched on first access unless get_info=False.
+
+        the fetch is synchronous; async methods load it with aretrieve_info first.
+        """
+        if self._info is None and self._get_info:
+            self.retrieve_info()
+        return self._info
+
+    @property
+    def agent(self) -> str | None:
+        """the agent requests go to, the service's default one unless set."""
+        if self._agent is None and self._get_info:
+            self._agent = self.info.default_agent
+        return self._agent
+
+    @agent.setter
+    def agent(self, agent: str | None) -> None:
+        self._agent = agent
+
+    async def _aload_agent(self) -> None:
+        # the lazy fetch behind `info` and `agent` blocks, async methods fetch the info
+        # with aretrieve_info first so it never runs on the event loop
+        if self._agent is None and self._info is None and self._get_info:
+            await self.aretrieve_info()
+
+    def _cached_info(self, refresh: bool) -> _CachedInfo | None:
+        """the process-wide cached info, if fresh enough to use without asking the service."""
+        with _info_lock:
+            cached = _info_cache.get(self.base_url)
+        if cached is not None and not refresh and cached.expires_at > time.monotonic():
+            return cached
+        return None
+
+    def _info_headers(self) -> dict[str, str]:
+        with _info_lock:
+            cached = _info_cache.get(self.base_url)
+        if cached is None or cached.etag is None:
+            return self._headers
+        # revalidate: an unchanged response comes back as an empty 304
+        return {**self._headers, "If-None-Match": cached.etag}
+
+    def _store_info(self, response: httpx.Response) -> None:
+        with _info_lock:
+            cached = _info_cache.get(self.base_url)
+            if response.status_code == httpx.codes.NOT_MODIFIED and cached is not None:
+                info = cached.info
+            else:
+                info = ServiceMetadata.model_validate_json(response.content)
+            max_age = re.search(r"max-age=(\d+)", response.headers.get("Cache-Control", ""))
+            _info_cache[self.base_url] = _CachedInfo(
+                info=info,
+                etag=response.headers.get("ETag"),
+                expires_at=time.monotonic() + (int(max_age.group(1)) if max_age else 0),
+            )
+        self._use_info(info)
+
+    def _use_info(self, info: ServiceMetadata) -> None:
+        self._info = info
+        if self._agent is None:
+            self._agent = info.default_agent
+
+    def retrieve_info(self, refresh: bool = False) -> None:
+        """fetches service metadata and available agents.
+
+        a response another client in the process fetched is reused while its
+        Cache-Control max-age lasts, after that (or with `refresh`) it is
+        revalidated with its ETag.
+        """
+        if cached := self._cached_info(refresh):
+            self._use_info(cached.info)
+            return
         try:
-            response = httpx.get(
+            response = self._sync_client().get(
                 f"{self.base_url}/info",
-                headers=self._headers,
+                headers=self._info_headers(),
                 timeout=self.timeout,
             )
-            response.raise_for_status()
+            if response.status_code != httpx.codes.NOT_MODIFIED:
+                response.raise_for_status()
         except httpx.HTTPError as e:
             raise AgentClientError(f"Error getting service info: {e}")
+        self._store_info(response)
 
-        self.info: ServiceMetadata = ServiceMetadata.model_validate(response.json())
-        if not self.agent or self.agent not in [a.key for a in self.info.agents]:
-            self.agent = self.info.default_agent
+    async def aretrieve_info(self, refresh: bool = False) -> None:
+        """async version of retrieve_info."""
+        if cached := self._cached_info(refresh):
+            self._use_info(cached.info)
+            return
+        try:
+            response = await self._async_client().get(
+                f"{self.base_url}/info",
+                headers=self._info_headers(),
+                timeout=self.timeout,
+            )
+            if response.status_code != httpx.codes.NOT_MODIFIED:
+                response.raise_for_status()
+        except httpx.HTTPError as e:
+            raise AgentClientError(f"Error getting service info: {e}")
+        self._store_info(response)
 
     def update_agent(self, agent: str, verify: bool = True) -> None:
         """switches active agent after validation."""
@@ -83,8 +394,14 @@ class AgentClient:
         model: str | None = None,
         thread_id: str | None = None,
         agent_config: dict[str, Any] | None = None,
+        idempotency_key: str | None = None,
     ) -> ChatMessage:
-        """sends message to agent async and returns final response."""
+        """sends message to agent async and returns final response.
+
+        retries sent with the same `idempotency_key` get the first run's result
+        instead of running the agent again.
+        """
+        await self._aload_agent()
         if not self.agent:
             raise AgentClientError("No agent selected. Use update_agent() to select an agent.")
         request = UserInput(message=message)
@@ -94,17 +411,16 @@ class AgentClient:
             request.model = model
         if agent_config:
             request.agent_config = agent_config
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
-                    f"{self.base_url}/{self.agent}/invoke",
-                    json=request.model_dump(),
-                    headers=self._headers,
-                    timeout=self.timeout,
-                )
-                response.raise_for_status()
-            except httpx.HTTPError as e:
-                raise AgentClientError(f"Error: {e}")
+        try:
+            response = await self._async_client().post(
+                f"{self.base_url}/{self.agent}/invoke",
+                json=request.model_dump(),
+                headers=self._idempotent_headers(idempotency_key),
+                timeout=self.timeout,
+            )
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            raise AgentClientError.from_http_error(e)
 
         return ChatMessage.model_validate(response.json())
 
@@ -114,6 +430,7 @@ class AgentClient:
         model: str | None = None,
         thread_id: str | None = None,
         agent_config: dict[str, Any] | None = None,
+        idempotency_key: str | None = None,
     ) -> ChatMessage:
         """sends message to agent sync and returns final response."""
         if not self.agent:
@@ -126,15 +443,15 @@ class AgentClient:
         if agent_config:
             request.agent_config = agent_config
         try:
-            response = httpx.post(
+            response = self._sync_client().post(
                 f"{self.base_url}/{self.agent}/invoke",
                 json=request.model_dump(),
-                headers=self._headers,
+                headers=self._idempotent_headers(idempotency_key),
                 timeout=self.timeout,
             )
             response.raise_for_status()
         except httpx.HTTPError as e:
-            raise AgentClientError(f"Error: {e}")
+            raise AgentClientError.from_http_error(e)
 
         return ChatMessage.model_validate(response.json())
 
@@ -161,6 +478,20 @@ class AgentClient:
                     raise Exception(parsed["content"])
         return None
 
+    def _stream_request(
+        self, request: StreamInput, last_event_id: str | None, idempotency_key: str | None = None
+    ) -> tuple[str, str, dict[str, Any]]:
+        """method, url and arguments for starting a stream, or resuming it after `last_event_id`."""
+        if last_event_id is None:
+            kwargs = {
+                "json": request.model_dump(),
+                "headers": self._idempotent_headers(idempotency_key),
+            }
+            return "POST", f"{self.base_url}/{self.agent}/stream", kwargs
+        run_id = last_event_id.rpartition(":")[0]
+        headers = {**self._headers, "Last-Event-ID": last_event_id}
+        return "GET", f"{self.base_url}/stream/{run_id}", {"headers": headers}
+
     def stream(
         self,
         message: str,
@@ -168,34 +499,58 @@ class AgentClient:
         thread_id: str | None = None,
         agent_config: dict[str, Any] | None = None,
         stream_tokens: bool = True,
+        resumable: bool = False,
+        max_reconnects: int = 3,
+        idempotency_key: str | None = None,
     ) -> Generator[ChatMessage | str, None, None]:
-        """streams agent response with real-time tokens or messages."""
+        """streams agent response with real-time tokens or messages.
+
+        with `resumable`, a dropped connection is resumed from the last received
+        frame instead of failing, up to `max_reconnects` times. it is opt-in: a
+        resumable run keeps going for STREAM_RESUME_GRACE after its client left,
+        a plain one is cancelled as soon as the client disconnects. retries sent with
+        the same `idempotency_key` replay the first run's frames instead of
+        running the agent again.
+        """
         if not self.agent:
             raise AgentClientError("No agent selected. Use update_agent() to select an agent.")
-        request = StreamInput(message=message, stream_tokens=stream_tokens)
+        request = StreamInput(message=message, stream_tokens=stream_tokens, resumable=resumable)
         if thread_id:
             request.thread_id = thread_id
         if model:
             request.model = model
         if agent_config:
             request.agent_config = agent_config
-        try:
-            with httpx.stream(
-                "POST",
-                f"{self.base_url}/{self.agent}/stream",
-                json=request.model_dump(),
-                headers=self._headers,
-                timeout=self.timeout,
-            ) as response:
-                response.raise_for_status()
-                for line in response.iter_lines():
-                    if line.strip():
-                        parsed = self._parse_stream_line(line)
-                        if parsed is None:
-                            break
-                        yield parsed
-        except httpx.HTTPError as e:
-            raise AgentClientError(f"Error: {e}")
+        last_event_id = None
+        reconnects = 0
+        while True:
+            method, url, kwargs = self._stream_request(request, last_event_id, idempotency_key)
+            try:
+                with self._sync_client().stream(
+                    method, url, timeout=self.timeout, **kwargs
+                ) as response:
+                    response.raise_for_status()
+                    event_id = None
+                    for line in response.iter_lines():
+                        if line.startswith("id: "):
+                            event_id = line[4:].strip()
+                            continue
+                        if line.strip():
+                            parsed = self._parse_stream_line(line)
+                            last_event_id = event_id or last_event_id
+                            if parsed is None:
+                                return
+                            yield parsed
+                    # the body ended before [DONE]: the connection dropped or the run died,
+                    # resumed like any other dropped connection or raised
+                    raise httpx.RemoteProtocolError("Stream ended before the run finished")
+            except httpx.TransportError as e:
+                if not resumable or last_event_id is None or reconnects >= max_reconnects:
+                    raise AgentClientError.from_http_error(e)
+                reconnects += 1
+                time.sleep(0.5 * reconnects)
+            except httpx.HTTPError as e:
+                raise AgentClientError.from_http_error(e)
 
     async def astream(
         self,
@@ -204,62 +559,322 @@ class AgentClient:
         thread_id: str | None = None,
         agent_config: dict[str, Any] | None = None,
         stream_tokens: bool = True,
+        resumable: bool = False,
+        max_reconnects: int = 3,
+        idempotency_key: str | None = None,
     ) -> AsyncGenerator[ChatMessage | str, None]:
         """async version of response streaming."""
+        await self._aload_agent()
         if not self.agent:
             raise AgentClientError("No agent selected. Use update_agent() to select an agent.")
-        request = StreamInput(message=message, stream_tokens=stream_tokens)
+        request = StreamInput(message=message, stream_tokens=stream_tokens, resumable=resumable)
         if thread_id:
             request.thread_id = thread_id
         if model:
             request.model = model
         if agent_config:
             request.agent_config = agent_config
-        async with httpx.AsyncClient() as client:
+        last_event_id = None
+        reconnects = 0
+        while True:
+            method, url, kwargs = self._stream_request(request, last_event_id, idempotency_key)
             try:
-                async with client.stream(
-                    "POST",
-                    f"{self.base_url}/{self.agent}/stream",
-                    json=request.model_dump(),
-                    headers=self._headers,
-                    timeout=self.timeout,
+                async with self._async_client().stream(
+                    method, url, timeout=self.timeout, **kwargs
                 ) as response:
                     response.raise_for_status()
+                    event_id = None
                     async for line in response.aiter_lines():
+                        if line.startswith("id: "):
+                            event_id = line[4:].strip()
+                            continue
                         if line.strip():
                             parsed = self._parse_stream_line(line)
+                            last_event_id = event_id or last_event_id
                             if parsed is None:
-                                break
+                                return
                             yield parsed
+                    # the body ended before [DONE]: the connection dropped or the run died,
+                    # resumed like any other dropped connection or raised
+                    raise httpx.RemoteProtocolError("Stream ended before the run finished")
+            except httpx.TransportError as e:
+                if not resumable or last_event_id is None or reconnects >= max_reconnects:
+                    raise AgentClientError.from_http_error(e)
+                reconnects += 1
+                await asyncio.sleep(0.5 * reconnects)
             except httpx.HTTPError as e:
-                raise AgentClientError(f"Error: {e}")
+                raise AgentClientError.from_http_error(e)
+
+    def _batch_request(
+        self,
+        inputs: list[str | UserInput],
+        model: str | None,
+        concurrency: int | None,
+        timeout: float | None,
+    ) -> BatchInput:
+        if not self.agent:
+            raise AgentClientError("No agent selected. Use update_agent() to select an agent.")
+        user_inputs = []
+        for item in inputs:
+            if isinstance(item, str):
+                item = UserInput(message=item)
+                if model:
+                    item.model = model
+            user_inputs.append(item)
+        return BatchInput(inputs=user_inputs, concurrency=concurrency, timeout=timeout)
+
+    def batch(
+        self,
+        inputs: list[str | UserInput],
+        model: str | None = None,
+        concurrency: int | None = None,
+        timeout: float | None = None,
+    ) -> Generator[BatchResult, None, None]:
+        """runs many inputs in one request, yielding results as they complete.
+
+        results arrive in completion order; `index` points back into `inputs`.
+        """
+        request = self._batch_request(inputs, model, concurrency, timeout)
+        try:
+            with self._sync_client().stream(
+                "POST",
+                f"{self.base_url}/{self.agent}/batch",
+                json=request.model_dump(),
+                headers=self._headers,
+                timeout=self.timeout,
+            ) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if line.strip():
+                        yield BatchResult.model_validate_json(line)
+        except httpx.HTTPError as e:
+            raise AgentClientError.from_http_error(e)
+
+    async def abatch(
+        self,
+        inputs: list[str | UserInput],
+        model: str | None = None,
+        concurrency: int | None = None,
+        timeout: float | None = None,
+    ) -> AsyncGenerator[BatchResult, None]:
+        """async version of batch."""
+        await self._aload_agent()
+        request = self._batch_request(inputs, model, concurrency, timeout)
+        try:
+            async with self._async_client().stream(
+                "POST",
+                f"{self.base_url}/{self.agent}/batch",
+                json=request.model_dump(),
+                headers=self._headers,
+                timeout=self.timeout,
+            ) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if line.strip():
+                        yield BatchResult.model_validate_json(line)
+        except httpx.HTTPError as e:
+            raise AgentClientError.from_http_error(e)
+
+    def _fan_out_inputs(self, inputs: list[str | UserInput], model: str | None) -> list[UserInput]:
+        if not self.agent:
+            raise AgentClientError("No agent selected. Use update_agent() to select an agent.")
+        user_inputs = []
+        for item in inputs:
+            if isinstance(item, str):
+                item = UserInput(message=item)
+                if model:
+                    item.model = model
+            user_inputs.append(item)
+        return user_inputs
+
+    async def _fan_out(
+        self,
+        inputs: list[UserInput],
+        call: Callable[[UserInput, str], Awaitable[tuple[ChatMessage, float | None]]],
+        concurrency: int,
+        max_retries: int,
+        backoff: float,
+        max_backoff: float,
+    ) -> AsyncGenerator[FanOutResult, None]:
+        """runs `call` for every input, at most `concurrency` at once, yielding in completion order.
+
+        rejected (429) and failed (5xx, connection errors) attempts are retried up to
+        `max_retries` times, after a full-jitter exponential backoff that is never
+        shorter than the server's Retry-After.
+        """
+        pending = iter(enumerate(inputs))
+        results: asyncio.Queue[FanOutResult] = asyncio.Queue()
+
+        async def run_one(index: int, user_input: UserInput) -> FanOutResult:
+            result = FanOutResult(index=index)
+            # one key for every attempt, a retry of a run that did happen replays its result
+            idempotency_key = str(uuid4())
+            started = time.monotonic()
+            while True:
+                result.attempts += 1
+                try:
+                    result.output, result.first_token_latency = await call(
+                        user_input, idempotency_key
+                    )
+                    break
+                except AgentClientError as e:
+                    if not e.retryable or result.attempts > max_retries:
+                        result.error = str(e)
+                        break
+                    cap = min(max_backoff, backoff * 2 ** (result.attempts - 1))
+                    await asyncio.sleep(max(random.uniform(0, cap), e.retry_after or 0))
+                except Exception as e:
+                    result.error = str(e)
+                    break
+            result.latency = time.monotonic() - started
+            return result
+
+        async def worker() -> None:
+            for index, user_input in pending:
+                await results.put(await run_one(index, user_input))
+
+        workers = [asyncio.create_task(worker()) for _ in range(min(concurrency, len(inputs)))]
+        try:
+            for _ in range(len(inputs)):
+                yield await results.get()
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    async def ainvoke_many(
+        self,
+        inputs: list[str | UserInput],
+        model: str | None = None,
+        concurrency: int = 4,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 30.0,
+    ) -> AsyncGenerator[FanOutResult, None]:
+        """invokes the agent once per input, yielding results as they complete.
+
+        unlike abatch, every input is its own /invoke request, so each one is
+        retried on its own and reports its own latency. `index` points back into
+        `inputs`; a failed input has `error` set instead of `output`.
+        """
+        await self._aload_agent()
+        user_inputs = self._fan_out_inputs(inputs, model)
+
+        async def call(user_input: UserInput, key: str) -> tuple[ChatMessage, None]:
+            output = await self.ainvoke(
+                user_input.message,
+                user_input.model,
+                user_input.thread_id,
+                user_input.agent_config,
+                idempotency_key=key,
+            )
+            return output, None
+
+        results = self._fan_out(user_inputs, call, concurrency, max_retries, backoff, max_backoff)
+        async with aclosing(results):
+            async for result in results:
+                yield result
+
+    async def astream_many(
+        self,
+        inputs: list[str | UserInput],
+        model: str | None = None,
+        concurrency: int = 4,
+        stream_tokens: bool = True,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 30.0,
+    ) -> AsyncGenerator[FanOutResult, None]:
+        """streams the agent once per input, yielding each input's final message as it completes.
+
+        like ainvoke_many, but also reports `first_token_latency`, the time to the
+        first token (or message, without `stream_tokens`) of the successful attempt.
+        an error reported inside the stream is not retried, the agent has already
+        run by then.
+        """
+        await self._aload_agent()
+        user_inputs = self._fan_out_inputs(inputs, model)
+
+        async def call(user_input: UserInput, key: str) -> tuple[ChatMessage, float | None]:
+            started = time.monotonic()
+            first_token_latency = None
+            output = None
+            async for event in self.astream(
+                user_input.message,
+                user_input.model,
+                user_input.thread_id,
+                user_input.agent_config,
+                stream_tokens=stream_tokens,
+                idempotency_key=key,
+            ):
+                if first_token_latency is None:
+                    first_token_latency = time.monotonic() - started
+                if isinstance(event, ChatMessage):
+                    output = event
+            if output is None:
+                raise AgentClientError("Stream ended without a message")
+            return output, first_token_latency
+
+        results = self._fan_out(user_inputs, call, concurrency, max_retries, backoff, max_backoff)
+        async with aclosing(results):
+            async for result in results:
+                yield result
+
+    @asynccontextmanager
+    async def asession(self, thread_id: str | None = None) -> AsyncGenerator[AgentSession, None]:
+        """opens a websocket session for many turns of one thread without per-turn setup."""
+        await self._aload_agent()
+        if not self.agent:
+            raise AgentClientError("No agent selected. Use update_agent() to select an agent.")
+        url = httpx.URL(f"{self.base_url}/{self.agent}/session")
+        url = url.copy_with(scheme="wss" if url.scheme == "https" else "ws")
+        if thread_id:
+            url = url.copy_merge_params({"thread_id": thread_id})
+        try:
+            websocket = await websockets.connect(
+                str(url), extra_headers=self._headers, open_timeout=self.timeout
+            )
+        except (OSError, websockets.WebSocketException) as e:
+            raise AgentClientError(f"Error opening session: {e}")
+        session = AgentSession(websocket, thread_id or "")
+        try:
+            frame = await session._recv()
+            session.thread_id = frame["thread_id"]
+            yield session
+        finally:
+            await session.close()
 
     async def acreate_feedback(
         self, run_id: str, key: str, score: float, kwargs: dict[str, Any] = {}
     ) -> None:
         """sends feedback to langsmith via agent service."""
         request = Feedback(run_id=run_id, key=key, score=score, kwargs=kwargs)
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
-                    f"{self.base_url}/feedback",
-                    json=request.model_dump(),
-                    headers=self._headers,
-                    timeout=self.timeout,
-                )
-                response.raise_for_status()
-                response.json()
-            except httpx.HTTPError as e:
-                raise AgentClientError(f"Error: {e}")
+        try:
+            response = await self._async_client().post(
+                f"{self.base_url}/feedback",
+                json=request.model_dump(),
+                headers=self._headers,
+                timeout=self.timeout,
+            )
+            response.raise_for_status()
+            response.json()
+        except httpx.HTTPError as e:
+            raise AgentClientError.from_http_error(e)
 
     def get_history(
         self,
         thread_id: str,
+        since: int | None = None,
+        limit: int | None = None,
+        cursor: str | None = None,
+        compact: bool = False,
     ) -> ChatHistory:
-        """gets chat history for a conversation thread."""
-        request = ChatHistoryInput(thread_id=thread_id)
+        """gets chat history for a conversation thread, optionally only new messages."""
+        request = ChatHistoryInput(
+            thread_id=thread_id, since=since, limit=limit, cursor=cursor, compact=compact
+        )
         try:
-            response = httpx.post(
+            response = self._sync_client().post(
                 f"{self.base_url}/history",
                 json=request.model_dump(),
                 headers=self._headers,
@@ -267,6 +882,165 @@ class AgentClient:
             )
             response.raise_for_status()
         except httpx.HTTPError as e:
-            raise AgentClientError(f"Error: {e}")
+            raise AgentClientError.from_http_error(e)
+
+        return ChatHistory.model_validate(response.json())
+
+    async def aget_history(
+        self,
+        thread_id: str,
+        since: int | None = None,
+        limit: int | None = None,
+        cursor: str | None = None,
+        compact: bool = False,
+    ) -> ChatHistory:
+        """async version of get_history."""
+        request = ChatHistoryInput(
+            thread_id=thread_id, since=since, limit=limit, cursor=cursor, compact=compact
+        )
+        try:
+            response = await self._async_client().post(
+                f"{self.base_url}/history",
+                json=request.model_dump(),
+                headers=self._headers,
+                timeout=self.timeout,
+            )
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            raise AgentClientError.from_http_error(e)
+
+        return ChatHistory.model_validate(response.json())
+
+    def fork(self, thread_id: str, message_index: int | None = None) -> ForkResponse:
+        """creates a new thread with a copy of the history of `thread_id` up to `message_index`."""
+        request = ForkInput(thread_id=thread_id, message_index=message_index)
+        try:
+            response = self._sync_client().post(
+                f"{self.base_url}/{self.agent}/fork",
+                json=request.model_dump(),
+                headers=self._headers,
+                timeout=self.timeout,
+            )
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            raise AgentClientError.from_http_error(e)
+
+        return ForkResponse.model_validate(response.json())
+
+    async def afork(self, thread_id: str, message_index: int | None = None) -> ForkResponse:
+        """async version of fork."""
+        await self._aload_agent()
+        request = ForkInput(thread_id=thread_id, message_index=message_index)
+        try:
+            response = await self._async_client().post(
+                f"{self.base_url}/{self.agent}/fork",
+                json=request.model_dump(),
+                headers=self._headers,
+                timeout=self.timeout,
+            )
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            raise AgentClientError.from_http_error(e)
+
+        return ForkResponse.model_validate(response.json())
+
+    def _request(self, method: str, path: str, **kwargs: Any) -> httpx.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        try:
+            response = self._sync_client().request(
+                method, f"{self.base_url}{path}", headers=self._headers, **kwargs
+            )
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            raise AgentClientError.from_http_error(e)
+        return response
+
+    async def _arequest(self, method: str, path: str, **kwargs: Any) -> httpx.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        try:
+            response = await self._async_client().request(
+                method, f"{self.base_url}{path}", headers=self._headers, **kwargs
+            )
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            raise AgentClientError.from_http_error(e)
+        return response
+
+    def _job_input(
+        self,
+        message: str,
+        model: str | None,
+        thread_id: str | None,
+        agent_config: dict[str, Any] | None,
+    ) -> UserInput:
+        if not self.agent:
+            raise AgentClientError("No agent selected. Use update_agent() to select an agent.")
+        request = UserInput(message=message)
+        if thread_id:
+            request.thread_id = thread_id
+        if model:
+            request.model = model
+        if agent_config:
+            request.agent_config = agent_config
+        return request
+
+    def submit_job(
+        self,
+        message: str,
+        model: str | None = None,
+        thread_id: str | None = None,
+        agent_config: dict[str, Any] | None = None,
+    ) -> JobStatus:
+        """queues a long running invocation and returns without waiting for it."""
+        request = self._job_input(message, model, thread_id, agent_config)
+        response = self._request("POST", f"/{self.agent}/jobs", json=request.model_dump())
+        return JobStatus.model_validate(response.json())
+
+    async def asubmit_job(
+        self,
+        message: str,
+        model: str | None = None,
+        thread_id: str | None = None,
+        agent_config: dict[str, Any] | None = None,
+    ) -> JobStatus:
+        """async version of submit_job."""
+        await self._aload_agent()
+        request = self._job_input(message, model, thread_id, agent_config)
+        response = await self._arequest("POST", f"/{self.agent}/jobs", json=request.model_dump())
+        return JobStatus.model_validate(response.json())
+
+    def get_job(self, job_id: str, wait: float = 0) -> JobStatus:
+        """gets a job's status, blocking up to `wait` seconds for it to finish."""
+        response = self._request(
+            "GET", f"/jobs/{job_id}", params={"wait": wait}, timeout=self._poll_timeout(wait)
+        )
+        return JobStatus.model_validate(response.json())
+
+    async def aget_job(self, job_id: str, wait: float = 0) -> JobStatus:
+        """async version of get_job."""
+        response = await self._arequest(
+            "GET", f"/jobs/{job_id}", params={"wait": wait}, timeout=self._poll_timeout(wait)
+        )
+        return JobStatus.model_validate(response.json())
+
+    def job_result(self, job_id: str) -> ChatMessage:
+        """gets the final message of a succeeded job."""
+        return ChatMessage.model_validate(self._request("GET", f"/jobs/{job_id}/result").json())
+
+    async def ajob_result(self, job_id: str) -> ChatMessage:
+        """async version of job_result."""
+        response = await self._arequest("GET", f"/jobs/{job_id}/result")
+        return ChatMessage.model_validate(response.json())
+
+    def cancel_job(self, job_id: str) -> JobStatus:
+        """cancels a queued or running job."""
+        return JobStatus.model_validate(self._request("POST", f"/jobs/{job_id}/cancel").json())
+
+    async def acancel_job(self, job_id: str) -> JobStatus:
+        """async version of cancel_job."""
+        response = await self._arequest("POST", f"/jobs/{job_id}/cancel")
+        return JobStatus.model_validate(response.json())
 
-        return ChatHistory.model_validate(response.json())
\ No newline at end of file
+    def _poll_timeout(self, wait: float) -> float | None:
+        # a long poll must not be cut short by the client's own timeout
+        return None if self.timeout is None else self.timeout + wait
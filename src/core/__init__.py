@@ -1,4 +1,5 @@
 from core.llm import get_model
+from core.metrics import metrics
 from core.settings import settings
 
-__all__ = ["settings", "get_model"]
+__all__ = ["settings", "get_model", "metrics"]
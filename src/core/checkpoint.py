@@ -0,0 +1,523 @@
+import hashlib
+import itertools
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from collections.abc import AsyncIterator, Callable, Iterator, Sequence
+from contextlib import AsyncExitStack, asynccontextmanager, closing
+from pathlib import Path
+from typing import Any
+
+import aiosqlite
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+)
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+from core.sharding import shard_of
+
+logger = logging.getLogger(__name__)
+
+
+def _sizeof(value: Any) -> int:
+    """rough byte size of the serialized payloads kept by the memory saver."""
+    match value:
+        case bytes() | bytearray() | str():
+            return len(value)
+        case dict():
+            return sum(_sizeof(k) + _sizeof(v) for k, v in value.items())
+        case tuple() | list():
+            return sum(_sizeof(v) for v in value)
+        case _:
+            return 8
+
+
+class BoundedMemorySaver(MemorySaver):
+    """in-memory checkpointer with an lru byte budget and spill-to-disk.
+
+    threads are kept in memory while they fit in `max_bytes`. when the budget
+    is exceeded the least recently used threads are pickled to `spill_dir`
+    and dropped from memory, then loaded back transparently on next access
+    and their file removed.
+    the thread being accessed is never evicted, so a single thread larger than
+    the budget stays resident while in use.
+    """
+
+    def __init__(self, *, max_bytes: int, spill_dir: str | os.PathLike, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.max_bytes = max_bytes
+        self.spill_dir = Path(spill_dir)
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        # thread id -> approximate resident bytes, ordered from least to most recently used
+        self._resident: OrderedDict[str, int] = OrderedDict()
+        # thread id -> its keys in self.writes, so a thread's writes are found without a scan
+        self._write_keys: defaultdict[str, set[tuple[str, str, str]]] = defaultdict(set)
+        # threads on disk, a spill file starts with its thread id so only that is read here
+        self._spilled: set[str] = set()
+        for path in self.spill_dir.glob("*.tmp"):
+            # a spill cut short, the thread was still in memory when it happened
+            path.unlink()
+        for path in self.spill_dir.glob("*.ckpt"):
+            with path.open("rb") as f:
+                thread_id = pickle.load(f)
+            if isinstance(thread_id, str):
+                self._spilled.add(thread_id)
+            else:
+                # the older single-pickle layout, which can't be loaded back
+                logger.warning(f"Removing unreadable checkpoint spill file {path}")
+                path.unlink()
+
+    @property
+    def resident_bytes(self) -> int:
+        """approximate bytes currently held in memory."""
+        return sum(self._resident.values())
+
+    def _spill_path(self, thread_id: str) -> Path:
+        digest = hashlib.sha256(thread_id.encode()).hexdigest()
+        return self.spill_dir / f"{digest}.ckpt"
+
+    def _touch(self, thread_id: str) -> None:
+        """marks a thread as most recently used, loading it back from disk if spilled."""
+        if thread_id in self._resident:
+            self._resident.move_to_end(thread_id)
+            return
+        if thread_id not in self._spilled:
+            return
+        path = self._spill_path(thread_id)
+        with path.open("rb") as f:
+            pickle.load(f)  # the thread id
+            spilled = pickle.load(f)
+        self.storage[thread_id] = defaultdict(dict, spilled["storage"])
+        self.writes.update(spilled["writes"])
+        self._write_keys[thread_id].update(spilled["writes"])
+        path.unlink()
+        self._spilled.discard(thread_id)
+        self._resident[thread_id] = _sizeof(spilled["storage"]) + sum(
+            _sizeof(writes) for writes in spilled["writes"].values()
+        )
+
+    def _drop_read_leftovers(self, thread_id: str, results: Sequence[CheckpointTuple]) -> None:
+        """drops the empty entries MemorySaver's defaultdicts create on reads.
+
+        they would escape the byte budget and keep unknown thread ids around.
+        """
+        for result in results:
+            for config in (result.config, result.parent_config):
+                if config is None:
+                    continue
+                configurable = config["configurable"]
+                key = (
+                    thread_id,
+                    configurable.get("checkpoint_ns", ""),
+                    configurable["checkpoint_id"],
+                )
+                if not self.writes.get(key, True):
+                    del self.writes[key]
+        storage = self.storage.get(thread_id)
+        if storage is None:
+            return
+        for checkpoint_ns in [ns for ns, checkpoints in storage.items() if not checkpoints]:
+            del storage[checkpoint_ns]
+        if not storage:
+            del self.storage[thread_id]
+
+    def _account(self, thread_id: str, grown: int = 0) -> None:
+        """adds what a thread grew by to its size and evicts others until back under budget."""
+        if thread_id in self.storage:
+            self._resident[thread_id] = self._resident.get(thread_id, 0) + grown
+            self._resident.move_to_end(thread_id)
+        total = self.resident_bytes
+        while total > self.max_bytes and len(self._resident) > 1:
+            victim, size = next(iter(self._resident.items()))
+            if victim == thread_id:
+                break
+            self._spill(victim)
+            total -= size
+
+    def _spill(self, thread_id: str) -> None:
+        """writes a thread to the local file store and drops it from memory."""
+        self._resident.pop(thread_id, None)
+        storage = self.storage.pop(thread_id, {})
+        writes = {key: self.writes.pop(key, {}) for key in self._write_keys.pop(thread_id, ())}
+        if not any(storage.values()):
+            return
+        spilled = {
+            "storage": {ns: dict(checkpoints) for ns, checkpoints in storage.items()},
+            "writes": {key: value for key, value in writes.items() if value},
+        }
+        path = self._spill_path(thread_id)
+        tmp_path = path.with_suffix(".tmp")
+        with tmp_path.open("wb") as f:
+            pickle.dump(thread_id, f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(spilled, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        self._spilled.add(thread_id)
+        logger.debug(f"Spilled checkpoint thread {thread_id} to {path}")
+
+    def get_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        thread_id = config["configurable"]["thread_id"]
+        with self._lock:
+            self._touch(thread_id)
+            result = super().get_tuple(config)
+            self._drop_read_leftovers(thread_id, [result] if result else [])
+            self._account(thread_id)
+            return result
+
+    def list(
+        self, config: RunnableConfig | None, *, limit: int | None = None, **kwargs: Any
+    ) -> Iterator[CheckpointTuple]:
+        if config is None:
+            # walk resident and spilled threads one at a time so the budget still holds,
+            # `limit` counts over all of them
+            with self._lock:
+                thread_ids = list(self._resident) + list(self._spilled)
+            remaining = limit
+            for thread_id in thread_ids:
+                if remaining is not None and remaining <= 0:
+                    return
+                for item in self.list(
+                    {"configurable": {"thread_id": thread_id}}, limit=remaining, **kwargs
+                ):
+                    yield item
+                    if remaining is not None:
+                        remaining -= 1
+            return
+        thread_id = config["configurable"]["thread_id"]
+        with self._lock:
+            self._touch(thread_id)
+            results = list(super().list(config, limit=limit, **kwargs))
+            self._drop_read_leftovers(thread_id, results)
+            self._account(thread_id)
+        yield from results
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        checkpoint_id = checkpoint["id"]
+        with self._lock:
+            self._touch(thread_id)
+            # sized like _sizeof(self.storage[thread_id]), counting only what this put changes
+            grown = 0 if checkpoint_ns in self.storage[thread_id] else _sizeof(checkpoint_ns)
+            checkpoints = self.storage[thread_id][checkpoint_ns]
+            if checkpoint_id in checkpoints:
+                grown -= _sizeof({checkpoint_id: checkpoints[checkpoint_id]})
+            result = super().put(config, checkpoint, metadata, new_versions)
+            grown += _sizeof({checkpoint_id: checkpoints[checkpoint_id]})
+            self._account(thread_id, grown)
+            return result
+
+    def put_writes(
+        self, config: RunnableConfig, writes: Sequence[tuple[str, Any]], task_id: str
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        configurable = config["configurable"]
+        key = (thread_id, configurable["checkpoint_ns"], configurable["checkpoint_id"])
+        with self._lock:
+            self._touch(thread_id)
+            before = _sizeof(self.writes.get(key, {}))
+            super().put_writes(config, writes, task_id)
+            self._write_keys[thread_id].add(key)
+            self._account(thread_id, _sizeof(self.writes.get(key, {})) - before)
+
+
+def shard_paths(path: str, shards: int) -> list[str]:
+    """the sqlite files of a store split in `shards`, e.g. checkpoints.s0.db, checkpoints.s1.db.
+
+    a single shard keeps the plain path, so unsharded stores need no migration.
+    """
+    if shards <= 1:
+        return [path]
+    stem, dot, suffix = path.rpartition(".")
+    if not dot:
+        return [f"{path}.s{shard}" for shard in range(shards)]
+    return [f"{stem}.s{shard}.{suffix}" for shard in range(shards)]
+
+
+def checkpoint_shard(thread_id: str, shards: int) -> int:
+    # its own namespace, the threads routed to one worker must not all land in one shard
+    return shard_of(thread_id, shards, namespace="checkpoint:")
+
+
+def checkpoint_path(thread_id: str, worker_paths: list[str], shards: int) -> str:
+    """the file holding a thread in a pod whose workers keep `worker_paths`, split in `shards`."""
+    owner = worker_paths[shard_of(thread_id, len(worker_paths))]
+    return shard_paths(owner, shards)[checkpoint_shard(thread_id, shards)]
+
+
+class _Shard:
+    """one sqlite file, with the only connection writing to it and a few reading ones."""
+
+    def __init__(self, writer: AsyncSqliteSaver, readers: list[AsyncSqliteSaver]) -> None:
+        self.writer = writer
+        self.readers = readers or [writer]
+        self._next_reader = itertools.cycle(self.readers)
+
+    def reader(self) -> AsyncSqliteSaver:
+        return next(self._next_reader)
+
+
+class ShardedSqliteSaver(BaseCheckpointSaver):
+    """async sqlite checkpointer spread over several files by thread_id.
+
+    a sqlite file takes one writer at a time, even in wal mode, so a single
+    file caps checkpoint writes no matter how many runs are in flight. each
+    shard here is its own file with its own writing connection, plus reading
+    connections that wal lets run alongside it. a thread always lives in
+    shard checkpoint_shard(thread_id, shards); run_rebalance.py moves threads
+    over when the number of shards changes.
+    """
+
+    def __init__(self, shards: list[_Shard]) -> None:
+        super().__init__(serde=shards[0].writer.serde)
+        self.shards = shards
+
+    @classmethod
+    @asynccontextmanager
+    async def open(
+        cls, path: str, *, shards: int, readers: int
+    ) -> AsyncIterator["ShardedSqliteSaver"]:
+        async with AsyncExitStack() as stack:
+            opened = []
+            for shard_path in shard_paths(path, shards):
+                writer = await stack.enter_async_context(
+                    AsyncSqliteSaver.from_conn_string(shard_path)
+                )
+                # the writer creates the tables and turns on wal, readers only query them
+                await writer.setup()
+                shard_readers = []
+                for _ in range(readers):
+                    conn = await stack.enter_async_context(aiosqlite.connect(shard_path))
+                    reader = AsyncSqliteSaver(conn)
+                    reader.is_setup = True
+                    shard_readers.append(reader)
+                opened.append(_Shard(writer, shard_readers))
+            yield cls(opened)
+
+    def _shard(self, config: RunnableConfig) -> _Shard:
+        thread_id = str(config["configurable"]["thread_id"])
+        return self.shards[checkpoint_shard(thread_id, len(self.shards))]
+
+    def get_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        return self._shard(config).reader().get_tuple(config)
+
+    def list(
+        self, config: RunnableConfig | None, *, limit: int | None = None, **kwargs: Any
+    ) -> Iterator[CheckpointTuple]:
+        if config is not None:
+            yield from self._shard(config).reader().list(config, limit=limit, **kwargs)
+            return
+        # without a thread the shards are walked one after the other
+        remaining = limit
+        for shard in self.shards:
+            if remaining is not None and remaining <= 0:
+                return
+            for item in shard.reader().list(None, limit=remaining, **kwargs):
+                yield item
+                if remaining is not None:
+                    remaining -= 1
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return self._shard(config).writer.put(config, checkpoint, metadata, new_versions)
+
+    def put_writes(
+        self, config: RunnableConfig, writes: Sequence[tuple[str, Any]], task_id: str
+    ) -> None:
+        self._shard(config).writer.put_writes(config, writes, task_id)
+
+    async def aget_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        return await self._shard(config).reader().aget_tuple(config)
+
+    async def alist(
+        self, config: RunnableConfig | None, *, limit: int | None = None, **kwargs: Any
+    ) -> AsyncIterator[CheckpointTuple]:
+        if config is not None:
+            async for item in self._shard(config).reader().alist(config, limit=limit, **kwargs):
+                yield item
+            return
+        remaining = limit
+        for shard in self.shards:
+            if remaining is not None and remaining <= 0:
+                return
+            async for item in shard.reader().alist(None, limit=remaining, **kwargs):
+                yield item
+                if remaining is not None:
+                    remaining -= 1
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await self._shard(config).writer.aput(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self, config: RunnableConfig, writes: Sequence[tuple[str, Any]], task_id: str
+    ) -> None:
+        await self._shard(config).writer.aput_writes(config, writes, task_id)
+
+    def get_next_version(self, current: str | None, channel: Any) -> str:
+        return self.shards[0].writer.get_next_version(current, channel)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        """drops every checkpoint and pending write of a thread."""
+        writer = self._shard({"configurable": {"thread_id": thread_id}}).writer
+        async with writer.lock:
+            for table in ("checkpoints", "writes"):
+                await writer.conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+            await writer.conn.commit()
+
+    async def flush(self) -> None:
+        """folds each shard's wal back into its database file, on shutdown."""
+        for shard in self.shards:
+            writer = shard.writer
+            async with writer.lock, writer.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)"):
+                pass
+
+    async def warm(self) -> None:
+        """runs a query on every connection, so the first requests don't open files and caches."""
+        for shard in self.shards:
+            for saver in dict.fromkeys([shard.writer, *shard.readers]):
+                async with saver.lock, saver.conn.execute("SELECT 1 FROM checkpoints LIMIT 1"):
+                    pass
+
+
+def _move_threads(
+    sources: list[str],
+    targets: list[str],
+    place: Callable[[str], str],
+    batch_size: int,
+    dry_run: bool,
+) -> dict[str, int]:
+    """moves every thread found in `sources` to the file `place(thread_id)` among `targets`."""
+    moved: Counter[str] = Counter()
+    if not dry_run:
+        for target in targets:
+            with closing(sqlite3.connect(target)) as conn:
+                SqliteSaver(conn).setup()
+    for source in sources:
+        if not os.path.exists(source):
+            continue
+        with closing(sqlite3.connect(source)) as conn:
+            moves = defaultdict(list)
+            for (thread_id,) in conn.execute(
+                "SELECT thread_id FROM checkpoints UNION SELECT thread_id FROM writes"
+            ):
+                target = place(thread_id)
+                if target != source:
+                    moves[target].append(thread_id)
+            for target, thread_ids in moves.items():
+                moved[target] += len(thread_ids)
+                if dry_run:
+                    continue
+                conn.execute("ATTACH DATABASE ? AS target", (target,))
+                try:
+                    for start in range(0, len(thread_ids), batch_size):
+                        batch = thread_ids[start : start + batch_size]
+                        marks = ",".join("?" * len(batch))
+                        with conn:
+                            for table in ("checkpoints", "writes"):
+                                conn.execute(
+                                    f"INSERT OR REPLACE INTO target.{table} "
+                                    f"SELECT * FROM main.{table} WHERE thread_id IN ({marks})",
+                                    batch,
+                                )
+                        with conn:
+                            for table in ("checkpoints", "writes"):
+                                conn.execute(
+                                    f"DELETE FROM main.{table} WHERE thread_id IN ({marks})", batch
+                                )
+                finally:
+                    conn.execute("DETACH DATABASE target")
+    return dict(moved)
+
+
+def rebalance_shards(
+    path: str, old: int, new: int, *, batch_size: int = 500, dry_run: bool = False
+) -> dict[str, int]:
+    """moves every thread of a store split in `old` shards to its file among `new` shards.
+
+    meant to run offline, with the service stopped. each batch of threads is
+    committed to its new file before it is deleted from the old one, so an
+    interrupted run loses nothing and can simply be started again.
+    returns the number of threads moved into each file.
+    """
+    targets = shard_paths(path, new)
+    return _move_threads(
+        shard_paths(path, old),
+        targets,
+        lambda thread_id: targets[checkpoint_shard(thread_id, new)],
+        batch_size,
+        dry_run,
+    )
+
+
+def rebalance_workers(
+    old_paths: list[str],
+    new_paths: list[str],
+    shards: int,
+    *,
+    batch_size: int = 500,
+    dry_run: bool = False,
+) -> dict[str, int]:
+    """moves every thread to the checkpoint files of the worker owning it after WORKERS changes.
+
+    `old_paths` and `new_paths` hold each worker's checkpoint file, indexed by
+    worker id, before and after the change; both are split in `shards`. like
+    rebalance_shards it runs offline and can be started again if interrupted.
+    """
+
+    return _move_threads(
+        [source for path in old_paths for source in shard_paths(path, shards)],
+        [target for path in new_paths for target in shard_paths(path, shards)],
+        lambda thread_id: checkpoint_path(thread_id, new_paths, shards),
+        batch_size,
+        dry_run,
+    )
+
+
+def misplaced_checkpoint_files(
+    files: list[str], worker_paths: list[str], shards: int, sample: int = 100
+) -> list[str]:
+    """the sqlite files among `files` holding threads that belong in another file.
+
+    only a sample of each file's threads is checked, enough to notice a
+    store laid out for another worker or shard count. empty files, e.g. the
+    ones left behind by a rebalance, never count.
+    """
+    misplaced = []
+    for path in files:
+        with closing(sqlite3.connect(f"file:{path}?mode=ro", uri=True)) as conn:
+            try:
+                rows = conn.execute(
+                    "SELECT DISTINCT thread_id FROM checkpoints LIMIT ?", (sample,)
+                ).fetchall()
+            except sqlite3.Error:
+                continue
+        if any(checkpoint_path(thread_id, worker_paths, shards) != path for (thread_id,) in rows):
+            misplaced.append(path)
+    return misplaced
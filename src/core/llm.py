@@ -1,16 +1,23 @@
+import importlib.util
+import threading
+import time
+from collections.abc import AsyncIterator, Callable, Iterator, Sequence
+from contextlib import contextmanager
+from contextvars import ContextVar
 from functools import cache
-from typing import TypeAlias
+from typing import TYPE_CHECKING, Any, TypeAlias
 
-from langchain_community.chat_models import FakeListChatModel
-from langchain_groq import ChatGroq
-from langchain_openai import ChatOpenAI
+import httpx
+from langchain_core.language_models import FakeListChatModel
 
-from core.settings import settings
+from core.metrics import metrics
+from core.settings import HttpTuning, settings
 from schema.models import (
     AllModelEnum,
     FakeModelName,
     GroqModelName,
     OpenAIModelName,
+    Provider,
 )
 
 # maps our model names to provider-specific model identifiers
@@ -24,17 +31,222 @@ _MODEL_TABLE = {
     FakeModelName.FAKE: "fake",
 }
 
-ModelT: TypeAlias = ChatOpenAI | ChatGroq 
+# provider packages take most of the service's import time, they are imported the
+# first time one of their models is requested instead
+if TYPE_CHECKING:
+    from langchain_groq import ChatGroq
+    from langchain_openai import ChatOpenAI
+
+ModelT: TypeAlias = "ChatOpenAI | ChatGroq"
 """allowed model types returned by this factory"""
 
 
+class PoolMeter:
+    """tracks the requests in flight on one provider pool and reports its utilization.
+
+    a request counts as in flight until its response body is closed, so
+    streamed answers hold their connection for as long as they stream.
+    reported as the gauges llm.http.<pool>.{in_flight,connections,idle,utilization},
+    where a utilization above 1 means requests are queueing for a connection.
+    """
+
+    def __init__(self, name: str, max_connections: int, pool: Any) -> None:
+        self.name = name
+        self.max_connections = max_connections
+        self.pool = pool  # the httpcore connection pool under the transport
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def _report(self) -> None:
+        connections = self.pool.connections
+        prefix = f"llm.http.{self.name}"
+        metrics.gauge(f"{prefix}.in_flight", self.in_flight)
+        metrics.gauge(f"{prefix}.connections", len(connections))
+        metrics.gauge(f"{prefix}.idle", sum(1 for c in connections if c.is_idle()))
+        metrics.gauge(f"{prefix}.utilization", self.in_flight / self.max_connections)
+
+    def start(self) -> Callable[[], None]:
+        """marks a request in flight, returns the callback that ends it (once)."""
+        with self._lock:
+            self.in_flight += 1
+            self._report()
+        metrics.incr(f"llm.http.{self.name}.requests")
+        started = time.perf_counter()
+        done = False
+
+        def finish() -> None:
+            nonlocal done
+            if done:
+                return
+            done = True
+            with self._lock:
+                self.in_flight -= 1
+                self._report()
+            metrics.observe(f"llm.http.{self.name}.seconds", time.perf_counter() - started)
+
+        return finish
+
+
+class _MeteredStream(httpx.SyncByteStream, httpx.AsyncByteStream):
+    def __init__(self, stream: Any, finish: Callable[[], None]) -> None:
+        self._stream = stream
+        self._finish = finish
+
+    def __iter__(self) -> Iterator[bytes]:
+        yield from self._stream
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            yield chunk
+
+    def close(self) -> None:
+        try:
+            self._stream.close()
+        finally:
+            self._finish()
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            self._finish()
+
+
+class _MeteredTransport(httpx.BaseTransport):
+    def __init__(self, transport: httpx.HTTPTransport, meter: PoolMeter) -> None:
+        self._transport = transport
+        self._meter = meter
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        finish = self._meter.start()
+        try:
+            response = self._transport.handle_request(request)
+        except BaseException:
+            finish()
+            raise
+        response.stream = _MeteredStream(response.stream, finish)
+        return response
+
+    def close(self) -> None:
+        self._transport.close()
+
+
+class _AsyncMeteredTransport(httpx.AsyncBaseTransport):
+    def __init__(self, transport: httpx.AsyncHTTPTransport, meter: PoolMeter) -> None:
+        self._transport = transport
+        self._meter = meter
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        finish = self._meter.start()
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            finish()
+            raise
+        response.stream = _MeteredStream(response.stream, finish)
+        return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+# providers without overrides share one pool, so idle connections serve all of them
+_SHARED_POOL = "shared"
+
+
+def _pool_of(provider: Provider) -> str:
+    return str(provider) if provider in settings.LLM_HTTP_OVERRIDES else _SHARED_POOL
+
+
+def _tuning(pool: str) -> HttpTuning:
+    """the LLM_HTTP_* defaults with the pool's provider overrides applied."""
+    defaults = HttpTuning(
+        max_connections=settings.LLM_HTTP_MAX_CONNECTIONS,
+        max_keepalive=settings.LLM_HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=settings.LLM_HTTP_KEEPALIVE_EXPIRY,
+        connect_timeout=settings.LLM_HTTP_CONNECT_TIMEOUT,
+        read_timeout=settings.LLM_HTTP_READ_TIMEOUT,
+        http2=settings.LLM_HTTP2,
+    )
+    override = settings.LLM_HTTP_OVERRIDES.get(pool)
+    if override is None:
+        return defaults
+    return defaults.model_copy(update=override.model_dump(exclude_none=True))
+
+
 @cache
+def _http_clients(pool: str) -> tuple[httpx.Client, httpx.AsyncClient]:
+    tuning = _tuning(pool)
+    limits = httpx.Limits(
+        max_connections=tuning.max_connections,
+        max_keepalive_connections=tuning.max_keepalive,
+        keepalive_expiry=tuning.keepalive_expiry,
+    )
+    timeout = httpx.Timeout(tuning.read_timeout, connect=tuning.connect_timeout)
+    # http/2 multiplexes concurrent requests over one connection, when h2 is available
+    http2 = bool(tuning.http2) and importlib.util.find_spec("h2") is not None
+    transport = httpx.HTTPTransport(limits=limits, http2=http2)
+    async_transport = httpx.AsyncHTTPTransport(limits=limits, http2=http2)
+    # the meters read connection counts off the transports' httpcore pools
+    sync_meter = PoolMeter(f"{pool}.sync", tuning.max_connections, transport._pool)
+    async_meter = PoolMeter(pool, tuning.max_connections, async_transport._pool)
+    return (
+        httpx.Client(transport=_MeteredTransport(transport, sync_meter), timeout=timeout),
+        httpx.AsyncClient(
+            transport=_AsyncMeteredTransport(async_transport, async_meter), timeout=timeout
+        ),
+    )
+
+
+def http_clients(provider: Provider) -> tuple[httpx.Client, httpx.AsyncClient]:
+    """the shared sync and async http clients the models of `provider` send requests through."""
+    return _http_clients(_pool_of(provider))
+
+
+def _http_kwargs(provider: Provider) -> dict[str, Any]:
+    client, async_client = http_clients(provider)
+    return {
+        "http_client": client,
+        "http_async_client": async_client,
+        # the sdks apply their own 10 minute timeout to every request unless given one
+        "timeout": async_client.timeout,
+    }
+
+
+class FakeToolCallingModel(FakeListChatModel):
+    """fake model that accepts (and ignores) bound tools, so the agents run in fake mode."""
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any) -> "FakeToolCallingModel":
+        return self
+
+
+# set by fake_models(), seen by everything running in that context (graph nodes included)
+_fake_models: ContextVar[bool] = ContextVar("fake_models", default=False)
+
+
+@contextmanager
+def fake_models() -> Iterator[None]:
+    """makes get_model return the fake model in this context, e.g. for a warm-up graph run."""
+    token = _fake_models.set(True)
+    try:
+        yield
+    finally:
+        _fake_models.reset(token)
+
+
 def get_model(model_name: AllModelEnum, /) -> ModelT:
     """cached factory providing configured model instances.
     
     returns ready-to-use chat model with provider-specific settings.
     cached to avoid redundant model initialization.
     """
+    if _fake_models.get():
+        model_name = FakeModelName.FAKE
+    return _build_model(model_name)
+
+
+@cache
+def _build_model(model_name: AllModelEnum, /) -> ModelT:
     # note: models with streaming=true will send tokens as they are generated
     # if the /stream endpoint is called with stream_tokens=true (the default)
     api_model_name = _MODEL_TABLE.get(model_name)
@@ -43,14 +255,25 @@ def get_model(model_name: AllModelEnum, /) -> ModelT:
 
     # handle openai models with streaming enabled
     if model_name in OpenAIModelName:
-        return ChatOpenAI(model=api_model_name, temperature=0.5, streaming=True)
+        from langchain_openai import ChatOpenAI
+
+        return ChatOpenAI(
+            model=api_model_name,
+            temperature=0.5,
+            streaming=True,
+            **_http_kwargs(Provider.OPENAI),
+        )
     
     # configure groq models with safety model exception
     if model_name in GroqModelName:
+        from langchain_groq import ChatGroq
+
+        http = _http_kwargs(Provider.GROQ)
         if model_name == GroqModelName.LLAMA_GUARD_3_8B:
-            return ChatGroq(model=api_model_name, temperature=0.0)  # safety model needs deterministic
-        return ChatGroq(model=api_model_name, temperature=0.5)
+            # safety model needs deterministic
+            return ChatGroq(model=api_model_name, temperature=0.0, **http)
+        return ChatGroq(model=api_model_name, temperature=0.5, **http)
     
     # simple fake model for testing
     if model_name in FakeModelName:
-        return FakeListChatModel(responses=["This is a test response from the fake model."])
\ No newline at end of file
+        return FakeToolCallingModel(responses=["This is a test response from the fake model."])
\ No newline at end of file
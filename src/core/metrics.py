@@ -0,0 +1,55 @@
+import threading
+from collections import defaultdict
+from typing import Any
+
+
+class Metrics:
+    """in-process counters, gauges and summaries, read through the service's /metrics endpoint.
+
+    names are dotted paths, e.g. "stream.cancelled.disconnect". values are per
+    process and reset on restart.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: defaultdict[str, float] = defaultdict(float)
+        self._gauges: dict[str, float] = {}
+        # name -> [count, sum, max]
+        self._summaries: dict[str, list[float]] = {}
+
+    def incr(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[name] += value
+
+    def gauge(self, name: str, value: float) -> None:
+        """sets a value that goes up and down, such as a queue depth."""
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, value: float) -> None:
+        """records one sample of a distribution, such as a duration in seconds."""
+        with self._lock:
+            summary = self._summaries.setdefault(name, [0, 0.0, value])
+            summary[0] += 1
+            summary[1] += value
+            summary[2] = max(summary[2], value)
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "summaries": {
+                    name: {"count": count, "sum": total, "max": peak}
+                    for name, (count, total, peak) in self._summaries.items()
+                },
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._summaries.clear()
+
+
+metrics = Metrics()
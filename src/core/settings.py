@@ -1,7 +1,15 @@
-from typing import Annotated, Any
+from typing import Annotated, Any, Literal
 
 from dotenv import find_dotenv
-from pydantic import BeforeValidator, HttpUrl, SecretStr, TypeAdapter, computed_field
+from pydantic import (
+    BaseModel,
+    BeforeValidator,
+    HttpUrl,
+    PrivateAttr,
+    SecretStr,
+    TypeAdapter,
+    computed_field,
+)
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 from schema.models import (
@@ -19,6 +27,29 @@ def check_str_is_http(x: str) -> str:
     return str(http_url_adapter.validate_python(x))
 
 
+# provider quota for a model or a whole provider, unset fields are unlimited
+class RateLimit(BaseModel):
+    rpm: int | None = None  # requests per minute
+    tpm: int | None = None  # tokens per minute
+
+    # the part one of `workers` processes may use, so together they stay within the quota
+    def share(self, workers: int) -> "RateLimit":
+        return RateLimit(
+            rpm=None if self.rpm is None else max(self.rpm // workers, 1),
+            tpm=None if self.tpm is None else max(self.tpm // workers, 1),
+        )
+
+
+# http client tuning of one provider, unset fields fall back to the LLM_HTTP_* defaults
+class HttpTuning(BaseModel):
+    max_connections: int | None = None  # connections open at once
+    max_keepalive: int | None = None  # idle connections kept for reuse
+    keepalive_expiry: float | None = None  # seconds an idle connection is kept
+    connect_timeout: float | None = None  # seconds to establish a connection
+    read_timeout: float | None = None  # seconds between bytes of a response
+    http2: bool | None = None  # negotiate http/2, needs the h2 package
+
+
 # settings class to manage environment configuration
 class Settings(BaseSettings):
     model_config = SettingsConfigDict(
@@ -33,15 +64,40 @@ class Settings(BaseSettings):
     HOST: str = "0.0.0.0"  # default host
     PORT: int = 80  # default port
 
+    # with more than one worker, run_service.py starts that many service processes behind a
+    # local router that sends each thread to the worker owning its checkpoint shard
+    WORKERS: int = 1  # service worker processes
+    WORKER_BASE_PORT: int = 8100  # workers listen on 127.0.0.1 from this port up
+    WORKER_ID: int | None = None  # set by run_service.py in each worker process
+    EVENT_LOOP: Literal["auto", "asyncio", "uvloop"] = "auto"  # auto uses uvloop if installed
+
     AUTH_SECRET: SecretStr | None = None  # secret for authentication
 
     OPENAI_API_KEY: SecretStr | None = None  # openai api key
     GROQ_API_KEY: SecretStr | None = None  # groq api key
     USE_FAKE_MODEL: bool = False  # flag to use a fake model
 
+    # every provider model sends its requests through one tuned, shared http client
+    LLM_HTTP_MAX_CONNECTIONS: int = 100  # connections open at once
+    LLM_HTTP_MAX_KEEPALIVE: int = 50  # idle connections kept warm for reuse
+    LLM_HTTP_KEEPALIVE_EXPIRY: float = 60.0  # seconds an idle connection is kept
+    LLM_HTTP_CONNECT_TIMEOUT: float = 5.0  # seconds to establish a connection
+    LLM_HTTP_READ_TIMEOUT: float = 120.0  # seconds between bytes, long for streamed answers
+    LLM_HTTP2: bool = True  # negotiate http/2 where the h2 package is installed
+    # providers listed here get a pool of their own (e.g. {"groq": {"max_connections": 20}})
+    LLM_HTTP_OVERRIDES: dict[str, HttpTuning] = {}
+
     # default model to use (can be set in the post-initialization method)
     DEFAULT_MODEL: AllModelEnum | None = None  # type: ignore[assignment]
     AVAILABLE_MODELS: set[AllModelEnum] = set()  # type: ignore[assignment]
+    INFO_MAX_AGE: int = 300  # seconds clients may reuse /info before revalidating it
+
+    # warm-up after startup, /ready answers 503 until it is done
+    PREWARM_TIMEOUT: float = 10.0  # seconds each warm-up step may take
+    PREWARM_GRAPH_PASS: bool = False  # also run the default agent once with the fake model
+    # on SIGTERM new runs get a 503 and /ready turns false while the runs in flight finish
+    SHUTDOWN_DRAIN_TIMEOUT: float = 25.0  # seconds in-flight runs get before they are cancelled
+    SHUTDOWN_FLUSH_TIMEOUT: float = 5.0  # seconds to deliver queued feedback before spilling it
 
     OPENWEATHERMAP_API_KEY: SecretStr | None = None  # openweathermap api key
 
@@ -52,6 +108,64 @@ class Settings(BaseSettings):
     )  # langchain api endpoint
     LANGCHAIN_API_KEY: SecretStr | None = None  # langchain api key
 
+    STREAM_ENGINE: Literal["modes", "events"] = "modes"  # langgraph stream modes or astream_events
+    STREAM_MAX_FRAME_CHARS: int = 512  # coalesced token frames are flushed at this size
+    STREAM_DISCONNECT_POLL: float = 0.5  # seconds between client disconnect checks while streaming
+
+    # resumable streams (StreamInput.resumable) keep a replay buffer clients reattach to
+    STREAM_REPLAY_MAX_FRAMES: int = 1024  # frames kept in memory per run
+    STREAM_REPLAY_SPILL_DIR: str | None = None  # older frames are spilled here, or dropped if unset
+    STREAM_RESUME_GRACE: float = 15.0  # seconds a detached run waits for its client to come back
+    STREAM_RESUME_TTL: float = 60.0  # seconds a finished run stays available for replay
+
+    # admission control in front of the llm providers, overflow fails fast with 429. the limits
+    # are per pod: with several WORKERS each one enforces an even share (see worker_share)
+    ADMISSION_MAX_CONCURRENT: int = 64  # graph runs in flight at once
+    ADMISSION_INTERACTIVE_RESERVE: int = 8  # of those, slots batch and jobs can't take
+    ADMISSION_MAX_QUEUE: int = 128  # interactive requests waiting before new ones get a 429
+    ADMISSION_MAX_WAIT: float = 10.0  # seconds an interactive request may wait for admission
+    ADMISSION_PROMPT_OVERHEAD_TOKENS: int = 1000  # system prompt and history in a token estimate
+    # keyed by model name or provider (e.g. {"groq": {"rpm": 30, "tpm": 6000}}), json in the env
+    RATE_LIMITS: dict[str, RateLimit] = {}
+
+    # requests sent with an Idempotency-Key replay their first result instead of running again
+    IDEMPOTENCY_TTL: float = 3600.0  # seconds a key's result is kept
+    IDEMPOTENCY_MAX_KEYS: int = 10_000  # keys kept before the least recently used are evicted
+    IDEMPOTENCY_MAX_BYTES: int = 64 * 1024 * 1024  # bytes of stored results before evicting
+
+    BATCH_MAX_ITEMS: int = 1000  # inputs accepted by one /batch request
+    BATCH_MAX_CONCURRENCY: int = 8  # inputs of one batch run at once
+    BATCH_ITEM_TIMEOUT: float = 120.0  # max seconds per batch input
+
+    # long running invocations submitted to /jobs
+    JOBS_DB: str = "jobs.db"  # sqlite table of jobs, kept next to the checkpoints
+    JOBS_MAX_WORKERS: int = 2  # jobs running at once, the rest wait queued
+    JOBS_TIMEOUT: float = 1800.0  # max seconds a job may run
+    JOBS_MAX_WAIT: float = 60.0  # longest a status long poll may block, in seconds
+
+    WS_PING_INTERVAL: float = 20.0  # seconds between server pings on websocket sessions
+    WS_PING_TIMEOUT: float = 20.0  # seconds without a pong before a session is closed
+
+    # feedback is queued and flushed to langsmith (or FEEDBACK_LOCAL_PATH without a key) in batches
+    FEEDBACK_QUEUE_SIZE: int = 1000  # queued feedback before new items spill to disk
+    FEEDBACK_BATCH_SIZE: int = 50  # max feedback items per flush
+    FEEDBACK_MAX_RETRIES: int = 3  # retries per batch before spilling it
+    FEEDBACK_RETRY_BACKOFF: float = 0.5  # base seconds of the exponential retry backoff
+    FEEDBACK_SPILL_PATH: str = "feedback_spill.jsonl"  # undelivered feedback, replayed on startup
+    FEEDBACK_LOCAL_PATH: str = "feedback.jsonl"  # local stand-in sink used without langsmith
+
+    CHECKPOINT_DB: str = "checkpoints.db"  # sqlite checkpoint store used by the service
+    # threads are spread by thread_id over this many files (checkpoints.s0.db, ...), each with
+    # its own writer; run src/run_rebalance.py with the service stopped after changing it, or
+    # after changing WORKERS, since every worker keeps the threads it owns in files of its own
+    CHECKPOINT_SHARDS: int = 1
+    _pod_checkpoint_db: str = PrivateAttr(default="")  # CHECKPOINT_DB before the worker suffix
+    CHECKPOINT_SHARD_READERS: int = 2  # read connections per shard, next to its one writer
+
+    # in-memory checkpointer used when the graph runs outside the service lifespan
+    CHECKPOINT_MEMORY_BUDGET_BYTES: int = 64 * 1024 * 1024  # resident bytes before threads spill
+    CHECKPOINT_SPILL_DIR: str = ".checkpoints"  # local file store for evicted threads
+
     # post-initialization method for settings
     def model_post_init(self, __context: Any) -> None:
         # dictionary to hold provider keys
@@ -83,6 +197,37 @@ class Settings(BaseSettings):
                 case _:
                     raise ValueError(f"Unknown provider: {provider}")  # handle unknown provider
 
+        # each worker keeps its own sqlite files, shared ones would serialize every writer
+        self._pod_checkpoint_db = self.CHECKPOINT_DB
+        if self.WORKER_ID is not None:
+            self.CHECKPOINT_DB = self.worker_path(self.CHECKPOINT_DB)
+            self.JOBS_DB = self.worker_path(self.JOBS_DB)
+            self.FEEDBACK_SPILL_PATH = self.worker_path(self.FEEDBACK_SPILL_PATH)
+            # a spill dir of its own too, each worker loads every thread it finds there
+            self.CHECKPOINT_SPILL_DIR = f"{self.CHECKPOINT_SPILL_DIR.rstrip('/')}/w{self.WORKER_ID}"
+
+    # per-worker variant of a file path, e.g. checkpoints.db -> checkpoints.w1.db
+    def worker_path(self, path: str, worker_id: int | None = None) -> str:
+        worker_id = self.WORKER_ID if worker_id is None else worker_id
+        stem, dot, suffix = path.rpartition(".")
+        if not dot:
+            return f"{path}.w{worker_id}"
+        return f"{stem}.w{worker_id}.{suffix}"
+
+    # the variants of a per-worker file path in a pod of `workers`, one worker keeps it plain
+    def pod_paths(self, path: str, workers: int) -> list[str]:
+        if workers <= 1:
+            return [path]
+        return [self.worker_path(path, worker_id) for worker_id in range(workers)]
+
+    # the checkpoint file of every worker in this pod, each split in CHECKPOINT_SHARDS
+    def pod_checkpoint_dbs(self) -> list[str]:
+        return self.pod_paths(self._pod_checkpoint_db, self.WORKERS)
+
+    # one worker's even share of a per-pod limit, at least 1
+    def worker_share(self, value: int) -> int:
+        return max(value // self.WORKERS, 1)
+
     # computed property to generate base url
     @computed_field
     @property
@@ -0,0 +1,33 @@
+import hashlib
+from uuid import UUID, uuid4
+
+
+def _score(key: str, shard: int, namespace: str) -> int:
+    digest = hashlib.blake2b(f"{namespace}{shard}:{key}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def shard_of(key: str, shards: int, namespace: str = "") -> int:
+    """the shard owning `key`, by rendezvous hashing.
+
+    stable across processes and restarts. when `shards` changes only the keys
+    whose highest scoring shard changed move, about 1/shards of them.
+    placements in different namespaces are independent of each other, so keys
+    routed to one worker still spread over all of that worker's shards.
+    """
+    if shards <= 1:
+        return 0
+    return max(range(shards), key=lambda shard: _score(key, shard, namespace))
+
+
+def owned_uuid(shard: int | None, shards: int) -> UUID:
+    """a fresh uuid that `shard_of` assigns to `shard`, so whoever created it owns it.
+
+    takes `shards` draws on average; without sharding it is a plain uuid4.
+    """
+    if shard is None or shards <= 1:
+        return uuid4()
+    while True:
+        candidate = uuid4()
+        if shard_of(str(candidate), shards) == shard:
+            return candidate
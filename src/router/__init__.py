@@ -0,0 +1,3 @@
+from router.router import create_router, route_key
+
+__all__ = ["create_router", "route_key"]
@@ -0,0 +1,419 @@
+import asyncio
+import itertools
+import logging
+import re
+import signal
+from collections.abc import AsyncGenerator, Callable, Mapping
+from contextlib import asynccontextmanager
+from types import FrameType
+from typing import Any
+
+import httpx
+import orjson
+import websockets
+from starlette.applications import Starlette
+from starlette.background import BackgroundTask
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route, WebSocketRoute
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+from core.sharding import shard_of
+
+logger = logging.getLogger(__name__)
+
+# ids in the path that were created by, and so hash to, the worker holding their state
+_OWNED_PATHS = (
+    re.compile(r"^/stream/(?P<key>[^/]+)$"),  # resumable stream runs
+    re.compile(r"^/jobs/(?P<key>[^/]+)(/.*)?$"),  # jobs and their events and results
+)
+
+# connection-level headers that must not be forwarded by a proxy
+_HOP_BY_HOP = {
+    "connection",
+    "keep-alive",
+    "proxy-connection",
+    "te",
+    "trailer",
+    "transfer-encoding",
+    "upgrade",
+    "host",
+}
+
+_METHODS = ["GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"]
+
+
+def batch_owners(body: bytes, workers: int) -> dict[int, list[int]] | None:
+    """the input indexes of a /batch body grouped by the worker owning their thread.
+
+    inputs without a thread_id start a new thread on whichever worker runs
+    them, so they join the first group. None when the body isn't a batch or
+    a single worker owns all of it.
+    """
+    try:
+        inputs = orjson.loads(body).get("inputs")
+    except (orjson.JSONDecodeError, AttributeError):
+        return None
+    if not isinstance(inputs, list):
+        return None
+    owners: dict[int, list[int]] = {}
+    unowned = []
+    for index, item in enumerate(inputs):
+        thread_id = item.get("thread_id") if isinstance(item, dict) else None
+        if thread_id:
+            owners.setdefault(shard_of(str(thread_id), workers), []).append(index)
+        else:
+            unowned.append(index)
+    if len(owners) <= 1:
+        return None
+    first = next(iter(owners.values()))
+    first.extend(unowned)
+    first.sort()
+    return owners
+
+
+def route_key(
+    path: str, query: Mapping[str, str], headers: Mapping[str, str], body: bytes
+) -> str | None:
+    """the key that decides which worker serves a request, None if any worker can.
+
+    a thread_id (in the json body or the query) wins, so every request of a
+    conversation reaches the worker owning its checkpoint shard. otherwise
+    the run or job id in the path, then the Idempotency-Key, so retries find
+    the worker that remembers them. a batch goes to the worker owning the
+    threads of its inputs; AffinityRouter splits batches spanning several.
+    """
+    if thread_id := query.get("thread_id"):
+        return thread_id
+    if body[:1] == b"{":
+        try:
+            data = orjson.loads(body)
+        except orjson.JSONDecodeError:
+            data = {}
+        if thread_id := data.get("thread_id"):
+            return str(thread_id)
+        for item in data.get("inputs") or []:
+            if isinstance(item, dict) and item.get("thread_id"):
+                return str(item["thread_id"])
+    for pattern in _OWNED_PATHS:
+        if match := pattern.match(path):
+            return match.group("key")
+    return headers.get("idempotency-key")
+
+
+def merge_metrics(snapshots: list[dict]) -> dict:
+    """the pod's metrics from each worker's /metrics snapshot.
+
+    counters and gauges (queue depths, running slots) are summed, summaries
+    add their counts and sums and keep the highest max.
+    """
+    counters: dict[str, float] = {}
+    gauges: dict[str, float] = {}
+    summaries: dict[str, dict[str, float]] = {}
+    for snapshot in snapshots:
+        for name, value in snapshot.get("counters", {}).items():
+            counters[name] = counters.get(name, 0) + value
+        for name, value in snapshot.get("gauges", {}).items():
+            gauges[name] = gauges.get(name, 0) + value
+        for name, summary in snapshot.get("summaries", {}).items():
+            merged = summaries.setdefault(name, {"count": 0, "sum": 0.0, "max": summary["max"]})
+            merged["count"] += summary["count"]
+            merged["sum"] += summary["sum"]
+            merged["max"] = max(merged["max"], summary["max"])
+    return {"counters": counters, "gauges": gauges, "summaries": summaries}
+
+
+class AffinityRouter:
+    """forwards requests to service workers, keeping each thread on the worker that owns it.
+
+    workers create thread, run and job ids that hash to themselves (see
+    core.sharding.owned_uuid), so `shard_of` over the same worker count sends
+    every follow-up request back to them. requests without a key are spread
+    round robin. responses are streamed through as they arrive, and a client
+    that disconnects closes the upstream request so the worker cancels its run.
+
+    with `stop_workers`, SIGTERM is held back from the server like the workers'
+    own GracefulShutdown does: the router keeps listening, its /ready answers
+    503, and `stop_workers` has the workers drain and exit before the router
+    stops too. a second SIGTERM stops it right away.
+    """
+
+    def __init__(
+        self, worker_urls: list[str], stop_workers: Callable[[], None] | None = None
+    ) -> None:
+        self.worker_urls = worker_urls
+        self.stop_workers = stop_workers
+        self.draining = False
+        self._next = itertools.cycle(range(len(worker_urls)))
+        self._client: httpx.AsyncClient | None = None
+        self._previous: Any = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._task: asyncio.Task | None = None
+
+    def worker_for(self, key: str | None) -> str:
+        index = next(self._next) if key is None else shard_of(key, len(self.worker_urls))
+        return self.worker_urls[index]
+
+    @asynccontextmanager
+    async def lifespan(self, app: Starlette) -> AsyncGenerator[None, None]:
+        # no read timeout: streams and long polls stay open as long as the worker keeps them
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(None, connect=5.0),
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=100),
+        )
+        # the server installed its signal handlers before the lifespan, take SIGTERM over
+        if self.stop_workers is not None:
+            self._loop = asyncio.get_running_loop()
+            self._previous = signal.getsignal(signal.SIGTERM)
+            signal.signal(signal.SIGTERM, self._on_sigterm)
+        try:
+            yield
+        finally:
+            if self._previous is not None:
+                signal.signal(signal.SIGTERM, self._previous)
+                self._previous = None
+            await self._client.aclose()
+
+    def _on_sigterm(self, signum: int, frame: FrameType | None) -> None:
+        if self._task is not None:
+            logger.warning("SIGTERM while the workers drain, stopping now")
+            self._hand_over(signum, frame)
+            return
+        self._loop.call_soon_threadsafe(self._start, signum, frame)
+
+    def _start(self, signum: int, frame: FrameType | None) -> None:
+        self._task = asyncio.create_task(self._drain_then_stop(signum, frame))
+
+    async def _drain_then_stop(self, signum: int, frame: FrameType | None) -> None:
+        self.draining = True
+        logger.info("Draining the workers")
+        # joining the worker processes blocks, the loop keeps serving /ready and the streams
+        await asyncio.to_thread(self.stop_workers)
+        self._hand_over(signum, frame)
+
+    def _hand_over(self, signum: int, frame: FrameType | None) -> None:
+        previous, self._previous = self._previous, None
+        if previous is None:
+            return
+        signal.signal(signal.SIGTERM, previous)
+        if callable(previous):
+            previous(signum, frame)
+        else:
+            signal.raise_signal(signum)
+
+    def _upstream_request(self, request: Request, worker_url: str, body: bytes) -> httpx.Request:
+        url = worker_url + request.url.path
+        if request.url.query:
+            url += f"?{request.url.query}"
+        # content-length is recomputed by httpx, split batches carry a different body
+        headers = [
+            (k, v)
+            for k, v in request.headers.items()
+            if k.lower() not in _HOP_BY_HOP and k.lower() != "content-length"
+        ]
+        return self._client.build_request(request.method, url, headers=headers, content=body)
+
+    async def proxy(self, request: Request) -> Response:
+        body = await request.body()
+        if request.method == "POST" and request.url.path.endswith("/batch"):
+            if owners := batch_owners(body, len(self.worker_urls)):
+                return await self.proxy_batch(request, body, owners)
+        key = route_key(request.url.path, request.query_params, request.headers, body)
+        upstream_request = self._upstream_request(request, self.worker_for(key), body)
+        try:
+            upstream = await self._client.send(upstream_request, stream=True)
+        except httpx.TransportError as e:
+            return Response(f"Worker unavailable: {e}", status_code=502)
+        response_headers = {
+            k: v for k, v in upstream.headers.items() if k.lower() not in _HOP_BY_HOP
+        }
+        return StreamingResponse(
+            upstream.aiter_raw(),
+            status_code=upstream.status_code,
+            headers=response_headers,
+            background=BackgroundTask(upstream.aclose),
+        )
+
+    async def proxy_batch(
+        self, request: Request, body: bytes, owners: dict[int, list[int]]
+    ) -> Response:
+        """splits a batch over the workers owning its threads and merges their results.
+
+        each worker gets the inputs of its own threads, so every turn is written
+        to the checkpoint files of the worker that owns the thread. result
+        indexes are mapped back to the original batch as the lines come in.
+        """
+        data = orjson.loads(body)
+        inputs = data["inputs"]
+        requests = [
+            self._upstream_request(
+                request,
+                self.worker_urls[worker],
+                orjson.dumps({**data, "inputs": [inputs[i] for i in indexes]}),
+            )
+            for worker, indexes in owners.items()
+        ]
+        sent = await asyncio.gather(
+            *(self._client.send(r, stream=True) for r in requests), return_exceptions=True
+        )
+        upstreams = [u for u in sent if isinstance(u, httpx.Response)]
+        failed = next((u for u in sent if not isinstance(u, httpx.Response)), None)
+        rejected = next((u for u in upstreams if u.status_code != 200), None)
+        if failed is not None or rejected is not None:
+            # nothing has run yet past a rejected part, the whole batch is refused
+            if rejected is not None:
+                await rejected.aread()
+            await asyncio.gather(*(u.aclose() for u in upstreams))
+            if rejected is None:
+                return Response(f"Worker unavailable: {failed}", status_code=502)
+            return Response(
+                rejected.content,
+                status_code=rejected.status_code,
+                media_type=rejected.headers.get("content-type"),
+            )
+
+        async def lines() -> AsyncGenerator[bytes, None]:
+            queue: asyncio.Queue[bytes | None] = asyncio.Queue()
+
+            async def pump(upstream: httpx.Response, indexes: list[int]) -> None:
+                try:
+                    async for line in upstream.aiter_lines():
+                        if line.strip():
+                            result = orjson.loads(line)
+                            result["index"] = indexes[result["index"]]
+                            await queue.put(orjson.dumps(result) + b"\n")
+                finally:
+                    await queue.put(None)
+
+            tasks = [
+                asyncio.create_task(pump(upstream, indexes))
+                for upstream, indexes in zip(upstreams, owners.values())
+            ]
+            try:
+                running = len(tasks)
+                while running:
+                    line = await queue.get()
+                    if line is None:
+                        running -= 1
+                    else:
+                        yield line
+            finally:
+                # a client leaving closes the upstream requests, the workers cancel their runs
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                await asyncio.gather(*(u.aclose() for u in upstreams))
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    async def ready(self, request: Request) -> Response:
+        """/ready of every worker folded into one, the pod is ready when all of them are."""
+
+        async def worker_status(url: str) -> dict:
+            try:
+                response = await self._client.get(url + "/ready", timeout=5.0)
+                return orjson.loads(response.content)
+            except (httpx.HTTPError, orjson.JSONDecodeError) as e:
+                component = {"ok": False, "seconds": None, "required": True, "error": str(e)}
+                return {"ready": False, "components": {"worker": component}}
+
+        statuses = await asyncio.gather(*(worker_status(url) for url in self.worker_urls))
+        components = {
+            f"worker{index}.{name}": component
+            for index, worker in enumerate(statuses)
+            for name, component in worker.get("components", {}).items()
+        }
+        ready = not self.draining and all(worker.get("ready") for worker in statuses)
+        return Response(
+            orjson.dumps({"ready": ready, "draining": self.draining, "components": components}),
+            status_code=200 if ready else 503,
+            media_type="application/json",
+        )
+
+    async def metrics(self, request: Request) -> Response:
+        """/metrics of every worker, summed into the pod's and kept per worker under `workers`."""
+        headers = {}
+        if authorization := request.headers.get("authorization"):
+            headers["authorization"] = authorization
+        try:
+            responses = await asyncio.gather(
+                *(
+                    self._client.get(url + "/metrics", headers=headers, timeout=5.0)
+                    for url in self.worker_urls
+                )
+            )
+        except httpx.TransportError as e:
+            return Response(f"Worker unavailable: {e}", status_code=502)
+        for response in responses:
+            if response.status_code != 200:
+                # e.g. a missing bearer token, every worker answers the same
+                return Response(
+                    response.content,
+                    status_code=response.status_code,
+                    media_type=response.headers.get("content-type"),
+                )
+        snapshots = [orjson.loads(response.content) for response in responses]
+        return Response(
+            orjson.dumps({**merge_metrics(snapshots), "workers": snapshots}),
+            media_type="application/json",
+        )
+
+    async def proxy_websocket(self, websocket: WebSocket) -> None:
+        key = route_key(websocket.url.path, websocket.query_params, websocket.headers, b"")
+        url = httpx.URL(self.worker_for(key) + websocket.url.path).copy_with(
+            scheme="ws", query=websocket.url.query.encode()
+        )
+        headers = {}
+        if authorization := websocket.headers.get("authorization"):
+            headers["Authorization"] = authorization
+        try:
+            upstream = await websockets.connect(str(url), extra_headers=headers)
+        except (OSError, websockets.WebSocketException):
+            await websocket.close(code=1011, reason="Worker unavailable")
+            return
+        await websocket.accept()
+
+        async def client_to_worker() -> None:
+            try:
+                while True:
+                    await upstream.send(await websocket.receive_text())
+            except WebSocketDisconnect:
+                pass
+
+        async def worker_to_client() -> None:
+            try:
+                async for frame in upstream:
+                    await websocket.send_text(frame)
+            except websockets.WebSocketException:
+                pass
+            try:
+                await websocket.close(code=upstream.close_code or 1000)
+            except RuntimeError:
+                # the client already left
+                pass
+
+        # whichever side goes away first ends the session for the other
+        tasks = [asyncio.create_task(client_to_worker()), asyncio.create_task(worker_to_client())]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await upstream.close()
+
+
+def create_router(
+    worker_urls: list[str], stop_workers: Callable[[], None] | None = None
+) -> Starlette:
+    """asgi app for the router process in front of `worker_urls`."""
+    router = AffinityRouter(worker_urls, stop_workers)
+    return Starlette(
+        routes=[
+            Route("/ready", router.ready, methods=["GET"]),
+            Route("/metrics", router.metrics, methods=["GET"]),
+            Route("/{path:path}", router.proxy, methods=_METHODS),
+            WebSocketRoute("/{path:path}", router.proxy_websocket),
+        ],
+        lifespan=router.lifespan,
+    )
@@ -0,0 +1,56 @@
+import argparse
+import os
+import sys
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+from core import settings
+from core.checkpoint import shard_paths
+from service.export import EXPORT_MEDIA_TYPES, encode_export, iter_threads
+
+load_dotenv()
+
+
+def main() -> None:
+    """export threads from the checkpoint store, e.g.
+
+    python src/run_export.py --since 2025-01-01 --until 2025-01-02 --format parquet -o day.parquet
+    """
+    parser = argparse.ArgumentParser(description="export threads from the checkpoint store")
+    parser.add_argument("--db", default=settings.CHECKPOINT_DB, help="checkpoint sqlite file")
+    parser.add_argument(
+        "--shards", type=int, default=settings.CHECKPOINT_SHARDS, help="shard files --db is split in"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=settings.WORKERS, help="worker files --db is split in"
+    )
+    parser.add_argument("--format", choices=list(EXPORT_MEDIA_TYPES), default="ndjson")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="inclusive iso timestamp")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="exclusive iso timestamp")
+    parser.add_argument("--cursor", help="resume after this thread_id")
+    parser.add_argument("--limit", type=int, help="maximum number of threads")
+    parser.add_argument("-o", "--output", help="output file (default: stdout)")
+    args = parser.parse_args()
+
+    # every worker's files, like /export: a worker that never wrote a thread has none
+    paths = [
+        path
+        for db in settings.pod_paths(args.db, args.workers)
+        for path in shard_paths(db, args.shards)
+        if os.path.exists(path)
+    ]
+    records = iter_threads(
+        paths, since=args.since, until=args.until, cursor=args.cursor, limit=args.limit
+    )
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for chunk in encode_export(records, args.format):
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
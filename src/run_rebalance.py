@@ -0,0 +1,67 @@
+import argparse
+
+from dotenv import load_dotenv
+
+from core import settings
+from core.checkpoint import rebalance_shards, rebalance_workers
+
+load_dotenv()
+
+
+def main() -> None:
+    """moves checkpoint threads between files after CHECKPOINT_SHARDS or WORKERS changes, e.g.
+
+    python src/run_rebalance.py --from-shards 4 --to-shards 8
+    python src/run_rebalance.py --from-workers 2 --to-workers 4
+
+    run it with the service stopped, then start the service with the new counts.
+    only checkpoints move: jobs still queued on a worker that goes away stay in
+    its jobs file, and so does the feedback it spilled.
+    """
+    parser = argparse.ArgumentParser(description="rebalance the checkpoint files")
+    parser.add_argument("--db", default=settings.CHECKPOINT_DB, help="checkpoint sqlite file")
+    parser.add_argument("--from-shards", type=int, help="current shard count")
+    parser.add_argument(
+        "--to-shards", type=int, default=settings.CHECKPOINT_SHARDS, help="new shard count"
+    )
+    parser.add_argument("--from-workers", type=int, help="current worker count")
+    parser.add_argument(
+        "--to-workers", type=int, default=settings.WORKERS, help="new worker count"
+    )
+    parser.add_argument("--batch-size", type=int, default=500, help="threads moved per commit")
+    parser.add_argument("--dry-run", action="store_true", help="only count the threads to move")
+    args = parser.parse_args()
+    if args.from_shards is None and args.from_workers is None:
+        parser.error("give --from-shards, --from-workers or both")
+    from_shards = args.to_shards if args.from_shards is None else args.from_shards
+    from_workers = args.to_workers if args.from_workers is None else args.from_workers
+
+    moved: dict[str, int] = {}
+    # shards first, within each current worker's files, then threads over to their new worker
+    for path in settings.pod_paths(args.db, from_workers):
+        moved.update(
+            rebalance_shards(
+                path,
+                from_shards,
+                args.to_shards,
+                batch_size=args.batch_size,
+                dry_run=args.dry_run,
+            )
+        )
+    if from_workers != args.to_workers:
+        for target, count in rebalance_workers(
+            settings.pod_paths(args.db, from_workers),
+            settings.pod_paths(args.db, args.to_workers),
+            args.to_shards,
+            batch_size=args.batch_size,
+            dry_run=args.dry_run,
+        ).items():
+            moved[target] = moved.get(target, 0) + count
+    verb = "would move" if args.dry_run else "moved"
+    for target, count in sorted(moved.items()):
+        print(f"{verb} {count} threads to {target}")
+    print(f"{verb} {sum(moved.values())} threads in total")
+
+
+if __name__ == "__main__":
+    main()
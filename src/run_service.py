@@ -1,23 +1,116 @@
 import uvicorn
 from dotenv import load_dotenv
+import glob
+import logging
 import multiprocessing
 import subprocess
 import os
+import signal
+import sys
 import time
 
 from core import settings
+from core.checkpoint import misplaced_checkpoint_files
+from router import create_router
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+def check_checkpoint_layout():
+    """warn when checkpoint threads sit in files the current WORKERS and CHECKPOINT_SHARDS don't read"""
+    base = settings.CHECKPOINT_DB
+    stem, dot, suffix = base.rpartition(".")
+    pattern = f"{glob.escape(stem)}.[ws]*.{suffix}" if dot else f"{glob.escape(base)}.[ws]*"
+    files = [
+        path
+        for path in [base, *glob.glob(pattern)]
+        if os.path.exists(path) and not path.endswith(("-wal", "-shm"))
+    ]
+    misplaced = misplaced_checkpoint_files(
+        files, settings.pod_checkpoint_dbs(), settings.CHECKPOINT_SHARDS
+    )
+    if misplaced:
+        logger.warning(
+            f"Checkpoint files {misplaced} hold threads that WORKERS={settings.WORKERS} and "
+            f"CHECKPOINT_SHARDS={settings.CHECKPOINT_SHARDS} look for elsewhere, their history "
+            "won't be found; stop the service and run src/run_rebalance.py"
+        )
+
 def run_uvicorn():
     """run the fastapi/uvicorn server"""
+    check_checkpoint_layout()
+    if settings.WORKERS > 1:
+        run_workers()
+        return
     uvicorn.run(
         "service:app",
         host=settings.HOST,
         port=settings.PORT,
-        reload=settings.is_dev()
+        reload=settings.is_dev(),
+        loop=settings.EVENT_LOOP,
+        ws_ping_interval=settings.WS_PING_INTERVAL,
+        ws_ping_timeout=settings.WS_PING_TIMEOUT,
+        # runs are drained by the app before uvicorn sees SIGTERM, this bounds what is left
+        timeout_graceful_shutdown=settings.SHUTDOWN_FLUSH_TIMEOUT,
+    )
+
+def run_worker(worker_id: int):
+    """run one service worker, reachable only through the router"""
+    uvicorn.run(
+        "service:app",
+        host="127.0.0.1",
+        port=settings.WORKER_BASE_PORT + worker_id,
+        loop=settings.EVENT_LOOP,
+        ws_ping_interval=settings.WS_PING_INTERVAL,
+        ws_ping_timeout=settings.WS_PING_TIMEOUT,
+        timeout_graceful_shutdown=settings.SHUTDOWN_FLUSH_TIMEOUT,
     )
 
+def run_workers():
+    """run WORKERS service processes behind the thread-affinity router"""
+    # spawned workers import settings afresh, picking up their WORKER_ID from the environment
+    context = multiprocessing.get_context("spawn")
+    workers = []
+    for worker_id in range(settings.WORKERS):
+        os.environ["WORKER_ID"] = str(worker_id)
+        worker = context.Process(target=run_worker, args=(worker_id,), name=f"worker-{worker_id}")
+        worker.start()
+        workers.append(worker)
+    os.environ.pop("WORKER_ID")
+    worker_urls = [
+        f"http://127.0.0.1:{settings.WORKER_BASE_PORT + worker_id}"
+        for worker_id in range(settings.WORKERS)
+    ]
+
+    # SIGTERM has each worker drain its runs (see GracefulShutdown) and exit
+    def stop_workers():
+        for worker in workers:
+            worker.terminate()
+        grace = settings.SHUTDOWN_DRAIN_TIMEOUT + settings.SHUTDOWN_FLUSH_TIMEOUT
+        deadline = time.monotonic() + grace
+        for worker in workers:
+            worker.join(max(deadline - time.monotonic(), 0))
+            if worker.is_alive():
+                worker.kill()
+                worker.join()
+
+    # uvicorn raises the SIGTERM it handled again once the router stopped; the default
+    # handler would end this process on the spot and leave the workers running
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
+    try:
+        # on SIGTERM the router keeps listening, answering /ready with a 503, until the
+        # workers drained and exited; only then does it stop taking connections
+        uvicorn.run(
+            create_router(worker_urls, stop_workers),
+            host=settings.HOST,
+            port=settings.PORT,
+            loop=settings.EVENT_LOOP,
+            timeout_graceful_shutdown=settings.SHUTDOWN_FLUSH_TIMEOUT,
+        )
+    finally:
+        stop_workers()
+
 def run_streamlit():
     """run the streamlit app"""
     # adjust the path to your streamlit file
@@ -25,6 +118,11 @@ def run_streamlit():
     subprocess.run(["streamlit", "run", streamlit_script])
 
 if __name__ == "__main__":
+    # `python run_service.py service` runs only the api, e.g. in its own container
+    if sys.argv[1:] == ["service"]:
+        run_uvicorn()
+        sys.exit()
+
     # create separate processes for each service
     uvicorn_process = multiprocessing.Process(target=run_uvicorn)
     streamlit_process = multiprocessing.Process(target=run_streamlit)
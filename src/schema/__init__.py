@@ -1,11 +1,18 @@
 from schema.models import AllModelEnum
 from schema.schema import (
     AgentInfo,
+    BatchInput,
+    BatchResult,
     ChatHistory,
     ChatHistoryInput,
     ChatMessage,
+    ComponentReadiness,
     Feedback,
     FeedbackResponse,
+    ForkInput,
+    ForkResponse,
+    JobStatus,
+    ReadinessStatus,
     ServiceMetadata,
     StreamInput,
     UserInput,
@@ -22,4 +29,11 @@ __all__ = [
     "FeedbackResponse",
     "ChatHistoryInput",
     "ChatHistory",
+    "ForkInput",
+    "ForkResponse",
+    "BatchInput",
+    "BatchResult",
+    "JobStatus",
+    "ReadinessStatus",
+    "ComponentReadiness",
 ]
@@ -1,3 +1,4 @@
+from datetime import datetime
 from typing import Any, Literal, NotRequired
 
 from pydantic import BaseModel, Field, SerializeAsAny
@@ -69,6 +70,41 @@ class StreamInput(UserInput):
         description="Whether to stream LLM tokens to the client.",
         default=True,
     )
+    stream_window_ms: int = Field(
+        description="Coalesce streamed tokens into one frame at most every this many "
+        "milliseconds. 0 sends every token as its own frame.",
+        default=30,
+        ge=0,
+        le=1000,
+    )
+    resumable: bool = Field(
+        description="Tag frames with `run_id:seq` event ids and keep the run going for a grace "
+        "period after a disconnect, so the client can reattach with GET /stream/{run_id} and "
+        "Last-Event-ID instead of sending the message again.",
+        default=False,
+    )
+
+
+class BatchInput(BaseModel):
+    """Many user inputs to run through the agent in one request."""
+
+    inputs: list[UserInput] = Field(
+        description="Inputs to run. Results refer to them by their index in this list.",
+        min_length=1,
+    )
+    concurrency: int | None = Field(
+        description="Maximum number of inputs run at once. Capped by the server's limit.",
+        default=None,
+        ge=1,
+        examples=[8],
+    )
+    timeout: float | None = Field(
+        description="Seconds allowed per input before it fails with a timeout. "
+        "Capped by the server's limit.",
+        default=None,
+        gt=0,
+        examples=[60],
+    )
 
 
 class ToolCall(TypedDict):
@@ -157,6 +193,57 @@ class FeedbackResponse(BaseModel):
     status: Literal["success"] = "success"
 
 
+class BatchResult(BaseModel):
+    """Outcome of one input of a batch, streamed as an NDJSON line in completion order."""
+
+    index: int = Field(
+        description="Index of the input in BatchInput.inputs.",
+        examples=[3],
+    )
+    output: ChatMessage | None = Field(
+        description="Final message of the agent, unset if the input failed.",
+        default=None,
+    )
+    error: str | None = Field(
+        description="Why the input failed, unset if it succeeded.",
+        default=None,
+        examples=["Timed out"],
+    )
+
+
+class JobStatus(BaseModel):
+    """State of an asynchronous job."""
+
+    job_id: str = Field(
+        description="ID of the job.",
+        examples=["0b7e4c5e-3f43-4a47-9d5b-1f1b7a4c2d10"],
+    )
+    agent_id: str = Field(
+        description="Agent running the job.",
+        examples=["research-assistant"],
+    )
+    status: Literal["queued", "running", "succeeded", "failed", "cancelled"] = Field(
+        description="Where the job is in its lifecycle.",
+        examples=["running"],
+    )
+    thread_id: str = Field(
+        description="Thread the job's turn is recorded in.",
+        examples=["847c6285-8fc9-4560-a83f-4e6285809254"],
+    )
+    run_id: str | None = Field(
+        description="Run ID of the job once it has started, for feedback.",
+        default=None,
+    )
+    created_at: datetime = Field(description="When the job was submitted.")
+    started_at: datetime | None = Field(description="When the job started running.", default=None)
+    finished_at: datetime | None = Field(description="When the job finished.", default=None)
+    error: str | None = Field(
+        description="Why the job failed.",
+        default=None,
+        examples=["Timed out"],
+    )
+
+
 class ChatHistoryInput(BaseModel):
     """Input for retrieving chat history."""
 
@@ -164,7 +251,109 @@ class ChatHistoryInput(BaseModel):
         description="Thread ID to persist and continue a multi-turn conversation.",
         examples=["847c6285-8fc9-4560-a83f-4e6285809254"],
     )
+    since: int | None = Field(
+        description="Only return messages from this index on. Use the number of messages "
+        "already held by the client to fetch just the new ones.",
+        default=None,
+        ge=0,
+        examples=[12],
+    )
+    cursor: str | None = Field(
+        description="Opaque cursor returned as `next_cursor` by a previous page.",
+        default=None,
+    )
+    limit: int | None = Field(
+        description="Maximum number of messages to return. Returns all remaining messages if unset.",
+        default=None,
+        ge=1,
+        examples=[50],
+    )
+    compact: bool = Field(
+        description="Leave out tool payloads (tool outputs, tool call args and response metadata).",
+        default=False,
+    )
 
 
 class ChatHistory(BaseModel):
     messages: list[ChatMessage]
+    start: int = Field(
+        description="Index of the first returned message in the thread.",
+        default=0,
+    )
+    total: int | None = Field(
+        description="Total number of messages in the thread.",
+        default=None,
+    )
+    next_cursor: str | None = Field(
+        description="Cursor for the next page, or None if there are no more messages.",
+        default=None,
+    )
+
+
+class ForkInput(BaseModel):
+    """Input for forking a thread from one of its messages into a copy of it."""
+
+    thread_id: str = Field(
+        description="Thread ID to fork from.",
+        examples=["847c6285-8fc9-4560-a83f-4e6285809254"],
+    )
+    message_index: int | None = Field(
+        description="Fork right before this message: the new thread keeps messages "
+        "[0, message_index) of the parent. Defaults to the whole thread. To regenerate an "
+        "answer, fork at the index of the human message and send it again. An index that "
+        "separates a tool call from its result is rejected.",
+        default=None,
+        ge=0,
+        examples=[4],
+    )
+
+
+class ForkResponse(BaseModel):
+    """The thread created by a fork."""
+
+    thread_id: str = Field(
+        description="Thread ID of the new thread.",
+        examples=["5d9d3a1e-6d0b-4bd4-9c43-a0d6f8d8e2b1"],
+    )
+    parent_thread_id: str = Field(
+        description="Thread ID the fork was created from.",
+        examples=["847c6285-8fc9-4560-a83f-4e6285809254"],
+    )
+    message_count: int = Field(
+        description="Number of messages carried over from the parent thread.",
+        examples=[4],
+    )
+
+
+class ComponentReadiness(BaseModel):
+    """Warm-up result of one service component."""
+
+    ok: bool = Field(description="Whether the component warmed up.")
+    seconds: float | None = Field(
+        description="How long the warm-up took, unset while it is still running.",
+        default=None,
+        examples=[0.42],
+    )
+    required: bool = Field(
+        description="Whether the service can't be ready without this component.",
+        default=True,
+    )
+    error: str | None = Field(
+        description="Why the warm-up failed.",
+        default=None,
+        examples=["ConnectTimeout"],
+    )
+
+
+class ReadinessStatus(BaseModel):
+    """Whether the service is ready for traffic, with its warm-up timings."""
+
+    ready: bool = Field(description="Whether the service accepts traffic.")
+    draining: bool = Field(
+        description="Whether the service is shutting down, finishing its runs but starting none.",
+        default=False,
+    )
+    components: dict[str, ComponentReadiness] = Field(
+        description="Warm-up result of each component, in warm-up order.",
+        default={},
+    )
@@ -0,0 +1,291 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections.abc import AsyncGenerator
+from contextlib import asynccontextmanager
+from enum import IntEnum
+
+from core import metrics, settings
+from core.settings import RateLimit
+from schema import UserInput
+from schema.models import FakeModelName, GroqModelName, OpenAIModelName, Provider
+
+
+class Priority(IntEnum):
+    """admission classes, lower values are served first."""
+
+    INTERACTIVE = 0  # a user is waiting on the answer: /invoke, /stream, websocket turns
+    BACKGROUND = 1  # /batch and /jobs
+
+
+class Overloaded(Exception):
+    """the request can't be admitted; retry after `retry_after` seconds."""
+
+    def __init__(self, retry_after: float) -> None:
+        super().__init__(f"Overloaded, retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class Draining(Overloaded):
+    """the service is shutting down and starts no new runs, retry elsewhere."""
+
+    def __init__(self, retry_after: float = 1.0) -> None:
+        Exception.__init__(self, "Service is shutting down")
+        self.retry_after = retry_after
+
+
+def provider_of(model: str) -> Provider | None:
+    for provider, names in (
+        (Provider.OPENAI, OpenAIModelName),
+        (Provider.GROQ, GroqModelName),
+        (Provider.FAKE, FakeModelName),
+    ):
+        if model in set(names):
+            return provider
+    return None
+
+
+class TokenBucket:
+    """refills `per_minute` units evenly over a minute, holding at most a minute's worth."""
+
+    def __init__(self, per_minute: int) -> None:
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """seconds until `amount` can be taken, 0 if it can be right now."""
+        self._refill()
+        # a request larger than the bucket would never fit, it waits for a full one instead
+        missing = min(amount, self.capacity) - self.tokens
+        return max(missing, 0) / self.rate
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+
+class Ticket:
+    """an admitted run's slot, given back with release()."""
+
+    def __init__(self, controller: "AdmissionController") -> None:
+        self._controller: AdmissionController | None = controller
+
+    def release(self) -> None:
+        # safe to call from several cleanup paths, only the first one counts
+        if self._controller is not None:
+            controller, self._controller = self._controller, None
+            controller.release()
+
+
+class _Waiter:
+    def __init__(self, priority: Priority, seq: int, model: str, tokens: int) -> None:
+        self.priority = priority
+        self.seq = seq
+        self.model = model
+        self.tokens = tokens
+        self.future: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        self.enqueued = time.monotonic()
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+# whether the dispatcher gave the waiter a slot, rather than turning it away with Draining
+def _admitted(waiter: _Waiter) -> bool:
+    future = waiter.future
+    return future.done() and not future.cancelled() and future.exception() is None
+
+
+class AdmissionController:
+    """decides when a graph run may start, so provider quotas aren't blown through.
+
+    a run is admitted when a concurrency slot is free and the request and
+    token buckets of its model (or, failing that, its provider) can cover one
+    request and the estimated tokens. otherwise it waits in a priority queue:
+    interactive requests fail fast with Overloaded when the queue is full or
+    after `max_wait`, background work waits as long as it takes but never
+    takes the last `interactive_reserve` slots.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_concurrent: int,
+        interactive_reserve: int,
+        max_queue: int,
+        max_wait: float,
+        limits: dict[str, RateLimit],
+        prompt_overhead: int,
+    ) -> None:
+        self.max_concurrent = max_concurrent
+        self.interactive_reserve = interactive_reserve
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.limits = limits
+        self.prompt_overhead = prompt_overhead
+        self.running = 0
+        self._queue: list[_Waiter] = []
+        self._seq = itertools.count()
+        self._buckets: dict[str, tuple[TokenBucket | None, TokenBucket | None]] = {}
+        self._timer: asyncio.TimerHandle | None = None
+        self.closed = False
+        self._idle: asyncio.Event | None = None
+
+    def _limits_key(self, model: str) -> str | None:
+        if model in self.limits:
+            return model
+        provider = provider_of(model)
+        if provider is not None and provider in self.limits:
+            return provider
+        return None
+
+    def _bucket_pair(self, model: str) -> tuple[TokenBucket | None, TokenBucket | None]:
+        key = self._limits_key(model)
+        if key is None:
+            return None, None
+        if key not in self._buckets:
+            limit = self.limits[key]
+            self._buckets[key] = (
+                TokenBucket(limit.rpm) if limit.rpm else None,
+                TokenBucket(limit.tpm) if limit.tpm else None,
+            )
+        return self._buckets[key]
+
+    def _quota_wait(self, model: str, tokens: int) -> float:
+        requests, token_bucket = self._bucket_pair(model)
+        return max(
+            requests.wait_time(1) if requests else 0,
+            token_bucket.wait_time(tokens) if token_bucket else 0,
+        )
+
+    def _slots(self, priority: Priority) -> int:
+        if priority == Priority.INTERACTIVE:
+            return self.max_concurrent
+        return self.max_concurrent - self.interactive_reserve
+
+    def _try_admit(self, priority: Priority, model: str, tokens: int) -> float | None:
+        """admits right away and returns None, or returns how long the quota needs."""
+        if self.running >= self._slots(priority):
+            return 0.0
+        wait = self._quota_wait(model, tokens)
+        if wait > 0:
+            return wait
+        requests, token_bucket = self._bucket_pair(model)
+        if requests:
+            requests.take(1)
+        if token_bucket:
+            token_bucket.take(tokens)
+        self.running += 1
+        self._report()
+        return None
+
+    def _report(self) -> None:
+        metrics.gauge("admission.running", self.running)
+        metrics.gauge("admission.queue_depth", len(self._queue))
+
+    def _dispatch(self) -> None:
+        """admits queued waiters that fit, in priority order."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        next_check = None
+        for waiter in sorted(self._queue):
+            if waiter.future.done():
+                continue
+            wait = self._try_admit(waiter.priority, waiter.model, waiter.tokens)
+            if wait is None:
+                waiter.future.set_result(None)
+            elif wait > 0:
+                next_check = wait if next_check is None else min(next_check, wait)
+        self._queue = [w for w in self._queue if not w.future.done()]
+        heapq.heapify(self._queue)
+        self._report()
+        if next_check is not None:
+            # quota refills on its own, nothing else would wake the queue up
+            self._timer = asyncio.get_running_loop().call_later(next_check, self._dispatch)
+
+    async def acquire(self, user_input: UserInput, priority: Priority) -> Ticket:
+        """waits for admission, raising Overloaded for interactive requests that can't get in."""
+        if self.closed:
+            metrics.incr("admission.rejected.draining")
+            raise Draining()
+        # the agents build their llm from DEFAULT_MODEL, whatever model the input names
+        model = str(settings.DEFAULT_MODEL)
+        tokens = estimate_tokens(user_input.message, self.prompt_overhead)
+        if not self._queue and self._try_admit(priority, model, tokens) is None:
+            metrics.incr("admission.admitted")
+            metrics.observe("admission.wait_seconds", 0.0)
+            return Ticket(self)
+        interactive = priority == Priority.INTERACTIVE
+        queued = sum(1 for w in self._queue if w.priority == Priority.INTERACTIVE)
+        if interactive and queued >= self.max_queue:
+            metrics.incr("admission.rejected.queue_full")
+            raise Overloaded(max(1.0, self._quota_wait(model, tokens)))
+        waiter = _Waiter(priority, next(self._seq), model, tokens)
+        heapq.heappush(self._queue, waiter)
+        self._dispatch()
+        try:
+            timeout = self.max_wait if interactive else None
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+        except TimeoutError:
+            if not _admitted(waiter):
+                metrics.incr("admission.rejected.timeout")
+                raise Overloaded(max(1.0, self._quota_wait(model, tokens)))
+            # admitted just as the wait ran out, the slot is already counted: keep it
+        except asyncio.CancelledError:
+            if _admitted(waiter):
+                # admitted just as the caller gave up
+                self.release()
+            raise
+        finally:
+            if not waiter.future.done():
+                waiter.future.cancel()
+                self._queue.remove(waiter)
+                heapq.heapify(self._queue)
+                self._report()
+        metrics.incr("admission.admitted")
+        metrics.observe("admission.wait_seconds", time.monotonic() - waiter.enqueued)
+        return Ticket(self)
+
+    def release(self) -> None:
+        self.running -= 1
+        self._dispatch()
+        if self.running == 0 and self._idle is not None:
+            self._idle.set()
+
+    def close(self) -> None:
+        """stops admitting runs, on shutdown. queued ones are turned away with Draining."""
+        self.closed = True
+        for waiter in self._queue:
+            if not waiter.future.done():
+                waiter.future.set_exception(Draining())
+        self._queue = []
+        self._report()
+
+    async def drained(self) -> None:
+        """returns once no admitted run is left."""
+        if self.running == 0:
+            return
+        self._idle = asyncio.Event()
+        await self._idle.wait()
+
+    @asynccontextmanager
+    async def slot(self, user_input: UserInput, priority: Priority) -> AsyncGenerator[None, None]:
+        ticket = await self.acquire(user_input, priority)
+        try:
+            yield
+        finally:
+            ticket.release()
+
+
+def estimate_tokens(message: str, overhead: int) -> int:
+    """rough prompt size: ~4 characters per token plus the system prompt and history."""
+    return len(message) // 4 + overhead
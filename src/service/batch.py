@@ -0,0 +1,80 @@
+import asyncio
+import logging
+from collections.abc import AsyncGenerator, Callable
+from typing import Any
+from uuid import UUID
+
+from langgraph.graph.state import CompiledStateGraph
+
+from core import metrics
+from schema import BatchResult, UserInput
+from service.admission import AdmissionController, Draining, Priority
+from service.utils import langchain_to_chat_message
+
+logger = logging.getLogger(__name__)
+
+# builds the graph kwargs and run id for an input, service._parse_input
+InputParser = Callable[[UserInput], tuple[dict[str, Any], UUID]]
+
+
+async def _run_one(
+    agent: CompiledStateGraph,
+    index: int,
+    user_input: UserInput,
+    parse_input: InputParser,
+    admission: AdmissionController,
+    timeout: float,
+) -> BatchResult:
+    try:
+        kwargs, run_id = parse_input(user_input)
+        # the timeout bounds the run itself, not the wait for admission
+        async with admission.slot(user_input, Priority.BACKGROUND):
+            response = await asyncio.wait_for(agent.ainvoke(**kwargs), timeout)
+        output = langchain_to_chat_message(response["messages"][-1])
+        output.run_id = str(run_id)
+        return BatchResult(index=index, output=output)
+    except TimeoutError:
+        metrics.incr("batch.items.timeout")
+        return BatchResult(index=index, error="Timed out")
+    except Draining as e:
+        return BatchResult(index=index, error=str(e))
+    except Exception as e:
+        logger.error(f"An exception occurred in batch item {index}: {e}")
+        metrics.incr("batch.items.failed")
+        return BatchResult(index=index, error=getattr(e, "detail", "Unexpected error"))
+
+
+async def run_batch(
+    agent: CompiledStateGraph,
+    inputs: list[UserInput],
+    parse_input: InputParser,
+    *,
+    admission: AdmissionController,
+    concurrency: int,
+    timeout: float,
+) -> AsyncGenerator[BatchResult, None]:
+    """runs every input through the graph, yielding results in completion order.
+
+    at most `concurrency` inputs run at once, each bounded by `timeout` seconds.
+    closing the generator (e.g. when the client disconnects) cancels what is
+    still running. inputs are admitted as background work, so they queue
+    behind interactive requests instead of being rejected.
+    """
+    pending = iter(enumerate(inputs))
+    results: asyncio.Queue[BatchResult] = asyncio.Queue()
+
+    async def worker() -> None:
+        for index, user_input in pending:
+            result = await _run_one(agent, index, user_input, parse_input, admission, timeout)
+            await results.put(result)
+
+    workers = [asyncio.create_task(worker()) for _ in range(min(concurrency, len(inputs)))]
+    metrics.incr("batch.started")
+    try:
+        for _ in range(len(inputs)):
+            yield await results.get()
+        metrics.incr("batch.items", len(inputs))
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
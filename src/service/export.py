@@ -0,0 +1,226 @@
+import heapq
+import io
+import itertools
+import json
+import logging
+import sqlite3
+from collections.abc import Iterator, Sequence
+from datetime import datetime, timezone
+from functools import cache
+from typing import TYPE_CHECKING, Any, Literal, TypeAlias
+
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from service.utils import langchain_to_chat_message
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+logger = logging.getLogger(__name__)
+
+ExportFormat: TypeAlias = Literal["ndjson", "arrow", "parquet"]
+
+EXPORT_MEDIA_TYPES: dict[ExportFormat, str] = {
+    "ndjson": "application/x-ndjson",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# threads fetched from sqlite (and written as one arrow record batch) at a time
+EXPORT_BATCH_SIZE = 200
+
+# pyarrow is only imported once an arrow or parquet export is requested, it is slow to load
+@cache
+def export_schema() -> "pa.Schema":
+    import pyarrow as pa
+
+    return pa.schema(
+        [
+            pa.field("thread_id", pa.string()),
+            pa.field("checkpoint_id", pa.string()),
+            pa.field("updated_at", pa.timestamp("us", tz="UTC")),
+            pa.field("message_count", pa.int32()),
+            pa.field("messages", pa.string()),  # json encoded list of ChatMessage
+        ]
+    )
+
+
+# latest root checkpoint of each thread after the cursor, keyset paginated by thread_id
+_LATEST_CHECKPOINTS_SQL = """
+SELECT c.thread_id, c.checkpoint_id, c.type, c.checkpoint
+FROM checkpoints AS c
+JOIN (
+    SELECT thread_id, MAX(checkpoint_id) AS checkpoint_id
+    FROM checkpoints
+    WHERE checkpoint_ns = '' AND thread_id > ?
+    GROUP BY thread_id
+    HAVING MAX(checkpoint_id) >= ? AND MAX(checkpoint_id) < ?
+    ORDER BY thread_id
+    LIMIT ?
+) AS latest USING (thread_id, checkpoint_id)
+WHERE c.checkpoint_ns = ''
+ORDER BY c.thread_id
+"""
+
+# 100ns intervals between the gregorian epoch (uuid time) and the unix epoch
+_UUID_EPOCH_OFFSET = 0x01B21DD213814000
+
+
+def _checkpoint_id_floor(moment: datetime | None, default: str) -> str:
+    """smallest uuid6 checkpoint id generated at or after `moment`.
+
+    langgraph checkpoint ids are uuid6, whose hex form sorts by creation time,
+    so time ranges can be filtered in sql without deserializing checkpoints.
+    """
+    if moment is None:
+        return default
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    ts = int(moment.timestamp() * 10**7) + _UUID_EPOCH_OFFSET
+    return f"{ts >> 28:08x}-{(ts >> 12) & 0xFFFF:04x}-6{ts & 0xFFF:03x}-0000-000000000000"
+
+
+def _iter_file_threads(
+    db_path: str,
+    since: datetime | None,
+    until: datetime | None,
+    cursor: str | None,
+    limit: int | None,
+    batch_size: int,
+) -> Iterator[dict[str, Any]]:
+    serde = JsonPlusSerializer()
+    lower = _checkpoint_id_floor(since, "")
+    upper = _checkpoint_id_floor(until, "~")
+    remaining = limit
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+    try:
+        while remaining is None or remaining > 0:
+            size = batch_size if remaining is None else min(batch_size, remaining)
+            rows = conn.execute(
+                _LATEST_CHECKPOINTS_SQL, (cursor or "", lower, upper, size)
+            ).fetchall()
+            if not rows:
+                return
+            for thread_id, checkpoint_id, type_, blob in rows:
+                checkpoint = serde.loads_typed((type_, blob))
+                messages = []
+                for message in checkpoint["channel_values"].get("messages", []):
+                    try:
+                        messages.append(langchain_to_chat_message(message).model_dump(mode="json"))
+                    except ValueError as e:
+                        logger.warning(f"Skipping message in thread {thread_id}: {e}")
+                yield {
+                    "thread_id": thread_id,
+                    "checkpoint_id": checkpoint_id,
+                    "updated_at": checkpoint["ts"],
+                    "messages": messages,
+                }
+            cursor = rows[-1][0]
+            if remaining is not None:
+                remaining -= len(rows)
+    finally:
+        conn.close()
+
+
+def iter_threads(
+    db_paths: str | Sequence[str],
+    since: datetime | None = None,
+    until: datetime | None = None,
+    cursor: str | None = None,
+    limit: int | None = None,
+    batch_size: int = EXPORT_BATCH_SIZE,
+) -> Iterator[dict[str, Any]]:
+    """streams the latest state of every thread last updated in [since, until).
+
+    threads are yielded in thread_id order, so the thread_id of the last record
+    can be passed back as `cursor` to resume an interrupted export. the shard
+    files of a sharded store are read side by side and merged in that order.
+    memory use is bounded by `batch_size` threads per file.
+    """
+    if isinstance(db_paths, str):
+        db_paths = [db_paths]
+    shards = [
+        _iter_file_threads(path, since, until, cursor, limit, batch_size) for path in db_paths
+    ]
+    records = heapq.merge(*shards, key=lambda record: record["thread_id"])
+    yield from itertools.islice(records, limit)
+
+
+class _ChunkSink(io.RawIOBase):
+    """write-only file object that hands written bytes back in chunks."""
+
+    def __init__(self) -> None:
+        self.chunks: list[bytes] = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: bytes) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def _record_batch(records: list[dict[str, Any]]) -> "pa.RecordBatch":
+    import pyarrow as pa
+
+    return pa.RecordBatch.from_pydict(
+        {
+            "thread_id": [r["thread_id"] for r in records],
+            "checkpoint_id": [r["checkpoint_id"] for r in records],
+            "updated_at": [datetime.fromisoformat(r["updated_at"]) for r in records],
+            "message_count": [len(r["messages"]) for r in records],
+            "messages": [json.dumps(r["messages"], ensure_ascii=False) for r in records],
+        },
+        schema=export_schema(),
+    )
+
+
+def _batched(records: Iterator[dict[str, Any]], size: int) -> Iterator[list[dict[str, Any]]]:
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def encode_export(
+    records: Iterator[dict[str, Any]],
+    format: ExportFormat,
+    batch_size: int = EXPORT_BATCH_SIZE,
+) -> Iterator[bytes]:
+    """encodes exported threads as ndjson lines, an arrow ipc stream or a parquet file."""
+    if format == "ndjson":
+        for record in records:
+            yield (json.dumps(record, ensure_ascii=False) + "\n").encode()
+        return
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = _ChunkSink()
+    if format == "arrow":
+        writer = pa.ipc.new_stream(sink, export_schema())
+    else:
+        writer = pq.ParquetWriter(sink, export_schema())
+    try:
+        for batch in _batched(records, batch_size):
+            writer.write_batch(_record_batch(batch))
+            if data := sink.drain():
+                yield data
+    finally:
+        writer.close()
+    if data := sink.drain():
+        yield data
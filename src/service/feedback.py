@@ -0,0 +1,186 @@
+import asyncio
+import json
+import logging
+import os
+from abc import ABC, abstractmethod
+from pathlib import Path
+from uuid import uuid4
+
+from langsmith import Client as LangsmithClient
+from langsmith.utils import LangSmithConflictError
+
+from core import settings
+from schema import Feedback
+
+logger = logging.getLogger(__name__)
+
+
+class FeedbackSink(ABC):
+    """destination that feedback batches are flushed to."""
+
+    @abstractmethod
+    async def send(self, batch: list[Feedback]) -> None:
+        """delivers the whole batch or raises, in which case it is retried."""
+
+
+class LangsmithFeedbackSink(FeedbackSink):
+    """records feedback in langsmith through one long-lived client."""
+
+    def __init__(self) -> None:
+        self._client: LangsmithClient | None = None
+
+    @property
+    def client(self) -> LangsmithClient:
+        if self._client is None:
+            self._client = LangsmithClient()
+        return self._client
+
+    def _send(self, batch: list[Feedback]) -> None:
+        for feedback in batch:
+            try:
+                self.client.create_feedback(
+                    run_id=feedback.run_id,
+                    key=feedback.key,
+                    score=feedback.score,
+                    stop_after_attempt=1,  # retries are handled by the pipeline
+                    **feedback.kwargs,
+                )
+            except LangSmithConflictError:
+                # same feedback_id already stored by an earlier, partially failed attempt
+                continue
+
+    async def send(self, batch: list[Feedback]) -> None:
+        # the langsmith client is synchronous, keep its network round trips off the event loop
+        await asyncio.to_thread(self._send, batch)
+
+
+class LocalFeedbackSink(FeedbackSink):
+    """appends feedback to a local jsonl file, a stand-in for tests and dev without langsmith."""
+
+    def __init__(self, path: str | os.PathLike) -> None:
+        self.path = Path(path)
+
+    def _send(self, batch: list[Feedback]) -> None:
+        with self.path.open("a", encoding="utf-8") as f:
+            for feedback in batch:
+                f.write(feedback.model_dump_json() + "\n")
+
+    async def send(self, batch: list[Feedback]) -> None:
+        await asyncio.to_thread(self._send, batch)
+
+
+class FeedbackPipeline:
+    """bounded queue of feedback flushed in batches to a sink by a background task.
+
+    `submit` never waits on the network. batches that still fail after
+    `max_retries`, and feedback arriving while the queue is full, are appended
+    to `spill_path` and replayed the next time the pipeline starts.
+    """
+
+    def __init__(
+        self,
+        sink: FeedbackSink,
+        *,
+        max_queue: int,
+        batch_size: int,
+        max_retries: int,
+        retry_backoff: float,
+        spill_path: str | os.PathLike,
+    ) -> None:
+        self.sink = sink
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.spill_path = Path(spill_path)
+        self._queue: asyncio.Queue[Feedback] = asyncio.Queue(maxsize=max_queue)
+        self._task: asyncio.Task | None = None
+
+    def submit(self, feedback: Feedback) -> None:
+        """queues feedback for delivery and returns immediately."""
+        # a stable id makes retried deliveries idempotent on the langsmith side
+        if "feedback_id" not in feedback.kwargs:
+            feedback = feedback.model_copy(
+                update={"kwargs": {**feedback.kwargs, "feedback_id": str(uuid4())}}
+            )
+        try:
+            self._queue.put_nowait(feedback)
+        except asyncio.QueueFull:
+            logger.warning("Feedback queue full, spilling to disk")
+            self._spill([feedback])
+
+    async def start(self) -> None:
+        # queues bind to the loop that first waits on them, so each start gets a fresh one
+        queued, self._queue = self._queue, asyncio.Queue(maxsize=self._queue.maxsize)
+        while not queued.empty():
+            self._queue.put_nowait(queued.get_nowait())
+        self._replay_spill()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 5.0) -> None:
+        """flushes what is queued, spilling anything left once `timeout` expires."""
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except TimeoutError:
+            logger.warning("Timed out flushing feedback, spilling the rest to disk")
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        leftover = []
+        while not self._queue.empty():
+            leftover.append(self._queue.get_nowait())
+            self._queue.task_done()
+        if leftover:
+            self._spill(leftover)
+
+    async def _run(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await self._flush(batch)
+            except asyncio.CancelledError:
+                self._spill(batch)
+                raise
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _flush(self, batch: list[Feedback]) -> None:
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self.sink.send(batch)
+                return
+            except Exception as e:
+                logger.warning(f"Feedback delivery failed (attempt {attempt + 1}): {e}")
+                if attempt < self.max_retries:
+                    await asyncio.sleep(self.retry_backoff * 2**attempt)
+        await asyncio.to_thread(self._spill, batch)
+
+    def _spill(self, batch: list[Feedback]) -> None:
+        with self.spill_path.open("a", encoding="utf-8") as f:
+            for feedback in batch:
+                f.write(feedback.model_dump_json() + "\n")
+
+    def _replay_spill(self) -> None:
+        if not self.spill_path.exists():
+            return
+        replay_path = self.spill_path.with_suffix(".replay")
+        os.replace(self.spill_path, replay_path)
+        with replay_path.open(encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    self.submit(Feedback.model_validate(json.loads(line)))
+        replay_path.unlink()
+
+
+def default_sink() -> FeedbackSink:
+    """langsmith when it is configured, otherwise the local jsonl stand-in."""
+    if settings.LANGCHAIN_API_KEY:
+        return LangsmithFeedbackSink()
+    return LocalFeedbackSink(settings.FEEDBACK_LOCAL_PATH)
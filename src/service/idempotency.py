@@ -0,0 +1,123 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from typing import Any
+
+from pydantic import BaseModel
+
+from core import metrics
+
+
+class IdempotencyConflict(Exception):
+    """an idempotency key was reused for a different request."""
+
+
+def fingerprint(*parts: str | BaseModel) -> str:
+    """hash identifying a request, so a reused key with another payload is caught."""
+    digest = hashlib.sha256()
+    for part in parts:
+        data = part.model_dump_json() if isinstance(part, BaseModel) else part
+        digest.update(data.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+@dataclass
+class _Entry:
+    fingerprint: str
+    expires_at: float
+    future: asyncio.Future
+    size: int = field(default=0)
+
+
+class IdempotencyStore:
+    """results of requests sent with an Idempotency-Key, kept for `ttl` seconds.
+
+    the first request with a key runs; duplicates arriving while it is in
+    flight wait for the same result and later ones get it replayed. failed
+    runs are forgotten so a retry can run again. memory is bounded by
+    `max_entries` and `max_bytes` of stored results, evicting the least
+    recently used keys first.
+    """
+
+    def __init__(self, *, ttl: float, max_entries: int, max_bytes: int) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._bytes = 0
+
+    async def run(
+        self,
+        key: str,
+        fingerprint: str,
+        fn: Callable[[], Awaitable[Any]],
+        size: Callable[[Any], int] = lambda _: 0,
+    ) -> tuple[Any, bool]:
+        """returns the result for `key` and whether it was replayed rather than computed."""
+        entry = self._get(key)
+        if entry is not None:
+            if entry.fingerprint != fingerprint:
+                raise IdempotencyConflict(f"Idempotency-Key {key} was used for another request")
+            metrics.incr("idempotency.replayed")
+            return await asyncio.shield(entry.future), True
+
+        future = asyncio.get_running_loop().create_future()
+        entry = _Entry(fingerprint, time.monotonic() + self.ttl, future)
+        self._entries[key] = entry
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            self.discard(key)
+            future.cancel()
+            raise
+        except Exception as e:
+            self.discard(key)
+            future.set_exception(e)
+            # nobody may be waiting on the future, don't warn about a lost exception
+            future.exception()
+            raise
+        future.set_result(result)
+        self.resize(key, size(result))
+        return result, False
+
+    def resize(self, key: str, size: int) -> None:
+        """records the memory held by a key's result, e.g. once a streamed run has finished."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        self._bytes += size - entry.size
+        entry.size = size
+        self._evict()
+
+    def discard(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def _get(self, key: str) -> _Entry | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.monotonic():
+            self.discard(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _evict(self) -> None:
+        while self._entries and (
+            len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+        ):
+            key, entry = next(iter(self._entries.items()))
+            if not entry.future.done():
+                # never evict an in-flight request, duplicates must be able to attach to it
+                self._entries.move_to_end(key)
+                if all(not e.future.done() for e in self._entries.values()):
+                    return
+                continue
+            self.discard(key)
+            metrics.incr("idempotency.evicted")
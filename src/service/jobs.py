@@ -0,0 +1,268 @@
+import asyncio
+import logging
+import os
+from collections.abc import AsyncGenerator, Callable
+from datetime import datetime, timezone
+from typing import Any
+from uuid import UUID, uuid4
+
+import aiosqlite
+from langgraph.graph.state import CompiledStateGraph
+
+from core import metrics
+from schema import ChatMessage, JobStatus, UserInput
+from service.admission import AdmissionController, Draining, Priority
+from service.utils import langchain_to_chat_message
+
+logger = logging.getLogger(__name__)
+
+# builds the graph kwargs and run id for a job, service._parse_input
+InputParser = Callable[[UserInput], tuple[dict[str, Any], UUID]]
+
+FINISHED = ("succeeded", "failed", "cancelled")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    agent_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    thread_id TEXT NOT NULL,
+    run_id TEXT,
+    input TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    created_at TEXT NOT NULL,
+    started_at TEXT,
+    finished_at TEXT
+)
+"""
+
+_STATUS_COLUMNS = (
+    "job_id, agent_id, status, thread_id, run_id, created_at, started_at, finished_at, error"
+)
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class JobManager:
+    """long running agent invocations decoupled from the http request that submits them.
+
+    jobs are recorded in a sqlite table and run by `max_workers` background
+    workers, so at most that many heavy runs are in flight. jobs still queued
+    when the service stops are picked up on the next start; jobs that were
+    running are marked failed, since re-running them would repeat the turn.
+    """
+
+    def __init__(
+        self,
+        db_path: str | os.PathLike,
+        *,
+        get_agent: Callable[[str], CompiledStateGraph],
+        parse_input: InputParser,
+        admission: AdmissionController,
+        max_workers: int,
+        timeout: float,
+        new_id: Callable[[], UUID] = uuid4,
+    ) -> None:
+        self.db_path = db_path
+        self.get_agent = get_agent
+        self.parse_input = parse_input
+        self.admission = admission
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.new_id = new_id
+        self._db: aiosqlite.Connection | None = None
+        self._queue: asyncio.Queue[str] = asyncio.Queue()
+        self._workers: list[asyncio.Task] = []
+        self._running: dict[str, asyncio.Task] = {}
+        # woken on every status change of a job, for long polling and subscriptions
+        self._changed: dict[str, asyncio.Event] = {}
+
+    @property
+    def db(self) -> aiosqlite.Connection:
+        if self._db is None:
+            raise RuntimeError("JobManager is not started")
+        return self._db
+
+    async def start(self) -> None:
+        self._db = await aiosqlite.connect(self.db_path)
+        await self.db.execute(_SCHEMA)
+        await self.db.execute(
+            "UPDATE jobs SET status = 'failed', error = 'Interrupted by a restart', "
+            "finished_at = ? WHERE status = 'running'",
+            (_now(),),
+        )
+        await self.db.commit()
+        self._queue = asyncio.Queue()
+        async with self.db.execute(
+            "SELECT job_id FROM jobs WHERE status = 'queued' ORDER BY created_at"
+        ) as cursor:
+            async for (job_id,) in cursor:
+                self._queue.put_nowait(job_id)
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.max_workers)]
+
+    async def stop(self) -> None:
+        # running jobs are cancelled and recorded as such, queued ones stay queued
+        for task in self._workers + list(self._running.values()):
+            task.cancel()
+        await asyncio.gather(*self._workers, *self._running.values(), return_exceptions=True)
+        self._workers = []
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+
+    async def submit(self, agent_id: str, user_input: UserInput) -> JobStatus:
+        job_id = str(self.new_id())
+        user_input = user_input.model_copy(
+            update={"thread_id": user_input.thread_id or str(self.new_id())}
+        )
+        await self.db.execute(
+            "INSERT INTO jobs (job_id, agent_id, status, thread_id, input, created_at) "
+            "VALUES (?, ?, 'queued', ?, ?, ?)",
+            (job_id, agent_id, user_input.thread_id, user_input.model_dump_json(), _now()),
+        )
+        await self.db.commit()
+        self._queue.put_nowait(job_id)
+        metrics.incr("jobs.submitted")
+        return await self.get(job_id)
+
+    async def get(self, job_id: str) -> JobStatus | None:
+        async with self.db.execute(
+            f"SELECT {_STATUS_COLUMNS} FROM jobs WHERE job_id = ?", (job_id,)
+        ) as cursor:
+            row = await cursor.fetchone()
+        if row is None:
+            return None
+        return JobStatus(**dict(zip(_STATUS_COLUMNS.split(", "), row)))
+
+    async def result(self, job_id: str) -> ChatMessage | None:
+        async with self.db.execute(
+            "SELECT result FROM jobs WHERE job_id = ?", (job_id,)
+        ) as cursor:
+            row = await cursor.fetchone()
+        if row is None or row[0] is None:
+            return None
+        return ChatMessage.model_validate_json(row[0])
+
+    async def wait(self, job_id: str, timeout: float) -> JobStatus | None:
+        """long poll: returns once the job has finished or `timeout` seconds have passed."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            # registered before reading the status, so a change in between still wakes us
+            changed = self._changed.setdefault(job_id, asyncio.Event())
+            job = await self.get(job_id)
+            remaining = deadline - loop.time()
+            if job is None or job.status in FINISHED:
+                # it won't change again, nobody can still be waiting on this event
+                self._changed.pop(job_id, None)
+                return job
+            if remaining <= 0:
+                return job
+            try:
+                await asyncio.wait_for(changed.wait(), remaining)
+            except TimeoutError:
+                pass
+
+    async def subscribe(self, job_id: str) -> AsyncGenerator[JobStatus, None]:
+        """yields the job's status now and on every change until it finishes."""
+        while True:
+            # registered before reading the status and kept across the yield, so a change
+            # while the subscriber is busy is still delivered
+            changed = self._changed.setdefault(job_id, asyncio.Event())
+            job = await self.get(job_id)
+            if job is None or job.status in FINISHED:
+                self._changed.pop(job_id, None)
+            if job is None:
+                return
+            yield job
+            if job.status in FINISHED:
+                return
+            await changed.wait()
+
+    async def cancel(self, job_id: str) -> JobStatus | None:
+        if task := self._running.get(job_id):
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        # also covers a job cancelled after being picked up but before it started running
+        await self._update(job_id, "cancelled", only_if="queued")
+        return await self.get(job_id)
+
+    def _notify(self, job_id: str) -> None:
+        if changed := self._changed.pop(job_id, None):
+            changed.set()
+
+    async def _update(
+        self, job_id: str, status: str, only_if: str | None = None, **fields: Any
+    ) -> None:
+        fields["status"] = status
+        if status == "running":
+            fields["started_at"] = _now()
+        elif status in FINISHED:
+            fields["finished_at"] = _now()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        query = f"UPDATE jobs SET {assignments} WHERE job_id = ?"
+        params = [*fields.values(), job_id]
+        if only_if is not None:
+            query += " AND status = ?"
+            params.append(only_if)
+        await self.db.execute(query, params)
+        await self.db.commit()
+        self._notify(job_id)
+
+    async def _work(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            async with self.db.execute(
+                "SELECT agent_id, input FROM jobs WHERE job_id = ? AND status = 'queued'",
+                (job_id,),
+            ) as cursor:
+                row = await cursor.fetchone()
+            if row is None:
+                # cancelled while queued
+                continue
+            agent_id, raw_input = row
+            task = asyncio.create_task(
+                self._run(job_id, agent_id, UserInput.model_validate_json(raw_input))
+            )
+            self._running[job_id] = task
+            try:
+                await asyncio.shield(task)
+            except asyncio.CancelledError:
+                if not task.done():
+                    # the worker itself is being stopped
+                    task.cancel()
+                    await asyncio.gather(task, return_exceptions=True)
+                    raise
+            finally:
+                self._running.pop(job_id, None)
+
+    async def _run(self, job_id: str, agent_id: str, user_input: UserInput) -> None:
+        try:
+            kwargs, run_id = self.parse_input(user_input)
+            # background work, a job stays queued while interactive traffic needs the capacity
+            async with self.admission.slot(user_input, Priority.BACKGROUND):
+                await self._update(job_id, "running", run_id=str(run_id))
+                response = await asyncio.wait_for(
+                    self.get_agent(agent_id).ainvoke(**kwargs), self.timeout
+                )
+            output = langchain_to_chat_message(response["messages"][-1])
+            output.run_id = str(run_id)
+            await self._update(job_id, "succeeded", result=output.model_dump_json())
+            metrics.incr("jobs.succeeded")
+        except asyncio.CancelledError:
+            await self._update(job_id, "cancelled")
+            metrics.incr("jobs.cancelled")
+            raise
+        except TimeoutError:
+            await self._update(job_id, "failed", error="Timed out")
+            metrics.incr("jobs.failed")
+        except Draining:
+            # never started, it stays queued for the next start of the service
+            metrics.incr("jobs.deferred")
+        except Exception as e:
+            logger.error(f"An exception occurred in job {job_id}: {e}")
+            await self._update(job_id, "failed", error=getattr(e, "detail", "Unexpected error"))
+            metrics.incr("jobs.failed")
@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from langchain_core.messages import HumanMessage
+
+from agents.llama_guard import LlamaGuard
+from agents.supervisor import search_tools
+from core import get_model, metrics, settings
+from core.checkpoint import ShardedSqliteSaver
+from schema import ComponentReadiness, ReadinessStatus
+
+logger = logging.getLogger(__name__)
+
+
+class Readiness:
+    """the warm-up state of the service, reported by /ready.
+
+    the service is ready once the warm-up finished and every required
+    component warmed up, until it starts draining for shutdown. optional
+    components (provider connections, the graph pass) are reported too, but
+    a failure there never holds traffic back: the first request would simply
+    pay for it as before.
+    """
+
+    def __init__(self) -> None:
+        self.components: dict[str, ComponentReadiness] = {}
+        self.warmed = False
+        self.draining = False
+
+    @property
+    def ready(self) -> bool:
+        if self.draining or not self.warmed:
+            return False
+        return all(c.ok for c in self.components.values() if c.required)
+
+    def status(self) -> ReadinessStatus:
+        return ReadinessStatus(
+            ready=self.ready, draining=self.draining, components=dict(self.components)
+        )
+
+    async def warm(
+        self,
+        name: str,
+        warm_up: Callable[[], Awaitable[Any]],
+        *,
+        required: bool = True,
+        timeout: float | None = None,
+    ) -> bool:
+        """runs one warm-up step, recording how long it took and whether it worked."""
+        self.components[name] = ComponentReadiness(ok=False, required=required)
+        start = time.perf_counter()
+        error = None
+        try:
+            await asyncio.wait_for(warm_up(), timeout)
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            logger.warning(f"Warm-up of {name} failed: {error}")
+            metrics.incr(f"prewarm.{name}.failed")
+        seconds = time.perf_counter() - start
+        metrics.observe(f"prewarm.{name}.seconds", seconds)
+        self.components[name] = ComponentReadiness(
+            ok=error is None, seconds=round(seconds, 4), required=required, error=error
+        )
+        return error is None
+
+
+async def _instantiate_models() -> None:
+    # importing the provider packages blocks, keep it off the event loop
+    await asyncio.to_thread(lambda: [get_model(model) for model in settings.AVAILABLE_MODELS])
+
+
+async def _open_provider_connections() -> None:
+    # the openai and groq sdk clients behind the langchain models, fake models have none
+    clients = {}
+    for model in settings.AVAILABLE_MODELS:
+        client = getattr(getattr(get_model(model), "async_client", None), "_client", None)
+        if client is not None:
+            # the models share the http pools, one request per provider host warms them
+            clients[str(client.base_url)] = client
+    # listing models costs no tokens and leaves a resolved, tls-established connection
+    # in the pool the chat calls are sent through
+    await asyncio.gather(*(client.models.list() for client in clients.values()))
+
+
+async def _warm_guard() -> None:
+    guard = LlamaGuard()
+    if guard.model is not None:
+        guard._compile_prompt("User", [HumanMessage(content="hello")])
+
+
+async def _build_search_tools() -> None:
+    await asyncio.to_thread(search_tools)
+
+
+async def prewarm(
+    readiness: Readiness,
+    saver: ShardedSqliteSaver,
+    graph_pass: Callable[[], Awaitable[None]] | None = None,
+) -> None:
+    """warms everything the first requests would otherwise wait on, then marks the service ready.
+
+    `graph_pass`, when given, runs the default agent once and is optional like
+    the provider connections.
+    """
+    timeout = settings.PREWARM_TIMEOUT
+    await readiness.warm("checkpointer", saver.warm, timeout=timeout)
+    await readiness.warm("models", _instantiate_models, timeout=timeout)
+    await readiness.warm(
+        "provider_connections", _open_provider_connections, required=False, timeout=timeout
+    )
+    await readiness.warm("guard", _warm_guard, timeout=timeout)
+    await readiness.warm("search", _build_search_tools, timeout=timeout)
+    if graph_pass is not None:
+        await readiness.warm("graph_pass", graph_pass, required=False, timeout=timeout)
+    readiness.warmed = True
+    metrics.gauge("prewarm.ready", int(readiness.ready))
+    logger.info(f"Warm-up finished, ready: {readiness.ready}")
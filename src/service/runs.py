@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import os
+import struct
+from collections import deque
+from collections.abc import AsyncGenerator
+from pathlib import Path
+
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+_LENGTH = struct.Struct(">I")
+
+
+class FramesEvicted(Exception):
+    """the requested frames are no longer held by the replay buffer."""
+
+
+class ReplayBuffer:
+    """frames of one run, numbered from 0.
+
+    the newest `max_frames` stay in memory; older ones are appended to
+    `spill_path` when it is set and dropped otherwise.
+    """
+
+    def __init__(self, max_frames: int, spill_path: Path | None = None) -> None:
+        self.max_frames = max_frames
+        self.spill_path = spill_path
+        self.frames: deque[bytes] = deque()
+        self.first_seq = 0  # seq of frames[0]
+
+    @property
+    def next_seq(self) -> int:
+        return self.first_seq + len(self.frames)
+
+    def append(self, frame: bytes) -> int:
+        self.frames.append(frame)
+        if len(self.frames) > self.max_frames:
+            evicted = self.frames.popleft()
+            if self.spill_path is not None:
+                with self.spill_path.open("ab") as f:
+                    f.write(_LENGTH.pack(len(evicted)) + evicted)
+            self.first_seq += 1
+        return self.next_seq - 1
+
+    def _read_spill(self, start: int) -> list[tuple[int, bytes]]:
+        frames = []
+        with self.spill_path.open("rb") as f:
+            for seq in range(self.first_seq):
+                (size,) = _LENGTH.unpack(f.read(_LENGTH.size))
+                if seq < start:
+                    f.seek(size, os.SEEK_CUR)
+                else:
+                    frames.append((seq, f.read(size)))
+        return frames
+
+    def read(self, after: int) -> list[tuple[int, bytes]]:
+        """frames with a seq greater than `after`, as (seq, frame) pairs."""
+        start = after + 1
+        frames = []
+        if start < self.first_seq:
+            if self.spill_path is None:
+                raise FramesEvicted(f"frames before {self.first_seq} were evicted")
+            frames = self._read_spill(start)
+        offset = max(start - self.first_seq, 0)
+        frames.extend(
+            (self.first_seq + i, self.frames[i]) for i in range(offset, len(self.frames))
+        )
+        return frames
+
+    def close(self) -> None:
+        if self.spill_path is not None:
+            self.spill_path.unlink(missing_ok=True)
+            self.spill_path = None
+
+
+class StreamRun:
+    """a streaming run whose frames outlive the request that started it."""
+
+    def __init__(self, run_id: str, buffer: ReplayBuffer) -> None:
+        self.run_id = run_id
+        self.buffer = buffer
+        self.done = False
+        self.failed = False
+        self.readers = 0
+        self.task: asyncio.Task | None = None
+        self.reaper: asyncio.TimerHandle | None = None
+        self._changed = asyncio.Event()
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def produce(self, frames: AsyncGenerator[bytes, None]) -> None:
+        try:
+            async for frame in frames:
+                self.buffer.append(frame)
+                self._notify()
+        except Exception:
+            # the frames end the run with an error frame of their own before raising
+            self.failed = True
+        finally:
+            self.done = True
+            self._notify()
+
+    async def follow(self, after: int) -> AsyncGenerator[tuple[int, bytes], None]:
+        """yields the frames after seq `after`, then new ones as they arrive, until the run ends."""
+        while True:
+            for seq, frame in self.buffer.read(after):
+                yield seq, frame
+                after = seq
+            if self.done and after >= self.buffer.next_seq - 1:
+                return
+            # nothing awaited since the read above, so no frame can slip in before the wait
+            await self._changed.wait()
+
+
+class RunRegistry:
+    """streaming runs that clients can reattach to with Last-Event-ID.
+
+    a run keeps going while no client is attached for `grace` seconds and is
+    cancelled after that. finished runs stay available for `ttl` seconds.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_frames: int,
+        spill_dir: str | os.PathLike | None,
+        grace: float,
+        ttl: float,
+    ) -> None:
+        self.max_frames = max_frames
+        self.spill_dir = Path(spill_dir) if spill_dir else None
+        self.grace = grace
+        self.ttl = ttl
+        self.runs: dict[str, StreamRun] = {}
+
+    def start(self, run_id: str, frames: AsyncGenerator[bytes, None]) -> StreamRun:
+        spill_path = None
+        if self.spill_dir is not None:
+            self.spill_dir.mkdir(parents=True, exist_ok=True)
+            spill_path = self.spill_dir / f"{run_id}.frames"
+        run = StreamRun(run_id, ReplayBuffer(self.max_frames, spill_path))
+        run.task = asyncio.create_task(run.produce(frames))
+        run.task.add_done_callback(lambda _: self._finished(run))
+        self.runs[run_id] = run
+        return run
+
+    def get(self, run_id: str) -> StreamRun | None:
+        return self.runs.get(run_id)
+
+    async def attach(self, run: StreamRun, after: int) -> AsyncGenerator[tuple[int, bytes], None]:
+        """follows `run`; when the last reader detaches the grace period starts."""
+        run.readers += 1
+        if run.reaper is not None:
+            run.reaper.cancel()
+            run.reaper = None
+        try:
+            async for item in run.follow(after):
+                yield item
+        finally:
+            run.readers -= 1
+            if not run.readers and not run.done:
+                run.reaper = asyncio.get_running_loop().call_later(self.grace, self._reap, run)
+
+    def _reap(self, run: StreamRun) -> None:
+        if run.readers or run.done or run.task is None:
+            return
+        logger.info(f"Cancelling run {run.run_id}, no client reattached")
+        metrics.incr("stream.cancelled.abandoned")
+        run.task.cancel()
+
+    def _finished(self, run: StreamRun) -> None:
+        asyncio.get_running_loop().call_later(self.ttl, self._remove, run)
+
+    def _remove(self, run: StreamRun) -> None:
+        if self.runs.get(run.run_id) is run:
+            del self.runs[run.run_id]
+        run.buffer.close()
+
+    async def close(self) -> None:
+        """cancels every run still going, on shutdown."""
+        tasks = [run.task for run in self.runs.values() if run.task and not run.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for run in list(self.runs.values()):
+            self._remove(run)
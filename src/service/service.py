@@ -1,39 +1,75 @@
-import json
+import asyncio
+import hashlib
 import logging
+import math
+import os
+import time
 import warnings
 from collections.abc import AsyncGenerator
-from contextlib import asynccontextmanager
+from contextlib import aclosing, asynccontextmanager
+from datetime import datetime
+from functools import cache
 from typing import Annotated, Any
-from uuid import UUID, uuid4
+from uuid import UUID
 
-from fastapi import APIRouter, Depends, FastAPI, HTTPException, status
+from fastapi import (
+    APIRouter,
+    Depends,
+    FastAPI,
+    Header,
+    HTTPException,
+    Request,
+    Response,
+    WebSocket,
+    status,
+)
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from langchain_core._api import LangChainBetaWarning
-from langchain_core.messages import AnyMessage, HumanMessage
+from langchain_core.messages import AIMessage, AnyMessage, HumanMessage, ToolMessage
 from langchain_core.runnables import RunnableConfig
-from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
 from langgraph.graph.state import CompiledStateGraph
-from langsmith import Client as LangsmithClient
+from starlette.background import BackgroundTask
 
 from agents import DEFAULT_AGENT, get_agent, get_all_agent_info
-from core import settings
+from core import metrics, settings
+from core.checkpoint import ShardedSqliteSaver, shard_paths
+from core.llm import fake_models
+from core.sharding import owned_uuid
 from schema import (
+    BatchInput,
     ChatHistory,
     ChatHistoryInput,
     ChatMessage,
     Feedback,
     FeedbackResponse,
+    ForkInput,
+    ForkResponse,
+    JobStatus,
+    ReadinessStatus,
     ServiceMetadata,
     StreamInput,
     UserInput,
 )
-from service.utils import (
-    convert_message_content_to_string,
-    langchain_to_chat_message,
-    remove_tool_calls,
+from service.admission import AdmissionController, Draining, Overloaded, Priority, Ticket
+from service.batch import run_batch
+from service.export import EXPORT_MEDIA_TYPES, ExportFormat, encode_export, iter_threads
+from service.feedback import FeedbackPipeline, default_sink
+from service.idempotency import IdempotencyConflict, IdempotencyStore, fingerprint
+from service.jobs import JobManager
+from service.prewarm import Readiness, prewarm
+from service.shutdown import GracefulShutdown
+from service.runs import RunRegistry, StreamRun
+from service.session import ChatSession
+from service.streaming import (
+    STREAM_ENGINES,
+    ClientDisconnected,
+    SSEEncoder,
+    cancel_on_disconnect,
+    coalesce_tokens,
 )
+from service.utils import compact_chat_message, langchain_to_chat_message
 
 # suppress beta warnings for cleaner logs
 warnings.filterwarnings("ignore", category=LangChainBetaWarning)
@@ -52,15 +88,94 @@ def verify_bearer(
     if not http_auth or http_auth.credentials != auth_secret:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
 
+# feedback is accepted into a bounded queue and flushed in the background
+feedback_pipeline = FeedbackPipeline(
+    default_sink(),
+    max_queue=settings.FEEDBACK_QUEUE_SIZE,
+    batch_size=settings.FEEDBACK_BATCH_SIZE,
+    max_retries=settings.FEEDBACK_MAX_RETRIES,
+    retry_backoff=settings.FEEDBACK_RETRY_BACKOFF,
+    spill_path=settings.FEEDBACK_SPILL_PATH,
+)
+
+# resumable streams keep running detached from the request that started them
+stream_runs = RunRegistry(
+    max_frames=settings.STREAM_REPLAY_MAX_FRAMES,
+    spill_dir=settings.STREAM_REPLAY_SPILL_DIR,
+    grace=settings.STREAM_RESUME_GRACE,
+    ttl=settings.STREAM_RESUME_TTL,
+)
+
+# results of requests sent with an Idempotency-Key, so client and proxy retries don't rerun them
+idempotency = IdempotencyStore(
+    ttl=settings.IDEMPOTENCY_TTL,
+    max_entries=settings.IDEMPOTENCY_MAX_KEYS,
+    max_bytes=settings.IDEMPOTENCY_MAX_BYTES,
+)
+
+# admits graph runs against the concurrency limit and the providers' rate limits, the limits
+# are the pod's and every worker process takes its share of them
+admission = AdmissionController(
+    max_concurrent=settings.worker_share(settings.ADMISSION_MAX_CONCURRENT),
+    interactive_reserve=settings.worker_share(settings.ADMISSION_INTERACTIVE_RESERVE),
+    max_queue=settings.worker_share(settings.ADMISSION_MAX_QUEUE),
+    max_wait=settings.ADMISSION_MAX_WAIT,
+    limits={key: limit.share(settings.WORKERS) for key, limit in settings.RATE_LIMITS.items()},
+    prompt_overhead=settings.ADMISSION_PROMPT_OVERHEAD_TOKENS,
+)
+
+# what has been warmed up since startup, served by /ready
+readiness = Readiness()
+
+# on SIGTERM, finishes the runs in flight before the server is allowed to stop
+shutdown = GracefulShutdown(readiness, admission, timeout=settings.SHUTDOWN_DRAIN_TIMEOUT)
+
+# one run of the default agent with the fake model, warming the graph code paths end to end
+async def _graph_pass(saver: ShardedSqliteSaver) -> None:
+    kwargs, _ = _parse_input(UserInput(message="Hello"))
+    try:
+        with fake_models():
+            await get_agent(DEFAULT_AGENT).ainvoke(**kwargs)
+    finally:
+        await saver.adelete_thread(kwargs["config"]["configurable"]["thread_id"])
+
 # async context manager for application lifespan events
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
-    async with AsyncSqliteSaver.from_conn_string("checkpoints.db") as saver:
-        agents = get_all_agent_info()
-        for a in agents:
-            agent = get_agent(a.key)
-            agent.checkpointer = saver
-        yield
+    async with ShardedSqliteSaver.open(
+        settings.CHECKPOINT_DB,
+        shards=settings.CHECKPOINT_SHARDS,
+        readers=settings.CHECKPOINT_SHARD_READERS,
+    ) as saver:
+
+        async def compile_graphs() -> None:
+            for a in get_all_agent_info():
+                agent = get_agent(a.key)
+                agent.checkpointer = saver
+
+        await readiness.warm("graphs", compile_graphs)
+        await feedback_pipeline.start()
+        await jobs.start()
+        # the rest warms up while the server already answers /ping and /ready
+        warm_up = asyncio.create_task(
+            prewarm(
+                readiness,
+                saver,
+                graph_pass=(lambda: _graph_pass(saver)) if settings.PREWARM_GRAPH_PASS else None,
+            )
+        )
+        shutdown.install()
+        try:
+            yield
+        finally:
+            shutdown.uninstall()
+            warm_up.cancel()
+            await asyncio.gather(warm_up, return_exceptions=True)
+            # whatever outlived the drain deadline is cancelled here
+            await jobs.stop()
+            await stream_runs.close()
+            await feedback_pipeline.stop(timeout=settings.SHUTDOWN_FLUSH_TIMEOUT)
+            await saver.flush()
 
 # fastapi app initialization with custom lifespan
 app = FastAPI(lifespan=lifespan)
@@ -77,22 +192,37 @@ app.add_middleware(
 # api router with dependency injection for authentication
 router = APIRouter(dependencies=[Depends(verify_bearer)])
 
-# get information about available agents and models
-@router.get("/info")
-async def info() -> ServiceMetadata:
+# agents and models are fixed for the life of the process, /info is encoded once
+@cache
+def _info_payload() -> tuple[bytes, str]:
     models = list(settings.AVAILABLE_MODELS)
     models.sort()
-    return ServiceMetadata(
+    metadata = ServiceMetadata(
         agents=get_all_agent_info(),
         models=models,
         default_agent=DEFAULT_AGENT,
         default_model=settings.DEFAULT_MODEL,
     )
+    body = metadata.model_dump_json().encode()
+    return body, f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+# get information about available agents and models, clients revalidate it with its ETag
+@router.get("/info", response_model=ServiceMetadata)
+async def info(if_none_match: Annotated[str | None, Header()] = None) -> Response:
+    body, etag = _info_payload()
+    headers = {"ETag": etag, "Cache-Control": f"private, max-age={settings.INFO_MAX_AGE}"}
+    if if_none_match and (if_none_match.strip() == "*" or etag in if_none_match.split(", ")):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+# new thread, run and job ids hash to this worker, so the router sends their follow-ups here
+def _new_id() -> UUID:
+    return owned_uuid(settings.WORKER_ID, settings.WORKERS)
 
 # parse user input to prepare configurations and run ids
 def _parse_input(user_input: UserInput) -> tuple[dict[str, Any], UUID]:
-    run_id = uuid4()
-    thread_id = user_input.thread_id or str(uuid4())
+    run_id = _new_id()
+    thread_id = user_input.thread_id or str(_new_id())
     configurable = {"thread_id": thread_id, "model": user_input.model}
     if user_input.agent_config:
         if overlap := configurable.keys() & user_input.agent_config.keys():
@@ -109,12 +239,40 @@ def _parse_input(user_input: UserInput) -> tuple[dict[str, Any], UUID]:
     }
     return kwargs, run_id
 
-# handle invoke requests for agents
-@router.post("/{agent_id}/invoke")
-@router.post("/invoke")
-async def invoke(user_input: UserInput, agent_id: str = DEFAULT_AGENT) -> ChatMessage:
+# long running invocations run by a bounded worker pool, tracked in a sqlite table
+jobs = JobManager(
+    settings.JOBS_DB,
+    get_agent=get_agent,
+    parse_input=_parse_input,
+    admission=admission,
+    max_workers=settings.JOBS_MAX_WORKERS,
+    timeout=settings.JOBS_TIMEOUT,
+    new_id=_new_id,
+)
+
+# wait for an interactive run to be admitted, shedding load with a 429 when overloaded
+# and a 503 while draining for shutdown, so the client retries on another instance
+async def _admit(user_input: UserInput) -> Ticket:
+    try:
+        return await admission.acquire(user_input, Priority.INTERACTIVE)
+    except Draining as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": str(math.ceil(e.retry_after))},
+        )
+    except Overloaded as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": str(math.ceil(e.retry_after))},
+        )
+
+# run the agent to completion and return its final message
+async def _invoke_agent(user_input: UserInput, agent_id: str) -> ChatMessage:
     agent: CompiledStateGraph = get_agent(agent_id)
     kwargs, run_id = _parse_input(user_input)
+    ticket = await _admit(user_input)
     try:
         response = await agent.ainvoke(**kwargs)
         output = langchain_to_chat_message(response["messages"][-1])
@@ -123,46 +281,157 @@ async def invoke(user_input: UserInput, agent_id: str = DEFAULT_AGENT) -> ChatMe
     except Exception as e:
         logger.error(f"An exception occurred: {e}")
         raise HTTPException(status_code=500, detail="Unexpected error")
+    finally:
+        ticket.release()
+
+# handle invoke requests for agents, retries with the same Idempotency-Key get the first result
+@router.post("/{agent_id}/invoke")
+@router.post("/invoke")
+async def invoke(
+    user_input: UserInput,
+    response: Response,
+    agent_id: str = DEFAULT_AGENT,
+    idempotency_key: Annotated[str | None, Header()] = None,
+) -> ChatMessage:
+    if idempotency_key is None:
+        return await _invoke_agent(user_input, agent_id)
+    try:
+        output, replayed = await idempotency.run(
+            idempotency_key,
+            fingerprint("invoke", agent_id, user_input),
+            lambda: _invoke_agent(user_input, agent_id),
+            size=lambda output: len(output.model_dump_json()),
+        )
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return output
+
+# run many inputs in one request, results stream back as ndjson in completion order
+@router.post("/{agent_id}/batch", response_class=StreamingResponse)
+@router.post("/batch", response_class=StreamingResponse)
+async def batch(batch_input: BatchInput, agent_id: str = DEFAULT_AGENT) -> StreamingResponse:
+    if len(batch_input.inputs) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=422, detail=f"A batch holds at most {settings.BATCH_MAX_ITEMS} inputs"
+        )
+    agent: CompiledStateGraph = get_agent(agent_id)
+    results = run_batch(
+        agent,
+        batch_input.inputs,
+        _parse_input,
+        admission=admission,
+        concurrency=min(
+            batch_input.concurrency or settings.BATCH_MAX_CONCURRENCY,
+            settings.BATCH_MAX_CONCURRENCY,
+        ),
+        timeout=min(
+            batch_input.timeout or settings.BATCH_ITEM_TIMEOUT, settings.BATCH_ITEM_TIMEOUT
+        ),
+    )
+
+    async def lines() -> AsyncGenerator[bytes, None]:
+        # closing the results cancels the inputs still running if the client goes away
+        async with aclosing(results):
+            async for result in results:
+                yield result.model_dump_json().encode() + b"\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+# encodes a resumable run's events, the frames are kept by its replay buffer
+async def _sse_frames(
+    events: AsyncGenerator[Any, None], encoder: SSEEncoder
+) -> AsyncGenerator[bytes, None]:
+    started = time.monotonic()
+    try:
+        async for event in events:
+            yield encoder.encode(event)
+    except Exception as e:
+        # the run ends with an error frame, so a reader can tell it apart from a finished answer
+        logger.error(f"An exception occurred: {e}")
+        metrics.incr("stream.failed")
+        yield encoder.encode(("error", "Unexpected error"))
+        yield encoder.DONE
+        # and the run is marked failed, see StreamRun.produce
+        raise
+    metrics.incr("stream.completed")
+    metrics.observe("stream.duration_seconds", time.monotonic() - started)
+    yield encoder.DONE
+
+# follows a detached run, tagging each frame with its `run_id:seq` event id if asked to
+async def _replay_frames(
+    run: StreamRun, after: int, with_ids: bool = True
+) -> AsyncGenerator[bytes, None]:
+    run_id = run.run_id.encode()
+    async for seq, frame in stream_runs.attach(run, after):
+        yield b"id: %s:%d\n" % (run_id, seq) + frame if with_ids else frame
+
+# start a streaming run detached from the request, in the registry clients reattach to
+async def _start_stream_run(user_input: StreamInput, agent_id: str) -> StreamRun:
+    agent: CompiledStateGraph = get_agent(agent_id)
+    kwargs, run_id = _parse_input(user_input)
+    ticket = await _admit(user_input)
+    events = coalesce_tokens(
+        STREAM_ENGINES[settings.STREAM_ENGINE](agent, kwargs, run_id, user_input),
+        window=user_input.stream_window_ms / 1000,
+        max_chars=settings.STREAM_MAX_FRAME_CHARS,
+    )
+    metrics.incr("stream.started")
+    run = stream_runs.start(str(run_id), _sse_frames(events, SSEEncoder()))
+    # the slot is held until the run ends, not until its first reader leaves
+    run.task.add_done_callback(lambda _: ticket.release())
+    return run
 
-# generator function for streaming responses
+# generator function for streaming responses, the graph run is cancelled if the client leaves
 async def message_generator(
-    user_input: StreamInput, agent_id: str = DEFAULT_AGENT
-) -> AsyncGenerator[str, None]:
+    user_input: StreamInput, request: Request, agent_id: str, ticket: Ticket
+) -> AsyncGenerator[bytes, None]:
+    try:
+        async with aclosing(_stream_frames(user_input, request, agent_id)) as frames:
+            async for frame in frames:
+                yield frame
+    finally:
+        ticket.release()
+
+# encodes a run's events as they are produced, for message_generator
+async def _stream_frames(
+    user_input: StreamInput, request: Request, agent_id: str
+) -> AsyncGenerator[bytes, None]:
     agent: CompiledStateGraph = get_agent(agent_id)
     kwargs, run_id = _parse_input(user_input)
-    async for event in agent.astream_events(**kwargs, version="v2"):
-        if not event:
-            continue
-        new_messages = []
-        if (
-            event["event"] == "on_chain_end"
-            and any(t.startswith("graph:step:") for t in event.get("tags", []))
-            and "messages" in event["data"]["output"]
-        ):
-            new_messages = event["data"]["output"]["messages"]
-        if event["event"] == "on_custom_event" and "custom_data_dispatch" in event.get("tags", []):
-            new_messages = [event["data"]]
-        for message in new_messages:
-            try:
-                chat_message = langchain_to_chat_message(message)
-                chat_message.run_id = str(run_id)
-            except Exception as e:
-                logger.error(f"Error parsing message: {e}")
-                yield f"data: {json.dumps({'type': 'error', 'content': 'Unexpected error'})}\n\n"
-                continue
-            if chat_message.type == "human" and chat_message.content == user_input.message:
-                continue
-            yield f"data: {json.dumps({'type': 'message', 'content': chat_message.model_dump()})}\n\n"
-        if (
-            event["event"] == "on_chat_model_stream"
-            and user_input.stream_tokens
-            and "llama_guard" not in event.get("tags", [])
-        ):
-            content = remove_tool_calls(event["data"]["chunk"].content)
-            if content:
-                yield f"data: {json.dumps({'type': 'token', 'content': convert_message_content_to_string(content)})}\n\n"
-            continue
-    yield "data: [DONE]\n\n"
+    encoder = SSEEncoder()
+    events = coalesce_tokens(
+        STREAM_ENGINES[settings.STREAM_ENGINE](agent, kwargs, run_id, user_input),
+        window=user_input.stream_window_ms / 1000,
+        max_chars=settings.STREAM_MAX_FRAME_CHARS,
+    )
+    metrics.incr("stream.started")
+    events = cancel_on_disconnect(
+        events, request.is_disconnected, poll_interval=settings.STREAM_DISCONNECT_POLL
+    )
+    started = time.monotonic()
+    try:
+        async for event in events:
+            yield encoder.encode(event)
+    except ClientDisconnected:
+        metrics.incr("stream.cancelled.disconnect")
+        metrics.observe("stream.cancelled_after_seconds", time.monotonic() - started)
+        return
+    except asyncio.CancelledError:
+        # the server cancelled the response, on disconnect or shutdown
+        metrics.incr("stream.cancelled.aborted")
+        metrics.observe("stream.cancelled_after_seconds", time.monotonic() - started)
+        raise
+    except Exception as e:
+        logger.error(f"An exception occurred: {e}")
+        metrics.incr("stream.failed")
+        yield encoder.encode(("error", "Unexpected error"))
+        yield encoder.DONE
+        return
+    metrics.incr("stream.completed")
+    metrics.observe("stream.duration_seconds", time.monotonic() - started)
+    yield encoder.DONE
 
 # example response schema for sse
 def _sse_response_example() -> dict[int, Any]:
@@ -183,31 +452,98 @@ def _sse_response_example() -> dict[int, Any]:
     "/{agent_id}/stream", response_class=StreamingResponse, responses=_sse_response_example()
 )
 @router.post("/stream", response_class=StreamingResponse, responses=_sse_response_example())
-async def stream(user_input: StreamInput, agent_id: str = DEFAULT_AGENT) -> StreamingResponse:
+async def stream(
+    user_input: StreamInput,
+    request: Request,
+    agent_id: str = DEFAULT_AGENT,
+    idempotency_key: Annotated[str | None, Header()] = None,
+) -> StreamingResponse:
+    if idempotency_key is None and user_input.resumable:
+        # the run outlives this response, a client that reconnects within the grace
+        # period picks it up from GET /stream/{run_id}
+        run = await _start_stream_run(user_input, agent_id)
+        return StreamingResponse(_replay_frames(run, after=-1), media_type="text/event-stream")
+    if idempotency_key is None:
+        ticket = await _admit(user_input)
+        return StreamingResponse(
+            message_generator(user_input, request, agent_id, ticket),
+            media_type="text/event-stream",
+            # also frees the slot when the response ends before the generator ever ran
+            background=BackgroundTask(ticket.release),
+        )
+    # keyed streams run detached, so a retry attaches to the same run and replays its frames
+    key_fingerprint = fingerprint("stream", agent_id, user_input)
+
+    async def start() -> StreamRun:
+        run = await _start_stream_run(user_input, agent_id)
+
+        def finished(task: asyncio.Task) -> None:
+            if task.cancelled() or run.failed:
+                # like a failed /invoke, a retry with the same key runs again
+                idempotency.discard(idempotency_key)
+            else:
+                idempotency.resize(idempotency_key, sum(map(len, run.buffer.frames)))
+
+        run.task.add_done_callback(finished)
+        return run
+
+    try:
+        run, replayed = await idempotency.run(idempotency_key, key_fingerprint, start)
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if run.buffer.first_seq and run.buffer.spill_path is None:
+        raise HTTPException(status_code=410, detail="The stream is no longer available to replay")
     return StreamingResponse(
-        message_generator(user_input, agent_id),
+        _replay_frames(run, after=-1, with_ids=user_input.resumable),
         media_type="text/event-stream",
+        headers={"Idempotent-Replayed": "true"} if replayed else None,
     )
 
+# reattach to a resumable stream, replaying only the frames after Last-Event-ID
+@router.get(
+    "/stream/{run_id}", response_class=StreamingResponse, responses=_sse_response_example()
+)
+async def resume_stream(
+    run_id: str, last_event_id: Annotated[str | None, Header()] = None
+) -> StreamingResponse:
+    run = stream_runs.get(run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Run not found or expired")
+    after = -1
+    if last_event_id:
+        event_run_id, _, seq = last_event_id.rpartition(":")
+        if event_run_id != run_id or not seq.isdigit():
+            raise HTTPException(status_code=422, detail="Last-Event-ID does not belong to this run")
+        after = int(seq)
+    if after + 1 < run.buffer.first_seq and run.buffer.spill_path is None:
+        raise HTTPException(status_code=410, detail="Missed frames are no longer available")
+    metrics.incr("stream.resumed")
+    return StreamingResponse(_replay_frames(run, after), media_type="text/event-stream")
+
 # submit feedback about a specific run
 @router.post("/feedback")
 async def feedback(feedback: Feedback) -> FeedbackResponse:
-    client = LangsmithClient()
-    kwargs = feedback.kwargs or {}
-    client.create_feedback(
-        run_id=feedback.run_id,
-        key=feedback.key,
-        score=feedback.score,
-        **kwargs,
-    )
+    feedback_pipeline.submit(feedback)
     return FeedbackResponse()
 
-# fetch chat history for a specific thread
+# fetch chat history for a specific thread, paginated and optionally as a delta
 @router.post("/history")
-def history(input: ChatHistoryInput) -> ChatHistory:
+async def history(input: ChatHistoryInput) -> ChatHistory:
     agent: CompiledStateGraph = get_agent(DEFAULT_AGENT)
+    if input.since is not None:
+        start = input.since
+    elif input.cursor:
+        try:
+            start = int(input.cursor)
+        except ValueError:
+            raise HTTPException(status_code=422, detail="Invalid history cursor")
+        # a negative index would slice from the end of the thread
+        if start < 0:
+            raise HTTPException(status_code=422, detail="Invalid history cursor")
+    else:
+        start = 0
     try:
-        state_snapshot = agent.get_state(
+        state_snapshot = await agent.aget_state(
             config=RunnableConfig(
                 configurable={
                     "thread_id": input.thread_id,
@@ -215,16 +551,188 @@ def history(input: ChatHistoryInput) -> ChatHistory:
             )
         )
         messages: list[AnyMessage] = state_snapshot.values["messages"]
-        chat_messages: list[ChatMessage] = [langchain_to_chat_message(m) for m in messages]
-        return ChatHistory(messages=chat_messages)
+        total = len(messages)
+        end = total if input.limit is None else min(total, start + input.limit)
+        chat_messages: list[ChatMessage] = [
+            langchain_to_chat_message(m) for m in messages[start:end]
+        ]
+        if input.compact:
+            chat_messages = [compact_chat_message(m) for m in chat_messages]
+        return ChatHistory(
+            messages=chat_messages,
+            start=start,
+            total=total,
+            next_cursor=str(end) if end < total else None,
+        )
+    except Exception as e:
+        logger.error(f"An exception occurred: {e}")
+        raise HTTPException(status_code=500, detail="Unexpected error")
+
+# fork a thread from one of its messages without replaying the conversation. the fork is a
+# copy, not a reference: its thread id may hash to another shard or worker than the parent's
+@router.post("/{agent_id}/fork")
+@router.post("/fork")
+async def fork(input: ForkInput, agent_id: str = DEFAULT_AGENT) -> ForkResponse:
+    agent: CompiledStateGraph = get_agent(agent_id)
+    parent = await agent.aget_state(
+        config=RunnableConfig(configurable={"thread_id": input.thread_id})
+    )
+    messages: list[AnyMessage] = parent.values.get("messages", [])
+    if not messages:
+        raise HTTPException(status_code=404, detail="Thread not found")
+    end = len(messages) if input.message_index is None else input.message_index
+    if not 0 < end <= len(messages):
+        raise HTTPException(
+            status_code=422, detail=f"message_index must be between 1 and {len(messages)}"
+        )
+    # providers reject a history with tool calls whose results were cut off
+    kept = messages[:end]
+    called = {c["id"] for m in kept if isinstance(m, AIMessage) for c in m.tool_calls}
+    answered = {m.tool_call_id for m in kept if isinstance(m, ToolMessage)}
+    if called - answered:
+        raise HTTPException(
+            status_code=422,
+            detail="message_index cuts a tool call off from its result, fork before the tool call",
+        )
+    # the fork is a single checkpoint holding the parent's messages cut at the chosen one,
+    # written as if by the parent's last node so the next turn starts from START. the rest
+    # of the parent's state (safety, needs_search, ...) routed its own turns and isn't
+    # copied, except what that last node wrote itself: its edges read it to end the turn
+    writes = (parent.metadata or {}).get("writes") or {}
+    as_node = next(iter(writes)) if len(writes) == 1 else None
+    ending = {k: v for k, v in (writes.get(as_node) or {}).items() if k != "messages"}
+    thread_id = str(_new_id())
+    try:
+        await agent.aupdate_state(
+            RunnableConfig(configurable={"thread_id": thread_id}),
+            {**ending, "messages": kept},
+            as_node=as_node,
+        )
     except Exception as e:
         logger.error(f"An exception occurred: {e}")
         raise HTTPException(status_code=500, detail="Unexpected error")
+    return ForkResponse(thread_id=thread_id, parent_thread_id=input.thread_id, message_count=end)
+
+# stream every thread updated in a time range straight from the checkpoint store
+@router.get("/export", response_class=StreamingResponse)
+async def export(
+    format: ExportFormat = "ndjson",
+    since: datetime | None = None,
+    until: datetime | None = None,
+    cursor: str | None = None,
+    limit: int | None = None,
+) -> StreamingResponse:
+    # every worker of the pod is read, not just this one, so any of them can answer
+    paths = [
+        path
+        for db in settings.pod_checkpoint_dbs()
+        for path in shard_paths(db, settings.CHECKPOINT_SHARDS)
+        if os.path.exists(path)
+    ]
+    records = iter_threads(
+        paths,
+        since=since,
+        until=until,
+        cursor=cursor,
+        limit=limit,
+    )
+    # sync iterator, starlette pulls it from a threadpool so sqlite reads never block the loop
+    return StreamingResponse(encode_export(records, format), media_type=EXPORT_MEDIA_TYPES[format])
+
+# websocket sessions can't use the HTTPBearer dependency, browsers can't set headers on
+# them either, so the secret is also accepted as a `token` query parameter
+def _websocket_authorized(websocket: WebSocket) -> bool:
+    if not settings.AUTH_SECRET:
+        return True
+    auth_secret = settings.AUTH_SECRET.get_secret_value()
+    scheme, _, credentials = websocket.headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and credentials == auth_secret:
+        return True
+    return websocket.query_params.get("token") == auth_secret
+
+# multi-turn chat over one websocket bound to a thread, authenticated once per connection
+@app.websocket("/{agent_id}/session")
+@app.websocket("/session")
+async def session(
+    websocket: WebSocket, agent_id: str = DEFAULT_AGENT, thread_id: str | None = None
+) -> None:
+    if not _websocket_authorized(websocket):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    try:
+        agent: CompiledStateGraph = get_agent(agent_id)
+    except KeyError:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Unknown agent")
+        return
+    await websocket.accept()
+    await ChatSession(
+        websocket, agent, thread_id or str(_new_id()), _parse_input, admission
+    ).run()
+
+# in-process counters, e.g. how many streams were abandoned by their clients
+@router.get("/metrics")
+async def get_metrics() -> dict[str, Any]:
+    return metrics.snapshot()
+
+# submit a long running invocation, the response returns as soon as it is queued
+@router.post("/{agent_id}/jobs", status_code=status.HTTP_202_ACCEPTED)
+@router.post("/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def submit_job(user_input: UserInput, agent_id: str = DEFAULT_AGENT) -> JobStatus:
+    if agent_id not in {a.key for a in get_all_agent_info()}:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    return await jobs.submit(agent_id, user_input)
+
+# job status, `wait` long polls until the job finishes or that many seconds pass
+@router.get("/jobs/{job_id}")
+async def job_status(job_id: str, wait: float = 0) -> JobStatus:
+    job = await jobs.wait(job_id, min(max(wait, 0), settings.JOBS_MAX_WAIT))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+# stream the job's status as server sent events until it finishes
+@router.get("/jobs/{job_id}/events", response_class=StreamingResponse)
+async def job_events(job_id: str) -> StreamingResponse:
+    if await jobs.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events() -> AsyncGenerator[bytes, None]:
+        async for job in jobs.subscribe(job_id):
+            yield b"data: " + job.model_dump_json().encode() + b"\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+# final message of a finished job
+@router.get("/jobs/{job_id}/result")
+async def job_result(job_id: str) -> ChatMessage:
+    job = await jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status != "succeeded":
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    return await jobs.result(job_id)
+
+# cancel a queued or running job
+@router.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str) -> JobStatus:
+    job = await jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 # health check endpoint to verify app status
 @app.get("/ping")
 async def health_check():
     return {"status": "pong!"}
 
+# readiness probe: 503 until models, connections, checkpointer and guard are warmed up,
+# and again once the service drains for shutdown
+@app.get("/ready", response_model=ReadinessStatus)
+async def ready(response: Response) -> ReadinessStatus:
+    status_ = readiness.status()
+    if not status_.ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return status_
+
 # include the router into the application
 app.include_router(router)
@@ -0,0 +1,149 @@
+import asyncio
+import logging
+from collections.abc import Callable
+from typing import Any
+from uuid import UUID
+
+import orjson
+from fastapi import HTTPException, WebSocket, WebSocketDisconnect
+from langgraph.graph.state import CompiledStateGraph
+from pydantic import ValidationError
+
+from core import metrics, settings
+from schema import StreamInput
+from service.admission import AdmissionController, Overloaded, Priority
+from service.streaming import STREAM_ENGINES, FrameEncoder, coalesce_tokens
+
+logger = logging.getLogger(__name__)
+
+# builds the graph kwargs and run id for a turn, service._parse_input
+InputParser = Callable[[StreamInput], tuple[dict[str, Any], UUID]]
+
+
+class ChatSession:
+    """one websocket carrying many turns of a single thread.
+
+    client frames are json objects with a "type":
+      {"type": "turn", ...StreamInput fields}  starts a turn (thread_id is bound to the session)
+      {"type": "cancel"}                        cancels the running turn
+      {"type": "ping"}                          answered with {"type": "pong"}
+    the server sends {"type": "session", "thread_id": ...} once, then for each
+    turn the same token/message/error objects as /stream, ending with
+    {"type": "done", "run_id": ...} or {"type": "cancelled", "run_id": ...}.
+
+    turns are pulled from the graph only as fast as frames are written to the
+    socket, so a slow reader throttles the run instead of growing a buffer.
+    each turn is admitted like an interactive request; one that can't get in
+    is answered with an error frame and "done".
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        agent: CompiledStateGraph,
+        thread_id: str,
+        parse_input: InputParser,
+        admission: AdmissionController,
+    ) -> None:
+        self.websocket = websocket
+        self.agent = agent
+        self.thread_id = thread_id
+        self.parse_input = parse_input
+        self.admission = admission
+        self.encoder = FrameEncoder()
+        self._send_lock = asyncio.Lock()
+        self._turn: asyncio.Task | None = None
+        self._run_id: UUID | None = None
+
+    async def _send(self, frame: bytes) -> None:
+        # the turn task and the reader (pongs, errors) write to the same socket
+        async with self._send_lock:
+            await self.websocket.send_text(frame.decode())
+
+    async def _send_control(self, type: str, **fields: Any) -> None:
+        await self._send(orjson.dumps({"type": type, **fields}))
+
+    async def run(self) -> None:
+        await self._send_control("session", thread_id=self.thread_id)
+        try:
+            while True:
+                raw = await self.websocket.receive_text()
+                try:
+                    frame = orjson.loads(raw)
+                    if not isinstance(frame, dict):
+                        raise ValueError("frame must be a json object")
+                except ValueError as e:
+                    await self._send(self.encoder.error(f"Invalid frame: {e}"))
+                    continue
+                match frame.pop("type", "turn"):
+                    case "turn":
+                        await self._start_turn(frame)
+                    case "cancel":
+                        await self._cancel_turn()
+                    case "ping":
+                        await self._send_control("pong")
+                    case other:
+                        await self._send(self.encoder.error(f"Unknown frame type: {other}"))
+        except WebSocketDisconnect:
+            pass
+        finally:
+            if self._turn is not None:
+                metrics.incr("session.turn.cancelled.disconnect")
+                self._turn.cancel()
+                await asyncio.gather(self._turn, return_exceptions=True)
+
+    async def _cancel_turn(self) -> None:
+        turn = self._turn
+        if turn is None:
+            return
+        # cancelling the task cancels the graph run with it, including in-flight llm calls
+        turn.cancel()
+        await asyncio.gather(turn, return_exceptions=True)
+        # a turn that finished before the cancel landed has already sent "done"
+        if turn.cancelled():
+            metrics.incr("session.turn.cancelled.client")
+            await self._send_control("cancelled", run_id=str(self._run_id))
+
+    def _turn_done(self, turn: asyncio.Task) -> None:
+        if self._turn is turn:
+            self._turn = None
+
+    async def _start_turn(self, frame: dict[str, Any]) -> None:
+        if self._turn is not None:
+            await self._send(self.encoder.error("A turn is already in progress"))
+            return
+        try:
+            user_input = StreamInput.model_validate({**frame, "thread_id": self.thread_id})
+            kwargs, run_id = self.parse_input(user_input)
+        except ValidationError as e:
+            await self._send(self.encoder.error(f"Invalid turn: {e}"))
+            return
+        except HTTPException as e:
+            await self._send(self.encoder.error(e.detail))
+            return
+        self._run_id = run_id
+        self._turn = asyncio.create_task(self._run_turn(user_input, kwargs, run_id))
+        self._turn.add_done_callback(self._turn_done)
+
+    async def _run_turn(
+        self, user_input: StreamInput, kwargs: dict[str, Any], run_id: UUID
+    ) -> None:
+        try:
+            async with self.admission.slot(user_input, Priority.INTERACTIVE):
+                events = coalesce_tokens(
+                    STREAM_ENGINES[settings.STREAM_ENGINE](
+                        self.agent, kwargs, run_id, user_input
+                    ),
+                    window=user_input.stream_window_ms / 1000,
+                    max_chars=settings.STREAM_MAX_FRAME_CHARS,
+                )
+                async for event in events:
+                    await self._send(self.encoder.encode(event))
+        except Overloaded as e:
+            await self._send(self.encoder.error(str(e)))
+        except WebSocketDisconnect:
+            return
+        except Exception as e:
+            logger.error(f"An exception occurred: {e}")
+            await self._send(self.encoder.error("Unexpected error"))
+        await self._send_control("done", run_id=str(run_id))
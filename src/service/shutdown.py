@@ -0,0 +1,98 @@
+import asyncio
+import logging
+import signal
+from types import FrameType
+from typing import Any
+
+from core import metrics
+from service.admission import AdmissionController
+from service.prewarm import Readiness
+
+logger = logging.getLogger(__name__)
+
+
+class GracefulShutdown:
+    """drains the service on SIGTERM before letting the server stop.
+
+    uvicorn stops listening as soon as it is signalled, cutting off the load
+    balancer while runs are still streaming. this takes SIGTERM first: /ready
+    turns false so no new traffic is routed here, new runs are refused with a
+    503, runs still waiting for admission (batch items included) fail with
+    Draining, and the runs in flight get up to `timeout` seconds to finish.
+    queued jobs are kept in their sqlite store for the next start. only then
+    is the signal handed on to the server, whose shutdown flushes feedback and
+    the checkpoint stores in the lifespan. a second SIGTERM hands it on right
+    away.
+    """
+
+    def __init__(
+        self, readiness: Readiness, admission: AdmissionController, *, timeout: float
+    ) -> None:
+        self.readiness = readiness
+        self.admission = admission
+        self.timeout = timeout
+        self._previous: Any = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._task: asyncio.Task | None = None
+
+    def install(self) -> None:
+        """takes over SIGTERM from the server, keeping its handler to hand the signal to."""
+        self._loop = asyncio.get_running_loop()
+        previous = signal.getsignal(signal.SIGTERM)
+        try:
+            signal.signal(signal.SIGTERM, self._on_sigterm)
+        except ValueError:
+            # not the main thread (e.g. a test client), there is no signal to wait for
+            logger.debug("Not in the main thread, SIGTERM drains nothing")
+            return
+        self._previous = previous
+
+    def uninstall(self) -> None:
+        if self._previous is not None:
+            signal.signal(signal.SIGTERM, self._previous)
+            self._previous = None
+        if self._task is not None:
+            self._task.cancel()
+
+    def _on_sigterm(self, signum: int, frame: FrameType | None) -> None:
+        if self._task is not None:
+            logger.warning("SIGTERM while draining, stopping now")
+            self._hand_over(signum, frame)
+            return
+        self._loop.call_soon_threadsafe(self._start, signum, frame)
+
+    def _start(self, signum: int, frame: FrameType | None) -> None:
+        self._task = asyncio.create_task(self._drain_then_stop(signum, frame))
+
+    async def _drain_then_stop(self, signum: int, frame: FrameType | None) -> None:
+        await self.drain()
+        self._hand_over(signum, frame)
+
+    def _hand_over(self, signum: int, frame: FrameType | None) -> None:
+        previous, self._previous = self._previous, None
+        if previous is None:
+            return
+        signal.signal(signal.SIGTERM, previous)
+        if callable(previous):
+            previous(signum, frame)
+        else:
+            signal.raise_signal(signum)
+
+    async def drain(self) -> bool:
+        """refuses new runs and waits for the admitted ones, False if the deadline cut it short."""
+        self.readiness.draining = True
+        self.admission.close()
+        metrics.gauge("shutdown.draining", 1)
+        logger.info(f"Draining {self.admission.running} runs, for up to {self.timeout:.0f}s")
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        try:
+            await asyncio.wait_for(self.admission.drained(), self.timeout)
+        except TimeoutError:
+            logger.warning(f"Drain deadline passed with {self.admission.running} runs still going")
+            metrics.incr("shutdown.drain_timeout")
+            return False
+        finally:
+            metrics.observe("shutdown.drain_seconds", loop.time() - started)
+        logger.info("Drained, stopping")
+        return True
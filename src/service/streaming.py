@@ -0,0 +1,284 @@
+import asyncio
+import logging
+from collections.abc import AsyncGenerator, AsyncIterator, Awaitable, Callable, Iterator
+from contextlib import aclosing
+from typing import Any, Literal, TypeAlias
+from uuid import UUID
+
+import orjson
+from langchain_core.messages import AIMessageChunk
+from langgraph.graph.state import CompiledStateGraph
+
+from schema import ChatMessage, StreamInput
+from service.utils import (
+    convert_message_content_to_string,
+    langchain_to_chat_message,
+    remove_tool_calls,
+)
+
+logger = logging.getLogger(__name__)
+
+# events produced by a streaming run, independent of how they are put on the wire:
+# ("token", str), ("message", ChatMessage) or ("error", str)
+StreamEvent: TypeAlias = tuple[Literal["token", "message", "error"], Any]
+
+
+def _chat_messages(
+    new_messages: list[Any], run_id: UUID, user_input: StreamInput
+) -> Iterator[StreamEvent]:
+    """converts messages produced by graph nodes, skipping the echoed user input."""
+    for message in new_messages:
+        try:
+            chat_message = langchain_to_chat_message(message)
+            chat_message.run_id = str(run_id)
+        except Exception as e:
+            logger.error(f"Error parsing message: {e}")
+            yield "error", "Unexpected error"
+            continue
+        if chat_message.type == "human" and chat_message.content == user_input.message:
+            continue
+        yield "message", chat_message
+
+
+async def astream_events_engine(
+    agent: CompiledStateGraph,
+    kwargs: dict[str, Any],
+    run_id: UUID,
+    user_input: StreamInput,
+) -> AsyncGenerator[StreamEvent, None]:
+    """runs the graph through astream_events and keeps the events the client cares about.
+
+    every runnable start/end in the graph becomes an event here, most of which
+    are filtered out by tag; kept as a fallback and as the benchmark baseline.
+    """
+    async for event in agent.astream_events(**kwargs, version="v2"):
+        if not event:
+            continue
+        new_messages = []
+        if (
+            event["event"] == "on_chain_end"
+            and any(t.startswith("graph:step:") for t in event.get("tags", []))
+            and "messages" in event["data"]["output"]
+        ):
+            new_messages = event["data"]["output"]["messages"]
+        if event["event"] == "on_custom_event" and "custom_data_dispatch" in event.get("tags", []):
+            new_messages = [event["data"]]
+        for chat_event in _chat_messages(new_messages, run_id, user_input):
+            yield chat_event
+        if (
+            event["event"] == "on_chat_model_stream"
+            and user_input.stream_tokens
+            and "llama_guard" not in event.get("tags", [])
+        ):
+            content = remove_tool_calls(event["data"]["chunk"].content)
+            if content:
+                yield "token", convert_message_content_to_string(content)
+            continue
+
+
+async def stream_modes_engine(
+    agent: CompiledStateGraph,
+    kwargs: dict[str, Any],
+    run_id: UUID,
+    user_input: StreamInput,
+) -> AsyncGenerator[StreamEvent, None]:
+    """runs the graph with langgraph's native stream modes.
+
+    "updates" carries the messages written by each node, "custom" the data
+    dispatched by nodes and "messages" the llm tokens, so nothing has to be
+    filtered out. models tagged nostream (the llama guard) never reach it.
+    """
+    stream_mode = ["updates", "custom"]
+    if user_input.stream_tokens:
+        stream_mode.append("messages")
+    async for mode, chunk in agent.astream(**kwargs, stream_mode=stream_mode):
+        match mode:
+            case "messages":
+                message, _ = chunk
+                # complete node outputs also show up here; they are sent from "updates"
+                if isinstance(message, AIMessageChunk):
+                    content = remove_tool_calls(message.content)
+                    if content:
+                        yield "token", convert_message_content_to_string(content)
+            case "updates":
+                for update in chunk.values():
+                    if isinstance(update, dict) and "messages" in update:
+                        for chat_event in _chat_messages(update["messages"], run_id, user_input):
+                            yield chat_event
+            case "custom":
+                for chat_event in _chat_messages([chunk], run_id, user_input):
+                    yield chat_event
+
+
+StreamEngine: TypeAlias = Callable[
+    [CompiledStateGraph, dict[str, Any], UUID, StreamInput], AsyncIterator[StreamEvent]
+]
+
+STREAM_ENGINES: dict[str, StreamEngine] = {
+    "modes": stream_modes_engine,
+    "events": astream_events_engine,
+}
+
+
+async def coalesce_tokens(
+    events: AsyncIterator[StreamEvent], window: float, max_chars: int
+) -> AsyncGenerator[StreamEvent, None]:
+    """merges consecutive tokens into one event, at most one every `window` seconds.
+
+    the first token after a quiet `window` is sent straight away, the ones
+    following it are buffered and flushed on a timer once `window` has passed
+    since the last token event, when `max_chars` is reached, before any other
+    event and at the end of the stream. a zero window passes tokens through.
+    """
+    if window <= 0:
+        async for event in events:
+            yield event
+        return
+    # the events are pulled in a task of their own, so the flush timer keeps running
+    # while the graph waits on a provider or a tool
+    queue: asyncio.Queue[StreamEvent | BaseException | None] = asyncio.Queue(maxsize=1)
+
+    async def produce() -> None:
+        try:
+            async for event in events:
+                await queue.put(event)
+        except Exception as e:
+            await queue.put(e)
+            return
+        await queue.put(None)
+
+    loop = asyncio.get_running_loop()
+    producer = asyncio.create_task(produce())
+    parts: list[str] = []
+    size = 0
+    sent = float("-inf")
+    try:
+        while True:
+            timeout = sent + window - loop.time() if parts else None
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout)
+            except TimeoutError:
+                yield "token", "".join(parts)
+                parts.clear()
+                size = 0
+                sent = loop.time()
+                continue
+            if item is None:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            kind, payload = item
+            if kind == "token":
+                parts.append(payload)
+                size += len(payload)
+                if size < max_chars and loop.time() < sent + window:
+                    continue
+            if parts:
+                yield "token", "".join(parts)
+                parts.clear()
+                size = 0
+                sent = loop.time()
+            if kind != "token":
+                yield kind, payload
+        if parts:
+            yield "token", "".join(parts)
+    finally:
+        producer.cancel()
+        await asyncio.gather(producer, return_exceptions=True)
+
+
+class ClientDisconnected(Exception):
+    """the client went away before the stream finished."""
+
+
+async def cancel_on_disconnect(
+    events: AsyncGenerator[StreamEvent, None],
+    is_disconnected: Callable[[], Awaitable[bool]],
+    poll_interval: float,
+) -> AsyncGenerator[StreamEvent, None]:
+    """pulls `events` in a task of its own that is cancelled as soon as the client goes away.
+
+    cancelling that task cancels the graph run at whatever it is awaiting, so
+    in-flight provider requests are closed and no further nodes (or checkpoint
+    writes) run. the same happens when the consumer stops early, e.g. when the
+    server cancels the response. raises ClientDisconnected when the disconnect
+    was noticed by polling `is_disconnected`.
+    """
+    # one event in flight keeps the graph from running ahead of the client
+    queue: asyncio.Queue[StreamEvent | BaseException | None] = asyncio.Queue(maxsize=1)
+
+    async def produce() -> None:
+        try:
+            # closes the stream even when cancelled while waiting on the queue
+            async with aclosing(events):
+                async for event in events:
+                    await queue.put(event)
+        except Exception as e:
+            await queue.put(e)
+            return
+        await queue.put(None)
+
+    async def watch() -> None:
+        while not await is_disconnected():
+            await asyncio.sleep(poll_interval)
+
+    producer = asyncio.create_task(produce())
+    watcher = asyncio.create_task(watch())
+    get: asyncio.Future | None = None
+    try:
+        while True:
+            get = asyncio.ensure_future(queue.get())
+            await asyncio.wait((get, watcher), return_when=asyncio.FIRST_COMPLETED)
+            if not get.done():
+                raise ClientDisconnected()
+            item = get.result()
+            if item is None:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        pending = [t for t in (get, producer, watcher) if t is not None]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+class FrameEncoder:
+    """encodes stream events as the json objects AgentClient parses, one per frame."""
+
+    _PREFIX = b""
+    _SUFFIX = b"}"
+
+    def __init__(self) -> None:
+        self._token_prefix = self._PREFIX + b'{"type":"token","content":'
+        self._message_prefix = self._PREFIX + b'{"type":"message","content":'
+        self._error_prefix = self._PREFIX + b'{"type":"error","content":'
+
+    def token(self, content: str) -> bytes:
+        return self._token_prefix + orjson.dumps(content) + self._SUFFIX
+
+    def message(self, message: ChatMessage) -> bytes:
+        # pydantic serializes straight to json without building an intermediate dict
+        return self._message_prefix + message.model_dump_json().encode() + self._SUFFIX
+
+    def error(self, content: str) -> bytes:
+        return self._error_prefix + orjson.dumps(content) + self._SUFFIX
+
+    def encode(self, event: StreamEvent) -> bytes:
+        kind, payload = event
+        match kind:
+            case "token":
+                return self.token(payload)
+            case "message":
+                return self.message(payload)
+            case _:
+                return self.error(payload)
+
+
+class SSEEncoder(FrameEncoder):
+    """encodes stream events as server-sent event frames."""
+
+    _PREFIX = b"data: "
+    _SUFFIX = b"}\n\n"
+    DONE = b"data: [DONE]\n\n"
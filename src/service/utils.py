@@ -64,6 +64,16 @@ def langchain_to_chat_message(message: BaseMessage) -> ChatMessage:
             raise ValueError(f"Unsupported message type: {message.__class__.__name__}")
 
 
+def compact_chat_message(message: ChatMessage) -> ChatMessage:
+    """Strip tool payloads from a message, keeping its type and position in the thread."""
+    update: dict = {"response_metadata": {}}
+    if message.type == "tool":
+        update["content"] = ""
+    if message.tool_calls:
+        update["tool_calls"] = [{**tool_call, "args": {}} for tool_call in message.tool_calls]
+    return message.model_copy(update=update)
+
+
 def remove_tool_calls(content: str | list[str | dict]) -> str | list[str | dict]:
     """Remove tool calls from content."""
     if isinstance(content, str):
@@ -0,0 +1,49 @@
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+from pathlib import Path
+
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.graph import END, START, MessagesState, StateGraph
+
+SRC = Path(__file__).resolve().parent.parent / "src"
+
+
+def _write_thread(db: Path, thread_id: str) -> None:
+    graph = StateGraph(MessagesState)
+    graph.add_node("echo", lambda state: {"messages": []})
+    graph.add_edge(START, "echo")
+    graph.add_edge("echo", END)
+    conn = sqlite3.connect(db, check_same_thread=False)
+    try:
+        graph.compile(checkpointer=SqliteSaver(conn)).invoke(
+            {"messages": [HumanMessage(content=f"hello from {thread_id}")]},
+            {"configurable": {"thread_id": thread_id}},
+        )
+    finally:
+        conn.close()
+
+
+def test_export_reads_every_worker_file(tmp_path: Path) -> None:
+    # with WORKERS=2 the threads live in checkpoints.w0.db and checkpoints.w1.db only
+    _write_thread(tmp_path / "checkpoints.w0.db", "thread-a")
+    _write_thread(tmp_path / "checkpoints.w1.db", "thread-b")
+    env = {
+        **os.environ,
+        "PYTHONPATH": str(SRC),
+        "USE_FAKE_MODEL": "true",
+        "WORKERS": "2",
+        "CHECKPOINT_SHARDS": "1",
+        "CHECKPOINT_DB": str(tmp_path / "checkpoints.db"),
+    }
+    result = subprocess.run(
+        [sys.executable, str(SRC / "run_export.py"), "--format", "ndjson"],
+        env=env,
+        capture_output=True,
+        check=True,
+    )
+    records = [json.loads(line) for line in result.stdout.splitlines()]
+    assert [record["thread_id"] for record in records] == ["thread-a", "thread-b"]